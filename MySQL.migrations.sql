@@ -0,0 +1,106 @@
+-- 既有資料庫的增量 schema 變更（新安裝直接匯入 MySQL.session.sql 即可）
+-- 依序執行尚未套用的區段：mysql -u myuser -p mydb < MySQL.migrations.sql
+
+-- ==================== 全文檢索（ngram） ====================
+-- 需先在伺服器設定 innodb_ft_enable_stopword = OFF（見 MySQL.session.sql 開頭說明）
+ALTER TABLE `MOVIE` ADD FULLTEXT KEY `ft_movie_title` (`title`) WITH PARSER ngram;
+ALTER TABLE `ACTOR` ADD FULLTEXT KEY `ft_actor_name` (`name`) WITH PARSER ngram;
+
+-- ==================== keyset 分頁 ====================
+ALTER TABLE `MOVIE` ADD INDEX `idx_movie_created` (`created_at`, `movie_id`);
+ALTER TABLE `ACTOR` ADD INDEX `idx_actor_name` (`name`, `actor_id`);
+
+-- ==================== 評論彙總 ====================
+CREATE TABLE `REVIEW_AGGREGATE` (
+    `target_type` ENUM('MOVIE','ACTOR','MOVIE_CAST','DIRECTOR') NOT NULL,
+    `target_id` INT UNSIGNED NOT NULL,
+    `review_count` INT UNSIGNED NOT NULL DEFAULT 0,
+    `rating_sum` DECIMAL(12,1) NOT NULL DEFAULT 0,
+    `rating_avg` DECIMAL(4,2) AS (IF(`review_count` = 0, NULL, `rating_sum` / `review_count`)) STORED,
+    `b1` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b2` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b3` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b4` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b5` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b6` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b7` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b8` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b9` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b10` INT UNSIGNED NOT NULL DEFAULT 0,
+    `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (`target_type`,`target_id`),
+    INDEX `idx_review_agg_avg` (`target_type`,`rating_avg`,`review_count`),
+    CONSTRAINT `fk_review_agg_entity` FOREIGN KEY (`target_type`,`target_id`) REFERENCES `ENTITY` (`entity_type`,`entity_id`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 以現有評論回填（之後由 add_review 增量維護；資料不一致時可重跑此段）
+INSERT INTO `REVIEW_AGGREGATE` (`target_type`, `target_id`, `review_count`, `rating_sum`, `b1`, `b2`, `b3`, `b4`, `b5`, `b6`, `b7`, `b8`, `b9`, `b10`)
+SELECT `target_type`, `target_id`, COUNT(*), SUM(`rating`),
+    SUM(LEAST(10, GREATEST(1, CEIL(`rating`))) = 1),
+    SUM(LEAST(10, GREATEST(1, CEIL(`rating`))) = 2),
+    SUM(LEAST(10, GREATEST(1, CEIL(`rating`))) = 3),
+    SUM(LEAST(10, GREATEST(1, CEIL(`rating`))) = 4),
+    SUM(LEAST(10, GREATEST(1, CEIL(`rating`))) = 5),
+    SUM(LEAST(10, GREATEST(1, CEIL(`rating`))) = 6),
+    SUM(LEAST(10, GREATEST(1, CEIL(`rating`))) = 7),
+    SUM(LEAST(10, GREATEST(1, CEIL(`rating`))) = 8),
+    SUM(LEAST(10, GREATEST(1, CEIL(`rating`))) = 9),
+    SUM(LEAST(10, GREATEST(1, CEIL(`rating`))) = 10)
+FROM `REVIEW`
+GROUP BY `target_type`, `target_id`
+ON DUPLICATE KEY UPDATE
+    `review_count` = VALUES(`review_count`),
+    `rating_sum` = VALUES(`rating_sum`),
+    `b1` = VALUES(`b1`),
+    `b2` = VALUES(`b2`),
+    `b3` = VALUES(`b3`),
+    `b4` = VALUES(`b4`),
+    `b5` = VALUES(`b5`),
+    `b6` = VALUES(`b6`),
+    `b7` = VALUES(`b7`),
+    `b8` = VALUES(`b8`),
+    `b9` = VALUES(`b9`),
+    `b10` = VALUES(`b10`);
+
+-- ==================== 條件式 GET（Last-Modified） ====================
+ALTER TABLE `MOVIE` ADD COLUMN `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP AFTER `created_at`;
+
+-- ==================== 大量匯入（可略過 ENTITY 觸發器） ====================
+DROP TRIGGER IF EXISTS `trg_movie_after_insert`;
+CREATE TRIGGER `trg_movie_after_insert` AFTER INSERT ON `MOVIE` FOR EACH ROW
+    INSERT IGNORE INTO `ENTITY` (`entity_type`,`entity_id`) SELECT 'MOVIE', NEW.movie_id FROM DUAL WHERE @skip_entity_triggers IS NULL;
+DROP TRIGGER IF EXISTS `trg_actor_after_insert`;
+CREATE TRIGGER `trg_actor_after_insert` AFTER INSERT ON `ACTOR` FOR EACH ROW
+    INSERT IGNORE INTO `ENTITY` (`entity_type`,`entity_id`) SELECT 'ACTOR', NEW.actor_id FROM DUAL WHERE @skip_entity_triggers IS NULL;
+DROP TRIGGER IF EXISTS `trg_cast_after_insert`;
+CREATE TRIGGER `trg_cast_after_insert` AFTER INSERT ON `MOVIE_CAST` FOR EACH ROW
+    INSERT IGNORE INTO `ENTITY` (`entity_type`,`entity_id`) SELECT 'MOVIE_CAST', NEW.cast_id FROM DUAL WHERE @skip_entity_triggers IS NULL;
+DROP TRIGGER IF EXISTS `trg_director_after_insert`;
+CREATE TRIGGER `trg_director_after_insert` AFTER INSERT ON `DIRECTOR` FOR EACH ROW
+    INSERT IGNORE INTO `ENTITY` (`entity_type`,`entity_id`) SELECT 'DIRECTOR', NEW.director_id FROM DUAL WHERE @skip_entity_triggers IS NULL;
+
+-- ==================== 演員作品清單差集同步 ====================
+-- 演員作品清單上次完整同步時的 movie_credits 摘要，相同時 fetch_actor_movies 不做任何寫入
+CREATE TABLE `ACTOR_FILMOGRAPHY` (
+    `actor_id` INT UNSIGNED NOT NULL PRIMARY KEY,
+    `fingerprint` CHAR(32) NOT NULL,
+    `synced_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    CONSTRAINT `fk_filmography_actor` FOREIGN KEY (`actor_id`) REFERENCES `ACTOR` (`actor_id`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ==================== TMDB 變更同步 ====================
+-- last_fetched_at：上次向 TMDB 抓取詳細資料的時間（ACTOR.updated_at 仍為作品清單的抓取時間）
+-- tmdb_changed_at：TMDB changes 回報有變更、尚未重新抓取時的標記時間
+ALTER TABLE `MOVIE`
+    ADD COLUMN `last_fetched_at` TIMESTAMP NULL DEFAULT NULL AFTER `updated_at`,
+    ADD COLUMN `tmdb_changed_at` TIMESTAMP NULL DEFAULT NULL AFTER `last_fetched_at`,
+    ADD INDEX `idx_movie_changed` (`tmdb_changed_at`);
+ALTER TABLE `ACTOR`
+    ADD COLUMN `last_fetched_at` TIMESTAMP NULL DEFAULT NULL AFTER `updated_at`,
+    ADD COLUMN `tmdb_changed_at` TIMESTAMP NULL DEFAULT NULL AFTER `last_fetched_at`,
+    ADD INDEX `idx_actor_changed` (`tmdb_changed_at`);
+-- 已有詳細資料的列視為在最後更新時抓取（依原本 check_movie_detail / check_actor_update 的判斷）
+UPDATE `MOVIE` SET `last_fetched_at` = `updated_at`, `updated_at` = `updated_at`
+WHERE `runtime` IS NOT NULL OR `poster_url` IS NULL;
+UPDATE `ACTOR` SET `last_fetched_at` = COALESCE(`updated_at`, `created_at`)
+WHERE `updated_at` IS NOT NULL OR `birthdate` IS NOT NULL OR `profile_url` IS NULL;
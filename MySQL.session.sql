@@ -1,5 +1,10 @@
 -- SET GLOBAL log_bin_trust_function_creators = 1;
+-- 全文檢索使用 ngram parser（支援中文），伺服器需設定：
+--   ngram_token_size = 2（預設值）
+--   innodb_ft_enable_stopword = OFF（否則含停用字元的 ngram 會被排除，英文標題幾乎查不到）
 
+DROP TABLE IF EXISTS `ACTOR_FILMOGRAPHY`;
+DROP TABLE IF EXISTS `REVIEW_AGGREGATE`;
 DROP TABLE IF EXISTS `REVIEW`;
 DROP TABLE IF EXISTS `ENTITY`;
 DROP TABLE IF EXISTS `DIRECTOR`;
@@ -18,8 +23,14 @@ CREATE TABLE `MOVIE` (
     `rating` DECIMAL(3,1) DEFAULT NULL,
     `poster_url` VARCHAR(255) DEFAULT NULL,
     `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    `last_fetched_at` TIMESTAMP NULL DEFAULT NULL,
+    `tmdb_changed_at` TIMESTAMP NULL DEFAULT NULL,
     `tmdb_id` INT UNSIGNED DEFAULT NULL,
-    UNIQUE KEY `uq_tmdb` (`tmdb_id`)
+    UNIQUE KEY `uq_tmdb` (`tmdb_id`),
+    INDEX `idx_movie_created` (`created_at`, `movie_id`),
+    INDEX `idx_movie_changed` (`tmdb_changed_at`),
+    FULLTEXT KEY `ft_movie_title` (`title`) WITH PARSER ngram
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 CREATE TABLE `ACTOR` (
@@ -30,8 +41,13 @@ CREATE TABLE `ACTOR` (
     `country` VARCHAR(100) DEFAULT NULL,
     `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     `updated_at` TIMESTAMP NULL DEFAULT NULL,
+    `last_fetched_at` TIMESTAMP NULL DEFAULT NULL,
+    `tmdb_changed_at` TIMESTAMP NULL DEFAULT NULL,
     `tmdb_id` INT UNSIGNED DEFAULT NULL,
-    UNIQUE KEY `uq_tmdb` (`tmdb_id`)
+    UNIQUE KEY `uq_tmdb` (`tmdb_id`),
+    INDEX `idx_actor_name` (`name`, `actor_id`),
+    INDEX `idx_actor_changed` (`tmdb_changed_at`),
+    FULLTEXT KEY `ft_actor_name` (`name`) WITH PARSER ngram
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 CREATE TABLE `USER` (
@@ -78,26 +94,27 @@ CREATE TABLE `ENTITY` (
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- keep ENTITY in sync with base tables
+-- 大量匯入時設定 SET @skip_entity_triggers = 1 略過新增觸發器，匯入後再一次回填 ENTITY（見 import_tmdb_dump.py）
 CREATE TRIGGER `trg_movie_after_insert` AFTER INSERT ON `MOVIE` FOR EACH ROW
-    INSERT IGNORE INTO `ENTITY` (`entity_type`,`entity_id`) VALUES ('MOVIE', NEW.movie_id);
+    INSERT IGNORE INTO `ENTITY` (`entity_type`,`entity_id`) SELECT 'MOVIE', NEW.movie_id FROM DUAL WHERE @skip_entity_triggers IS NULL;
 
 CREATE TRIGGER `trg_movie_after_delete` AFTER DELETE ON `MOVIE` FOR EACH ROW
     DELETE FROM `ENTITY` WHERE `entity_type`='MOVIE' AND `entity_id`=OLD.movie_id;
 
 CREATE TRIGGER `trg_actor_after_insert` AFTER INSERT ON `ACTOR` FOR EACH ROW
-    INSERT IGNORE INTO `ENTITY` (`entity_type`,`entity_id`) VALUES ('ACTOR', NEW.actor_id);
+    INSERT IGNORE INTO `ENTITY` (`entity_type`,`entity_id`) SELECT 'ACTOR', NEW.actor_id FROM DUAL WHERE @skip_entity_triggers IS NULL;
 
 CREATE TRIGGER `trg_actor_after_delete` AFTER DELETE ON `ACTOR` FOR EACH ROW
     DELETE FROM `ENTITY` WHERE `entity_type`='ACTOR' AND `entity_id`=OLD.actor_id;
 
 CREATE TRIGGER `trg_cast_after_insert` AFTER INSERT ON `MOVIE_CAST` FOR EACH ROW
-    INSERT IGNORE INTO `ENTITY` (`entity_type`,`entity_id`) VALUES ('MOVIE_CAST', NEW.cast_id);
+    INSERT IGNORE INTO `ENTITY` (`entity_type`,`entity_id`) SELECT 'MOVIE_CAST', NEW.cast_id FROM DUAL WHERE @skip_entity_triggers IS NULL;
 
 CREATE TRIGGER `trg_cast_after_delete` AFTER DELETE ON `MOVIE_CAST` FOR EACH ROW
     DELETE FROM `ENTITY` WHERE `entity_type`='MOVIE_CAST' AND `entity_id`=OLD.cast_id;
 
 CREATE TRIGGER `trg_director_after_insert` AFTER INSERT ON `DIRECTOR` FOR EACH ROW
-    INSERT IGNORE INTO `ENTITY` (`entity_type`,`entity_id`) VALUES ('DIRECTOR', NEW.director_id);
+    INSERT IGNORE INTO `ENTITY` (`entity_type`,`entity_id`) SELECT 'DIRECTOR', NEW.director_id FROM DUAL WHERE @skip_entity_triggers IS NULL;
 
 CREATE TRIGGER `trg_director_after_delete` AFTER DELETE ON `DIRECTOR` FOR EACH ROW
     DELETE FROM `ENTITY` WHERE `entity_type`='DIRECTOR' AND `entity_id`=OLD.director_id;
@@ -119,3 +136,35 @@ CREATE TABLE `REVIEW` (
     CONSTRAINT `fk_review_user` FOREIGN KEY (`user_id`) REFERENCES `USER` (`user_id`) ON DELETE CASCADE ON UPDATE CASCADE,
     CONSTRAINT `fk_review_entity` FOREIGN KEY (`target_type`,`target_id`) REFERENCES `ENTITY` (`entity_type`,`entity_id`) ON DELETE CASCADE ON UPDATE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 每個評論對象的評分彙總，由 add_review 在同一交易內增量維護（避免排序、顯示時掃描 REVIEW）
+-- b1..b10 為評分分布：b1 = [0,1]，bN = (N-1,N]
+CREATE TABLE `REVIEW_AGGREGATE` (
+    `target_type` ENUM('MOVIE','ACTOR','MOVIE_CAST','DIRECTOR') NOT NULL,
+    `target_id` INT UNSIGNED NOT NULL,
+    `review_count` INT UNSIGNED NOT NULL DEFAULT 0,
+    `rating_sum` DECIMAL(12,1) NOT NULL DEFAULT 0,
+    `rating_avg` DECIMAL(4,2) AS (IF(`review_count` = 0, NULL, `rating_sum` / `review_count`)) STORED,
+    `b1` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b2` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b3` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b4` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b5` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b6` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b7` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b8` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b9` INT UNSIGNED NOT NULL DEFAULT 0,
+    `b10` INT UNSIGNED NOT NULL DEFAULT 0,
+    `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (`target_type`,`target_id`),
+    INDEX `idx_review_agg_avg` (`target_type`,`rating_avg`,`review_count`),
+    CONSTRAINT `fk_review_agg_entity` FOREIGN KEY (`target_type`,`target_id`) REFERENCES `ENTITY` (`entity_type`,`entity_id`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- 演員作品清單上次完整同步時的 movie_credits 摘要，相同時 fetch_actor_movies 不做任何寫入
+CREATE TABLE `ACTOR_FILMOGRAPHY` (
+    `actor_id` INT UNSIGNED NOT NULL PRIMARY KEY,
+    `fingerprint` CHAR(32) NOT NULL,
+    `synced_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    CONSTRAINT `fk_filmography_actor` FOREIGN KEY (`actor_id`) REFERENCES `ACTOR` (`actor_id`) ON DELETE CASCADE ON UPDATE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+批次寫入效能比較：store_movie 逐筆迴圈 vs. store_movies 批次
+- 以合成的 TMDB 電影資料（含演員、導演）寫入本機 MySQL，比較耗時與往返次數。
+- 往返次數以 MySQL 全域狀態 Questions 的增量估算，請在沒有其他連線的本機資料庫上執行。
+- 合成資料使用 --base-id 之後的 tmdb_id，結束時會刪除。
+
+使用範例：
+    python benchmarks/bench_bulk_store.py --movies 40 --cast 15 --rounds 5
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+def make_payloads(count, cast_size, base_id, round_no):
+    """產生 count 部電影，演員在電影之間部分重疊（與真實搜尋頁相似）"""
+    start = base_id + round_no * count
+    actor_base = base_id + round_no * count * cast_size
+    payloads = []
+    for i in range(count):
+        cast = [
+            {
+                "id": actor_base + (i * cast_size // 2) + j,
+                "name": f"Bench Actor {i}-{j}",
+                "profile_path": f"/bench{j}.jpg",
+                "character": f"Role {j}",
+                "order": j,
+            }
+            for j in range(cast_size)
+        ]
+        crew = [{"id": actor_base + i, "name": f"Bench Director {i}", "job": "Director"}]
+        payloads.append((start + i, {
+            "title": f"Bench Movie {start + i}",
+            "release_date": "2020-01-01",
+            "runtime": 100,
+            "overview": "benchmark",
+            "vote_average": 7.5,
+            "poster_path": "/bench.jpg",
+            "genres": [{"name": "Drama"}],
+            "credits": {"cast": cast, "crew": crew},
+        }))
+    return payloads
+
+
+def questions():
+    conn = database.connect_db()
+    cur = conn.cursor()
+    try:
+        cur.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+        return int(cur.fetchone()[1])
+    finally:
+        cur.close()
+        conn.close()
+
+
+def cleanup(base_id):
+    conn = database.connect_db()
+    cur = conn.cursor()
+    try:
+        cur.execute("DELETE FROM MOVIE WHERE tmdb_id >= %s", (base_id,))
+        cur.execute("DELETE FROM ACTOR WHERE tmdb_id >= %s", (base_id,))
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+
+def run_loop(payloads):
+    for tmdb_id, data in payloads:
+        database.store_movie(tmdb_id, data)
+
+
+def run_bulk(payloads):
+    database.store_movies(payloads)
+
+
+def measure(name, fn, args):
+    results = []
+    for round_no in range(args.rounds):
+        payloads = make_payloads(args.movies, args.cast, args.base_id, round_no)
+        before = questions()
+        t0 = time.perf_counter()
+        fn(payloads)
+        elapsed = time.perf_counter() - t0
+        # 扣掉 questions() 本身的一次查詢
+        trips = questions() - before - 1
+        results.append((elapsed, trips))
+        cleanup(args.base_id)
+    times = [r[0] for r in results]
+    trips = [r[1] for r in results]
+    print(f"{name:<6} median {statistics.median(times) * 1000:8.1f} ms   "
+          f"min {min(times) * 1000:8.1f} ms   round trips {statistics.median(trips):.0f}")
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="store_movie 逐筆 vs. store_movies 批次")
+    parser.add_argument("--movies", type=int, default=40, help="每輪電影數（預設 40，約一頁搜尋結果）")
+    parser.add_argument("--cast", type=int, default=15, help="每部電影的演員數")
+    parser.add_argument("--rounds", type=int, default=5, help="重複次數")
+    parser.add_argument("--base-id", type=int, default=900_000_000, help="合成資料的起始 tmdb_id")
+    args = parser.parse_args()
+
+    database.init_db_pool()
+    cleanup(args.base_id)
+    print(f"{args.movies} movies x {args.cast} cast, {args.rounds} rounds")
+    loop = measure("loop", run_loop, args)
+    bulk = measure("bulk", run_bulk, args)
+    print(f"speedup x{loop / bulk:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+端到端負載測試：以本機 TMDB 模擬伺服器與本機 MySQL 驅動 movie_backend
+- 情境：search（/api/search/all）、trending（/api/trending/all）、detail_cold（尚未抓取詳細資料的
+  /movies/<id>）、detail_warm（已快取的 /movies/<id>）、actor_refresh（作品清單過期的 /actors/<id>）、
+  review_write（POST /reviews/add）。
+- 每個情境回報吞吐量、p50/p95/p99 延遲、錯誤數（非 2xx 回應）與每個請求的資料庫往返次數。
+  任何情境有錯誤時列出各狀態碼的數量並以非零狀態結束（--allow-errors 可略過），避免把錯誤回應的延遲當成結果。
+  往返次數以 MySQL 全域狀態 Questions 的增量估算，請在沒有其他連線的本機資料庫上執行。
+- 預設在同一個程序內以 Flask test client 發送請求；--target 可改打已啟動的伺服器（例如 gunicorn），
+  此時伺服器需設定 TMDB_BASE_URL 指向 --tmdb-port 的模擬伺服器。
+- 合成資料的 tmdb_id 從 fake_tmdb.CANNED_ID_BASE 開始，執行前後都會刪除（--keep-data 保留結束時的資料）。
+- --save 將結果存成 JSON，--baseline 與先前存下的結果比較。
+
+使用範例：
+    python benchmarks/bench_load.py --threads 8 --requests 300 --latency-ms 80 --save baseline.json
+    python benchmarks/bench_load.py --threads 8 --requests 300 --latency-ms 80 --baseline baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+import threading
+import subprocess
+from collections import Counter
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_tmdb import FakeTMDBServer, CANNED_ID_BASE, CANNED_PERSON_OFFSET  # noqa: E402
+
+SCENARIOS = ("search", "trending", "detail_cold", "detail_warm", "actor_refresh", "review_write")
+BENCH_EMAIL = "bench-load@example.invalid"
+BENCH_PASSWORD = "bench-load"
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+# ==================== 資料庫 ====================
+
+def questions(database):
+    with database.connect_db() as conn:
+        cur = conn.cursor()
+        cur.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+        return int(cur.fetchone()[1])
+
+
+def query_ids(database, sql, params=()):
+    with database.connect_db() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        return [row[0] for row in cur.fetchall()]
+
+
+def execute(database, sql, params=()):
+    with database.connect_db() as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        return cur.rowcount
+
+
+def cleanup(database):
+    """刪除合成資料（MOVIE_CAST、DIRECTOR、ENTITY、REVIEW 隨外鍵與觸發器一併刪除）"""
+    people_base = CANNED_ID_BASE + CANNED_PERSON_OFFSET
+    movies = execute(database, "DELETE FROM MOVIE WHERE tmdb_id >= %s AND tmdb_id < %s", (CANNED_ID_BASE, people_base))
+    actors = execute(database, "DELETE FROM ACTOR WHERE tmdb_id >= %s AND tmdb_id < %s",
+                     (people_base, people_base + CANNED_PERSON_OFFSET))
+    execute(database, "DELETE FROM USER WHERE email = %s", (BENCH_EMAIL,))
+    return movies, actors
+
+
+# ==================== 用戶端 ====================
+
+class InProcessClient:
+    """以 Flask test client 在同一個程序內發送請求"""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self._client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HTTPClient:
+    """對已啟動的伺服器發送請求"""
+
+    def __init__(self, base_url):
+        import requests
+        self._session = requests.Session()
+        self._base_url = base_url.rstrip("/")
+
+    def request(self, method, path, body=None, headers=None):
+        response = self._session.request(method, self._base_url + path, json=body, headers=headers, timeout=60)
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+
+
+# ==================== 情境 ====================
+
+def login(client):
+    """註冊（若已存在則略過）並登入壓測用帳號，回傳 Authorization 標頭"""
+    client.request("POST", "/auth/register", {"username": "bench", "email": BENCH_EMAIL, "password": BENCH_PASSWORD})
+    status, body = client.request("POST", "/auth/login", {"email": BENCH_EMAIL, "password": BENCH_PASSWORD})
+    token = (body or {}).get("token")
+    if status != 200 or not token:
+        raise RuntimeError(f"Login failed ({status}): {body}")
+    return {"Authorization": f"Bearer {token}"}
+
+
+def bench_movie_ids(database, detailed=None, limit=None):
+    sql = "SELECT movie_id FROM MOVIE WHERE tmdb_id >= %s AND tmdb_id < %s"
+    if detailed is False:
+        sql += " AND runtime IS NULL"
+    elif detailed is True:
+        sql += " AND runtime IS NOT NULL"
+    sql += " ORDER BY movie_id"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    return query_ids(database, sql, (CANNED_ID_BASE, CANNED_ID_BASE + CANNED_PERSON_OFFSET))
+
+
+def build_scenario(name, database, client, args, state):
+    """回傳 (請求產生函數, 請求數)；請求產生函數以序號 i 產生 (method, path, body, headers)"""
+    n = args.requests
+    if name == "search":
+        queries = [f"bench {i}" for i in range(args.distinct_queries)]
+        return (lambda i: ("GET", f"/api/search/all?{urlencode({'query': queries[i % len(queries)]})}", None, None)), n
+    if name == "trending":
+        return (lambda i: ("GET", "/api/trending/all", None, None)), n
+    if name == "detail_cold":
+        # 搜尋與排行榜只寫入基本資料（runtime 為空），第一次開啟詳細頁才會抓取 TMDB
+        ids = bench_movie_ids(database, detailed=False, limit=n)
+        state["detail_ids"] = ids
+        return (lambda i: ("GET", f"/movies/{ids[i]}", None, None)), len(ids)
+    if name == "detail_warm":
+        ids = state.get("detail_ids") or bench_movie_ids(database, detailed=True, limit=100)
+        return (lambda i: ("GET", f"/movies/{ids[i % len(ids)]}", None, None)), (n if ids else 0)
+    if name == "actor_refresh":
+        people_base = CANNED_ID_BASE + CANNED_PERSON_OFFSET
+        ids = query_ids(database, "SELECT actor_id FROM ACTOR WHERE tmdb_id >= %s AND tmdb_id < %s ORDER BY actor_id LIMIT %s",
+                        (people_base, people_base + CANNED_PERSON_OFFSET, n))
+        # 詳細資料已齊全、作品清單超過一天：只需要更新作品清單
+        if ids:
+            placeholders = ",".join(["%s"] * len(ids))
+            execute(database, f"UPDATE ACTOR SET birthdate = COALESCE(birthdate, '1970-01-01'), "
+                              f"last_fetched_at = NOW(), tmdb_changed_at = NULL, "
+                              f"updated_at = NOW() - INTERVAL 2 DAY WHERE actor_id IN ({placeholders})", ids)
+        return (lambda i: ("GET", f"/actors/{ids[i]}", None, None)), len(ids)
+    if name == "review_write":
+        headers = state.setdefault("auth", login(client))
+        ids = state.get("detail_ids") or bench_movie_ids(database, limit=100)
+        rng = random.Random(0)
+        return (lambda i: ("POST", "/reviews/add", {
+            "target_type": "MOVIE", "target_id": ids[i % len(ids)], "rating": rng.randint(1, 10),
+            "title": f"bench {i}", "body": "benchmark review",
+        }, headers)), (n if ids else 0)
+    raise ValueError(f"Unknown scenario {name}")
+
+
+def wait_for_background(backend, timeout=60):
+    """等待背景更新（stale-while-revalidate）與背景寫入佇列清空，回傳等待秒數"""
+    if backend is None:
+        return 0.0
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if backend._inflight.in_flight() == 0 and backend._ingest.stats()["depth"] == 0:
+            break
+        time.sleep(0.05)
+    return time.monotonic() - start
+
+
+def run_scenario(name, make_request, count, clients, database, backend):
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    counter = itertools.count()
+
+    def worker(client):
+        while True:
+            i = next(counter)
+            if i >= count:
+                return
+            method, path, body, headers = make_request(i)
+            t0 = time.perf_counter()
+            try:
+                status, _ = client.request(method, path, body, headers)
+            except Exception:
+                status = 599
+            elapsed = time.perf_counter() - t0
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+
+    q0 = questions(database)
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    drain = wait_for_background(backend)
+    # 扣掉 Questions 查詢本身
+    round_trips = questions(database) - q0 - 1
+
+    return {
+        "requests": len(latencies),
+        "errors": sum(n for status, n in statuses.items() if not 200 <= status < 300),
+        "statuses": {str(status): n for status, n in sorted(statuses.items())},
+        "seconds": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "db_round_trips_per_request": round_trips / len(latencies) if latencies else 0.0,
+        "background_drain_seconds": drain,
+    }
+
+
+# ==================== 報表 ====================
+
+def print_results(results):
+    print(f"{'scenario':<14}{'reqs':>6}{'err':>5}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'db rt/req':>11}{'bg s':>7}")
+    for name, r in results.items():
+        print(f"{name:<14}{r['requests']:>6}{r['errors']:>5}{r['throughput']:>9.1f}{r['p50_ms']:>9.1f}"
+              f"{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['db_round_trips_per_request']:>11.2f}"
+              f"{r['background_drain_seconds']:>7.2f}")
+
+
+def compare(results, baseline):
+    """與基準比較；延遲與往返次數下降、吞吐量上升為改善"""
+    print(f"\nvs baseline ({baseline['meta'].get('commit', '?')}, {baseline['meta'].get('timestamp', '?')}):")
+    print(f"{'scenario':<14}{'req/s':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'db rt/req':>12}")
+
+    def delta(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    for name, r in results.items():
+        b = baseline["scenarios"].get(name)
+        if not b:
+            print(f"{name:<14}{'(not in baseline)':>40}")
+            continue
+        print(f"{name:<14}{delta(r['throughput'], b['throughput']):>10}{delta(r['p50_ms'], b['p50_ms']):>10}"
+              f"{delta(r['p95_ms'], b['p95_ms']):>10}{delta(r['p99_ms'], b['p99_ms']):>10}"
+              f"{r['db_round_trips_per_request'] - b['db_round_trips_per_request']:>+12.2f}")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="movie_backend 端到端負載測試")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"以逗號分隔，可選 {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=200, help="每個情境的請求數")
+    parser.add_argument("--threads", type=int, default=8, help="同時發送請求的執行緒數")
+    parser.add_argument("--distinct-queries", type=int, default=40, help="search 情境使用的不同關鍵字數")
+    parser.add_argument("--latency-ms", type=float, default=80, help="模擬 TMDB 每個請求的延遲")
+    parser.add_argument("--tmdb-port", type=int, default=0, help="模擬 TMDB 的埠號（0 表示自動選擇）")
+    parser.add_argument("--target", help="改打已啟動的伺服器，例如 http://127.0.0.1:8000")
+    parser.add_argument("--save", help="將結果存成 JSON")
+    parser.add_argument("--baseline", help="與先前 --save 的結果比較")
+    parser.add_argument("--keep-data", action="store_true", help="結束時保留合成資料")
+    parser.add_argument("--allow-errors", action="store_true", help="有情境出現非 2xx 回應時仍以狀態 0 結束")
+    args = parser.parse_args()
+
+    names = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}")
+
+    server = FakeTMDBServer(("127.0.0.1", args.tmdb_port), args.latency_ms / 1000).start()
+    os.environ["TMDB_BASE_URL"] = server.base_url
+    os.environ.setdefault("TMDB_API_KEY", "bench")
+    print(f"Fake TMDB on {server.base_url}")
+
+    import database
+    database.init_db_pool()
+    removed = cleanup(database)
+    print(f"Removed leftover synthetic rows: {removed[0]} movies, {removed[1]} actors")
+
+    backend = None
+    if args.target:
+        clients = [HTTPClient(args.target) for _ in range(args.threads)]
+    else:
+        # 清除舊資料後才載入後端，known_ids 不會記得已刪除的 tmdb_id
+        import movie_backend as backend
+        clients = [InProcessClient(backend.app) for _ in range(args.threads)]
+
+    results = {}
+    state = {}
+    try:
+        for name in names:
+            make_request, count = build_scenario(name, database, clients[0], args, state)
+            if not count:
+                print(f"{name}: no data to run against, skipped (run search/trending first)")
+                continue
+            results[name] = run_scenario(name, make_request, count, clients, database, backend)
+            print(f"{name}: done ({results[name]['requests']} requests)")
+    finally:
+        if not args.keep_data:
+            cleanup(database)
+        server.shutdown()
+
+    print()
+    print_results(results)
+    print(f"TMDB requests served: {server.counts['requests']}")
+
+    meta = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": git_commit(),
+        "target": args.target or "in-process",
+        "threads": args.threads,
+        "requests": args.requests,
+        "latency_ms": args.latency_ms,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(results, json.load(f))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "scenarios": results}, f, indent=2)
+        print(f"Saved results to {args.save}")
+
+    failed = {name: r["statuses"] for name, r in results.items() if r["errors"]}
+    if failed:
+        print("\nScenarios with non-2xx responses (results are not comparable):")
+        for name, statuses in failed.items():
+            print(f"  {name}: {statuses}")
+        if not args.allow_errors:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+TMDB 限流驗證：對本機模擬伺服器同時送出互動與背景請求
+- 模擬伺服器每秒超過 --server-limit 個請求就回傳 429 + Retry-After。
+- 回報各通道的請求延遲分位數、伺服器實際回出的 429 次數與 tmdb_limiter 的統計。
+- 以 --client-rate 調整用戶端限流速率（設得比伺服器高即可觀察 Retry-After 的處理）。
+
+使用範例：
+    python benchmarks/bench_rate_limit.py --seconds 10 --client-rate 35 --server-limit 40
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_tmdb import FakeTMDBServer  # noqa: E402
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TMDB 限流與優先權通道驗證")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--interactive-threads", type=int, default=4)
+    parser.add_argument("--background-threads", type=int, default=8)
+    parser.add_argument("--client-rate", type=float, default=35, help="用戶端每秒請求上限")
+    parser.add_argument("--server-limit", type=int, default=40, help="模擬伺服器每秒請求上限")
+    parser.add_argument("--latency-ms", type=float, default=30)
+    args = parser.parse_args()
+
+    server = FakeTMDBServer(("127.0.0.1", 0), args.latency_ms / 1000, args.server_limit).start()
+    os.environ["TMDB_BASE_URL"] = server.base_url
+    os.environ.setdefault("TMDB_API_KEY", "bench")
+    os.environ["TMDB_RATE_LIMIT"] = str(args.client_rate)
+
+    from tmdb_api import fetch_tmdb_data
+    from rate_limit import tmdb_limiter, LANE_INTERACTIVE, LANE_BACKGROUND
+
+    latencies = {LANE_INTERACTIVE: [], LANE_BACKGROUND: []}
+    errors = {LANE_INTERACTIVE: 0, LANE_BACKGROUND: 0}
+    deadline = time.monotonic() + args.seconds
+
+    def worker(lane):
+        while time.monotonic() < deadline:
+            t0 = time.perf_counter()
+            try:
+                fetch_tmdb_data("/search/movie", {"query": "bench"}, lane=lane)
+                latencies[lane].append(time.perf_counter() - t0)
+            except Exception:
+                errors[lane] += 1
+            if lane == LANE_INTERACTIVE:
+                time.sleep(0.05)
+
+    threads = [threading.Thread(target=worker, args=(LANE_INTERACTIVE,)) for _ in range(args.interactive_threads)]
+    threads += [threading.Thread(target=worker, args=(LANE_BACKGROUND,)) for _ in range(args.background_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    server.shutdown()
+
+    for lane, values in latencies.items():
+        print(f"{lane:<12} requests {len(values):5d}  errors {errors[lane]:3d}  "
+              f"p50 {percentile(values, 0.5) * 1000:7.1f} ms  p95 {percentile(values, 0.95) * 1000:7.1f} ms  "
+              f"p99 {percentile(values, 0.99) * 1000:7.1f} ms")
+    print(f"server: {server.counts['requests']} requests, {server.counts['throttled']} answered 429")
+    print(f"limiter: {tmdb_limiter.stats()}")
+
+
+if __name__ == "__main__":
+    main()
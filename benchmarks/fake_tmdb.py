@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+本機 TMDB 模擬伺服器
+- 可設定每個請求的延遲，以及每秒請求上限（超過時回傳 429 與 Retry-After）。
+- 搭配 TMDB_BASE_URL=http://127.0.0.1:<port> 讓後端改連到這裡。
+- /search/*、/trending/*、/movie/now_playing、/movie/upcoming、/movie/{id}、/person/{id}、
+  /person/{id}/movie_credits 回傳固定的合成資料：同一個路徑與參數永遠得到相同內容。
+  tmdb_id 從 CANNED_ID_BASE 開始，不會與真實資料混在一起。
+- /movie/changes、/person/changes 依 start_date 回傳當天固定的 --changes 個變更 id（每頁 100 筆），
+  搭配 TMDB_CHANGES_INTERVAL 可測試 tmdb_changes 的標記與重新抓取。
+
+使用範例：
+    python benchmarks/fake_tmdb.py --port 8765 --latency-ms 80 --rate-limit 40
+"""
+
+import re
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+CANNED_ID_BASE = 15_000_000          # 電影 tmdb_id 起點（仍在 known_ids 的點陣圖範圍內）
+CANNED_PERSON_OFFSET = 500_000       # 人物 tmdb_id = CANNED_ID_BASE + CANNED_PERSON_OFFSET + n
+
+
+class FakeTMDBServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, rate_limit=0, retry_after=1, movies=2000, people=5000, changes=50):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.movies = movies
+        self.people = people
+        self.changes = changes
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self.counts = {"requests": 0, "throttled": 0}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def admit(self):
+        """固定一秒視窗計數；超過上限回傳 False"""
+        with self._lock:
+            self.counts["requests"] += 1
+            if not self.rate_limit:
+                return True
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+            if self._window_count > self.rate_limit:
+                self.counts["throttled"] += 1
+                return False
+            return True
+
+    def payload(self, path, query):
+        """回傳端點對應的合成資料；不支援的路徑回傳 None（404）"""
+        params = {k: v[0] for k, v in parse_qs(query).items()}
+        if path in ("/search/movie", "/search/person"):
+            rng = _rng(path, params.get("query", ""), params.get("page", "1"))
+            if path == "/search/movie":
+                return _page([self.movie_summary(n) for n in rng.sample(range(self.movies), 20)])
+            return _page([self.person_summary(n) for n in rng.sample(range(self.people), 20)])
+        if path.startswith("/trending/") or path in ("/movie/now_playing", "/movie/upcoming", "/movie/popular"):
+            rng = _rng(path, params.get("page", "1"))
+            return _page([self.movie_summary(n) for n in rng.sample(range(self.movies), 20)])
+        if path in ("/movie/changes", "/person/changes"):
+            return self.changed(path.split("/")[1], params.get("start_date", ""), int(params.get("page", "1")))
+        match = _DETAIL_PATH.match(path)
+        if not match:
+            return None
+        kind, tmdb_id, credits = match.group(1), int(match.group(2)), match.group(3)
+        if kind == "movie":
+            n = tmdb_id - CANNED_ID_BASE
+            if credits or not 0 <= n < self.movies:
+                return None
+            return self.movie_detail(n)
+        n = tmdb_id - CANNED_ID_BASE - CANNED_PERSON_OFFSET
+        if not 0 <= n < self.people:
+            return None
+        return self.person_credits(n) if credits else self.person_detail(n)
+
+    def movie_summary(self, n):
+        rng = _rng("movie", n)
+        return {
+            "id": CANNED_ID_BASE + n,
+            "title": f"Bench Movie {n}",
+            "original_title": f"Bench Movie {n}",
+            "release_date": f"{1980 + n % 45}-{1 + n % 12:02d}-{1 + n % 28:02d}",
+            "overview": f"Synthetic movie {n} for benchmarks.",
+            "vote_average": round(rng.uniform(3, 9), 1),
+            "poster_path": f"/bench_movie_{n}.jpg",
+            "genre_ids": [18, 28],
+        }
+
+    def movie_detail(self, n):
+        rng = _rng("credits", n)
+        cast = [
+            dict(self.person_summary(p), character=f"Role {i}", order=i)
+            for i, p in enumerate(rng.sample(range(self.people), 15))
+        ]
+        director = rng.randrange(self.people)
+        crew = [dict(self.person_summary(director), job="Director", department="Directing")]
+        return dict(
+            self.movie_summary(n),
+            runtime=90 + n % 60,
+            genres=[{"id": 18, "name": "劇情"}, {"id": 28, "name": "動作"}],
+            credits={"cast": cast, "crew": crew},
+        )
+
+    def person_summary(self, n):
+        return {
+            "id": CANNED_ID_BASE + CANNED_PERSON_OFFSET + n,
+            "name": f"Bench Person {n}",
+            "profile_path": f"/bench_person_{n}.jpg",
+            "known_for_department": "Acting",
+        }
+
+    def person_detail(self, n):
+        return dict(
+            self.person_summary(n),
+            birthday=f"{1940 + n % 60}-{1 + n % 12:02d}-{1 + n % 28:02d}",
+            place_of_birth="Taipei, Taiwan",
+            biography=f"Synthetic person {n} for benchmarks.",
+        )
+
+    def changed(self, kind, day, page):
+        """某一天有變更的 id（同一天永遠相同），每頁 100 筆"""
+        total = self.movies if kind == "movie" else self.people
+        base = CANNED_ID_BASE if kind == "movie" else CANNED_ID_BASE + CANNED_PERSON_OFFSET
+        ids = [base + n for n in _rng("changes", kind, day).sample(range(total), min(self.changes, total))]
+        pages = max(1, -(-len(ids) // 100))
+        results = [{"id": i, "adult": False} for i in ids[(page - 1) * 100:page * 100]]
+        return {"page": page, "results": results, "total_pages": pages, "total_results": len(ids)}
+
+    def person_credits(self, n):
+        rng = _rng("filmography", n)
+        movies = rng.sample(range(self.movies), 30)
+        cast = [dict(self.movie_summary(m), character=f"Role {i}", order=i) for i, m in enumerate(movies[:28])]
+        crew = [dict(self.movie_summary(m), job="Director", department="Directing") for m in movies[28:]]
+        return {"id": CANNED_ID_BASE + CANNED_PERSON_OFFSET + n, "cast": cast, "crew": crew}
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-tmdb", daemon=True).start()
+        return self
+
+
+_DETAIL_PATH = re.compile(r"^/(movie|person)/(\d+)(/movie_credits)?$")
+
+def _rng(*parts):
+    """依參數產生固定的亂數，讓相同請求得到相同資料"""
+    return random.Random(zlib.crc32("|".join(map(str, parts)).encode("utf-8")))
+
+def _page(results):
+    return {"page": 1, "results": results, "total_pages": 1, "total_results": len(results)}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if not server.admit():
+            self._send(429, {"status_code": 25, "status_message": "Request count over limit"},
+                       {"Retry-After": str(server.retry_after)})
+            return
+        parts = urlsplit(self.path)
+        body = server.payload(parts.path, parts.query)
+        if body is None:
+            self._send(404, {"status_code": 34, "status_message": "The resource could not be found."})
+            return
+        self._send(200, body)
+
+    def _send(self, status, body, headers=None):
+        raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json;charset=utf-8")
+        self.send_header("Content-Length", str(len(raw)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本機 TMDB 模擬伺服器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50, help="每個請求的延遲（毫秒）")
+    parser.add_argument("--rate-limit", type=int, default=0, help="每秒請求上限，0 表示不限")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 回應的 Retry-After 秒數")
+    parser.add_argument("--movies", type=int, default=2000, help="合成電影數量")
+    parser.add_argument("--people", type=int, default=5000, help="合成人物數量")
+    parser.add_argument("--changes", type=int, default=50, help="每天 /movie/changes、/person/changes 回傳的變更數量")
+    args = parser.parse_args()
+
+    server = FakeTMDBServer((args.host, args.port), args.latency_ms / 1000, args.rate_limit, args.retry_after,
+                            args.movies, args.people, args.changes)
+    print(f"Fake TMDB listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+# cache.py - 回應快取（LRU + TTL，容量上限，分段鎖；可選跨程序的 SQLite 後端）
+import os
+import json
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_STRIPES = int(os.getenv("CACHE_STRIPES", 8))
+CACHE_DEFAULT_TTL = int(os.getenv("CACHE_DEFAULT_TTL", 1800))
+# memory：程序內快取；sqlite：同一台機器上所有 worker 共用的磁碟快取
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+# 預設放在只有目前使用者可寫入的目錄；快取以 pickle 讀回，不能放在其他使用者可寫入的位置（例如 /tmp）
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "movie_backend", "response_cache.sqlite3",
+))
+
+# 各命名空間（key 中第一個 ':' 之前的字串）的存活秒數
+NAMESPACE_TTLS = {
+    "trending_all": int(os.getenv("CACHE_TTL_TRENDING", 1800)),
+    "search_all": int(os.getenv("CACHE_TTL_SEARCH", 600)),
+    "tmdb": int(os.getenv("CACHE_TTL_TMDB", 3600)),
+    "movie_detail": int(os.getenv("CACHE_TTL_DETAIL", 3600)),
+    "actor_detail": int(os.getenv("CACHE_TTL_DETAIL", 3600)),
+}
+
+def namespace_of(key):
+    """取得 key 所屬的命名空間"""
+    return key.split(":", 1)[0]
+
+def estimate_size(data):
+    """以 JSON 序列化長度估算資料佔用的位元組數（預先壓縮的位元組直接以長度計算）"""
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    if isinstance(data, dict) and any(isinstance(v, (bytes, bytearray)) for v in data.values()):
+        return sum(estimate_size(v) for v in data.values())
+    try:
+        return len(json.dumps(data, default=str, ensure_ascii=False).encode("utf-8"))
+    except (TypeError, ValueError):
+        return len(repr(data))
+
+class _Stripe:
+    """單一分段：自己的鎖、LRU 順序與計數器"""
+    __slots__ = ("lock", "entries", "bytes", "max_bytes", "hits", "misses", "evictions", "expirations")
+
+    def __init__(self, max_bytes):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expires_at, size, data)
+        self.bytes = 0
+        self.max_bytes = max_bytes
+        self.hits = {}
+        self.misses = {}
+        self.evictions = 0
+        self.expirations = 0
+
+class ResponseCache:
+    """有容量上限的 LRU + TTL 快取
+    - 以 key 的雜湊分段，每段各自持鎖，避免所有執行緒搶同一把鎖
+    - 每段的位元組預算為總預算 / 分段數，超出時淘汰最久未使用的項目
+    - 依命名空間套用不同 TTL
+    - 只在本程序內可見（shared 為 False）
+    """
+
+    shared = False
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, stripes=CACHE_STRIPES,
+                 ttls=None, default_ttl=CACHE_DEFAULT_TTL):
+        stripes = max(1, int(stripes))
+        self._stripes = [_Stripe(max(1, int(max_bytes) // stripes)) for _ in range(stripes)]
+        self._ttls = dict(NAMESPACE_TTLS if ttls is None else ttls)
+        self._default_ttl = default_ttl
+
+    def _stripe(self, key):
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def ttl_for(self, key):
+        return self._ttls.get(namespace_of(key), self._default_ttl)
+
+    def get(self, key):
+        ns = namespace_of(key)
+        stripe = self._stripe(key)
+        with stripe.lock:
+            item = stripe.entries.get(key)
+            if item is None:
+                stripe.misses[ns] = stripe.misses.get(ns, 0) + 1
+                return None
+            expires_at, size, data = item
+            if time.time() >= expires_at:
+                del stripe.entries[key]
+                stripe.bytes -= size
+                stripe.expirations += 1
+                stripe.misses[ns] = stripe.misses.get(ns, 0) + 1
+                return None
+            stripe.entries.move_to_end(key)
+            stripe.hits[ns] = stripe.hits.get(ns, 0) + 1
+            return data
+
+    def contains(self, key):
+        """key 是否存在且未過期（不計入命中、不更新 LRU 順序）"""
+        stripe = self._stripe(key)
+        with stripe.lock:
+            item = stripe.entries.get(key)
+            return item is not None and time.time() < item[0]
+
+    def set(self, key, data, ttl=None):
+        size = estimate_size(data)
+        expires_at = time.time() + (self.ttl_for(key) if ttl is None else ttl)
+        stripe = self._stripe(key)
+        if size > stripe.max_bytes:
+            # 單一項目超過分段預算，不快取
+            return False
+        with stripe.lock:
+            old = stripe.entries.pop(key, None)
+            if old is not None:
+                stripe.bytes -= old[1]
+            stripe.entries[key] = (expires_at, size, data)
+            stripe.bytes += size
+            while stripe.bytes > stripe.max_bytes and stripe.entries:
+                _, (_, evicted_size, _) = stripe.entries.popitem(last=False)
+                stripe.bytes -= evicted_size
+                stripe.evictions += 1
+        return True
+
+    def delete(self, key):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            item = stripe.entries.pop(key, None)
+            if item is not None:
+                stripe.bytes -= item[1]
+        return item is not None
+
+    def clear(self):
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe.entries.clear()
+                stripe.bytes = 0
+
+    def stats(self):
+        """彙總各分段的命中/未命中/淘汰計數與容量"""
+        hits, misses = {}, {}
+        result = {"backend": "memory", "entries": 0, "bytes": 0, "max_bytes": 0, "evictions": 0, "expirations": 0}
+        for stripe in self._stripes:
+            with stripe.lock:
+                result["entries"] += len(stripe.entries)
+                result["bytes"] += stripe.bytes
+                result["max_bytes"] += stripe.max_bytes
+                result["evictions"] += stripe.evictions
+                result["expirations"] += stripe.expirations
+                for ns, n in stripe.hits.items():
+                    hits[ns] = hits.get(ns, 0) + n
+                for ns, n in stripe.misses.items():
+                    misses[ns] = misses.get(ns, 0) + n
+        result["hits"] = hits
+        result["misses"] = misses
+        return result
+
+class SQLiteCache:
+    """跨程序共用的 LRU + TTL 快取，存放在 SQLite（WAL 模式）檔案
+    - 多個 gunicorn worker 開同一個檔案，worker 重啟後快取仍在
+    - 資料以 pickle 序列化，保留 Decimal、date 等型別，與記憶體後端回傳的資料一致；
+      因此檔案所在目錄必須只有目前使用者可寫入，否則拒絕開啟
+    - 讀寫時的 SQLite 錯誤（例如鎖定逾時、磁碟已滿）視為未命中或略過寫入，不影響請求
+    - 總位元組數由觸發器維護在 cache_meta，超出 max_bytes 時依最後存取時間淘汰
+    - 最後存取時間最多每 touch_interval 秒更新一次，避免每次讀取都寫入
+    介面與 ResponseCache 相同；命中/未命中等計數為各程序自己的統計
+    """
+
+    shared = True  # 同一台機器上的所有 worker 看到相同內容
+
+    _SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS cache_entries (
+            key TEXT PRIMARY KEY,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache_entries(accessed_at)",
+        "CREATE TABLE IF NOT EXISTS cache_meta (id INTEGER PRIMARY KEY CHECK (id = 1), bytes INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO cache_meta (id, bytes) VALUES (1, 0)",
+        """CREATE TRIGGER IF NOT EXISTS cache_entries_ai AFTER INSERT ON cache_entries
+           BEGIN UPDATE cache_meta SET bytes = bytes + NEW.size WHERE id = 1; END""",
+        """CREATE TRIGGER IF NOT EXISTS cache_entries_ad AFTER DELETE ON cache_entries
+           BEGIN UPDATE cache_meta SET bytes = bytes - OLD.size WHERE id = 1; END""",
+        """CREATE TRIGGER IF NOT EXISTS cache_entries_au AFTER UPDATE OF size ON cache_entries
+           BEGIN UPDATE cache_meta SET bytes = bytes + NEW.size - OLD.size WHERE id = 1; END""",
+    )
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES, ttls=None,
+                 default_ttl=CACHE_DEFAULT_TTL, touch_interval=60):
+        self._path = path
+        self._max_bytes = int(max_bytes)
+        self._ttls = dict(NAMESPACE_TTLS if ttls is None else ttls)
+        self._default_ttl = default_ttl
+        self._touch_interval = touch_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = {}
+        self._misses = {}
+        self._evictions = 0
+        self._expirations = 0
+        self._errors = 0
+        self._check_directory()
+        with self._conn() as conn:
+            for statement in self._SCHEMA:
+                conn.execute(statement)
+
+    def _check_directory(self):
+        """建立快取目錄（僅目前使用者可存取），並拒絕其他使用者可寫入的目錄"""
+        directory = os.path.dirname(os.path.abspath(self._path))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        st = os.stat(directory)
+        if st.st_mode & 0o022 or (hasattr(os, "getuid") and st.st_uid != os.getuid()):
+            raise PermissionError(f"{directory} is writable by other users")
+
+    def _error(self, operation, key, e):
+        with self._lock:
+            self._errors += 1
+        print(f"Warning: SQLite cache {operation} {key} failed: {e}")
+
+    def _conn(self):
+        """每個執行緒一條連線；fork 後的子程序重新開啟"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, counter, key):
+        ns = namespace_of(key)
+        with self._lock:
+            counter[ns] = counter.get(ns, 0) + 1
+
+    def ttl_for(self, key):
+        return self._ttls.get(namespace_of(key), self._default_ttl)
+
+    def get(self, key):
+        try:
+            return self._get(key)
+        except sqlite3.Error as e:
+            self._error("get", key, e)
+            self._count(self._misses, key)
+            return None
+
+    def _get(self, key):
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT expires_at, accessed_at, data FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None:
+            self._count(self._misses, key)
+            return None
+        expires_at, accessed_at, blob = row
+        if now >= expires_at:
+            conn.execute("DELETE FROM cache_entries WHERE key = ? AND expires_at <= ?", (key, now))
+            with self._lock:
+                self._expirations += 1
+            self._count(self._misses, key)
+            return None
+        if now - accessed_at >= self._touch_interval:
+            conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count(self._hits, key)
+        return pickle.loads(blob)
+
+    def contains(self, key):
+        """key 是否存在且未過期（不讀取資料、不計入命中）"""
+        try:
+            row = self._conn().execute(
+                "SELECT 1 FROM cache_entries WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._error("contains", key, e)
+            return False
+        return row is not None
+
+    def set(self, key, data, ttl=None):
+        blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        size = len(blob)
+        if size > self._max_bytes:
+            return False
+        now = time.time()
+        expires_at = now + (self.ttl_for(key) if ttl is None else ttl)
+        try:
+            self._write(key, blob, size, now, expires_at)
+        except sqlite3.Error as e:
+            self._error("set", key, e)
+            return False
+        return True
+
+    def _write(self, key, blob, size, now, expires_at):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                """INSERT INTO cache_entries (key, expires_at, accessed_at, size, data)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(key) DO UPDATE SET
+                     expires_at = excluded.expires_at, accessed_at = excluded.accessed_at,
+                     size = excluded.size, data = excluded.data""",
+                (key, expires_at, now, size, blob),
+            )
+            self._evict(conn, now, key)
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self, conn, now, keep):
+        """超出容量時先刪過期項目，再依最後存取時間淘汰，剛寫入的 keep 不淘汰"""
+        (total,) = conn.execute("SELECT bytes FROM cache_meta WHERE id = 1").fetchone()
+        if total <= self._max_bytes:
+            return
+        expired = conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,)).rowcount
+        (total,) = conn.execute("SELECT bytes FROM cache_meta WHERE id = 1").fetchone()
+        excess = total - self._max_bytes
+        victims = []
+        if excess > 0:
+            for key, size in conn.execute(
+                "SELECT key, size FROM cache_entries WHERE key != ? ORDER BY accessed_at", (keep,)
+            ):
+                victims.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            conn.executemany("DELETE FROM cache_entries WHERE key = ?", victims)
+        with self._lock:
+            self._expirations += max(0, expired)
+            self._evictions += len(victims)
+
+    def delete(self, key):
+        try:
+            return self._conn().execute("DELETE FROM cache_entries WHERE key = ?", (key,)).rowcount > 0
+        except sqlite3.Error as e:
+            self._error("delete", key, e)
+            return False
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache_entries")
+
+    def stats(self):
+        """項目數與容量為所有程序共用的數字；命中/未命中/淘汰為本程序的計數"""
+        conn = self._conn()
+        (entries,) = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()
+        (total,) = conn.execute("SELECT bytes FROM cache_meta WHERE id = 1").fetchone()
+        with self._lock:
+            return {
+                "backend": "sqlite",
+                "path": self._path,
+                "pid": os.getpid(),
+                "entries": entries,
+                "bytes": total,
+                "max_bytes": self._max_bytes,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "errors": self._errors,
+                "hits": dict(self._hits),
+                "misses": dict(self._misses),
+            }
+
+def create_cache(backend=CACHE_BACKEND):
+    """依 CACHE_BACKEND 建立快取；sqlite 無法開啟時退回程序內快取"""
+    if backend == "sqlite":
+        try:
+            return SQLiteCache()
+        except (sqlite3.Error, OSError) as e:
+            print(f"Warning: SQLite cache at {CACHE_PATH} unavailable, using in-process cache: {e}")
+    elif backend != "memory":
+        print(f"Warning: Unknown CACHE_BACKEND '{backend}', using in-process cache")
+    return ResponseCache()
+
+# 程序共用的回應快取（API 回應與 database.py 的詳細資料）
+response_cache = create_cache()
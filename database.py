@@ -1,57 +1,420 @@
 # database.py - MySQL 資料庫操作
 import os
+import re
+import json
+import time
+import math
+import uuid
+import copy
+import base64
+import hashlib
+import itertools
 import threading
-from mysql.connector import pooling
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+import mysql.connector
+from mysql.connector import errors
+from cache import response_cache
+from known_ids import known_movies, known_actors
+from metrics import registry, db_pool_wait, db_pool_checkout_errors
 
 TMDB_IMG_BASE_URL = "https://image.tmdb.org/t/p/w500"
+INSERT_CHUNK_ROWS = int(os.getenv("INSERT_CHUNK_ROWS", 500))  # 多列 INSERT 每個語句的列數上限
+SEARCH_FULLTEXT = os.getenv("SEARCH_FULLTEXT", "1") == "1"  # 使用 ngram 全文索引搜尋
+NGRAM_TOKEN_SIZE = int(os.getenv("NGRAM_TOKEN_SIZE", 2))  # 需與 MySQL 的 ngram_token_size 一致
+DETAIL_MAX_AGE_HOURS = float(os.getenv("DETAIL_MAX_AGE_HOURS", 24 * 14))  # 詳細資料最久多久重新抓取一次（變更另由 TMDB changes 標記）
+FILMOGRAPHY_MAX_AGE_HOURS = float(os.getenv("FILMOGRAPHY_MAX_AGE_HOURS", 24))  # 演員作品清單最久多久重新抓取一次
+
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", 20))
+MYSQL_POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", 5))  # 連線全被占用時最多等待秒數
+MYSQL_POOL_MAX_LIFETIME = float(os.getenv("MYSQL_POOL_MAX_LIFETIME", 1800))  # 連線使用超過此秒數就重建
+MYSQL_POOL_PING_IDLE = float(os.getenv("MYSQL_POOL_PING_IDLE", 30))  # 閒置超過此秒數的連線取出前先 ping
+# 唯讀副本，以逗號分隔的 host[:port]；未設定時所有查詢都走主庫
+MYSQL_REPLICA_HOSTS = [h.strip() for h in os.getenv("MYSQL_REPLICA_HOSTS", "").split(",") if h.strip()]
+MYSQL_REPLICA_POOL_SIZE = int(os.getenv("MYSQL_REPLICA_POOL_SIZE", MYSQL_POOL_SIZE))
+MYSQL_REPLICA_RETRY_SECONDS = float(os.getenv("MYSQL_REPLICA_RETRY_SECONDS", 10))  # 副本連線失敗後暫停使用的秒數
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 5))  # 寫入後這段時間內相關讀取改走主庫
+# /api/cmd 專用的小連線池，臨時查詢不會占用 API 的連線
+CMD_POOL_SIZE = int(os.getenv("CMD_POOL_SIZE", 2))
+CMD_POOL_TIMEOUT = float(os.getenv("CMD_POOL_TIMEOUT", 1))
+CMD_MAX_ROWS = int(os.getenv("CMD_MAX_ROWS", 1000))  # 超過此列數就停止讀取並標記 truncated
+CMD_MAX_EXECUTION_MS = int(os.getenv("CMD_MAX_EXECUTION_MS", 10000))  # SELECT 的 MAX_EXECUTION_TIME 提示（毫秒）
+CMD_FETCH_SIZE = int(os.getenv("CMD_FETCH_SIZE", 200))  # 每次自伺服器讀取的列數
 
 db_pool = None
+replica_pools = []
+cmd_pool = None
+
+class PoolTimeout(errors.PoolError):
+    """等待連線逾時（連線池已滿）"""
+
+class PooledConnection:
+    """連線池借出的連線
+    close() 或離開 with 區塊時歸還連線池，並關閉透過它建立的 cursor；其餘屬性轉給實際連線
+    """
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+        self._cursors = []
+
+    def cursor(self, *args, **kwargs):
+        cur = self._entry.conn.cursor(*args, **kwargs)
+        self._cursors.append(cur)
+        return cur
+
+    def close(self):
+        entry, self._entry = self._entry, None
+        if entry is None:
+            return
+        for cur in self._cursors:
+            try:
+                cur.close()
+            except Exception:
+                pass
+        self._cursors = []
+        self._pool._release(entry)
+
+    def discard(self):
+        """關閉實際連線而不歸還（例如結果只讀了一部分，不值得讀完剩下的列）"""
+        if self._entry is not None:
+            self._entry.broken = True
+        self.close()
+
+    def __getattr__(self, name):
+        if self._entry is None:
+            raise errors.OperationalError("Connection already returned to the pool")
+        return getattr(self._entry.conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._entry is not None:
+            try:
+                if self._entry.conn.in_transaction:
+                    self._entry.conn.rollback()
+            except Exception:
+                self._entry.broken = True
+        self.close()
+
+class _PoolEntry:
+    __slots__ = ("conn", "created_at", "last_used", "broken")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.broken = False
+
+class ConnectionPool:
+    """MySQL 連線池
+    - 借不到連線時等待最多 timeout 秒，逾時拋出 PoolTimeout
+    - 連線建立超過 max_lifetime 秒、或閒置超過 ping_idle 秒且 ping 失敗時重建
+    - 依需要建立連線，上限 size；warm_up() 可預先建立
+    """
+
+    def __init__(self, size=MYSQL_POOL_SIZE, timeout=MYSQL_POOL_TIMEOUT, max_lifetime=MYSQL_POOL_MAX_LIFETIME,
+                 ping_idle=MYSQL_POOL_PING_IDLE, **connect_kwargs):
+        self.pool_size = size
+        self._timeout = timeout
+        self._max_lifetime = max_lifetime
+        self._ping_idle = ping_idle
+        self._connect_kwargs = connect_kwargs
+        self.address = f"{connect_kwargs.get('host')}:{connect_kwargs.get('port')}"
+        self.down_until = 0.0  # 副本連線失敗後暫停使用的期限（connect_read 使用）
+        self._cond = threading.Condition()
+        self._idle = []
+        self._open = 0
+        self._waiting = 0
+        self._pid = os.getpid()
+        self._stats = {"checkouts": 0, "timeouts": 0, "created": 0, "recycled": 0, "ping_failures": 0, "max_wait": 0.0}
+
+    def _check_fork(self):
+        # fork 後不可沿用父程序的 socket，直接丟棄（不關閉）
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = []
+            self._open = 0
+            self._waiting = 0
+
+    def get_connection(self, timeout=None):
+        """借出連線；可搭配 with 使用"""
+        timeout = self._timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        entry = None
+        with self._cond:
+            self._check_fork()
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._open < self.pool_size:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"No MySQL connection available after {timeout:.1f}s (pool size {self.pool_size})")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            waited = time.monotonic() - start
+            self._stats["checkouts"] += 1
+            self._stats["max_wait"] = max(self._stats["max_wait"], waited)
+
+        try:
+            entry = self._validate(entry)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, entry)
+
+    def _validate(self, entry):
+        """回傳可用的連線：沒有連線、過期或 ping 失敗時建立新連線（在鎖外執行）"""
+        now = time.monotonic()
+        if entry is not None and now - entry.created_at >= self._max_lifetime:
+            self._discard(entry.conn)
+            self._count("recycled")
+            entry = None
+        if entry is not None and now - entry.last_used >= self._ping_idle:
+            try:
+                entry.conn.ping(reconnect=False)
+            except Exception:
+                self._discard(entry.conn)
+                self._count("ping_failures")
+                entry = None
+        if entry is None:
+            entry = _PoolEntry(mysql.connector.connect(**self._connect_kwargs))
+            self._count("created")
+        return entry
+
+    def _release(self, entry):
+        if not entry.broken:
+            try:
+                # 丟棄未讀完的結果，避免下一個使用者收到 "Unread result found"
+                if entry.conn.unread_result:
+                    entry.conn.consume_results()
+            except Exception:
+                entry.broken = True
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            if entry.broken:
+                self._open -= 1
+            else:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            self._cond.notify()
+        if entry.broken:
+            self._discard(entry.conn)
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _count(self, name):
+        with self._cond:
+            self._stats[name] += 1
+
+    def warm_up(self, count=None):
+        """預先建立連線直到 count 條（預設為連線池大小），回傳實際建立的數量"""
+        count = self.pool_size if count is None else min(count, self.pool_size)
+        borrowed = []
+        try:
+            while len(borrowed) < count:
+                try:
+                    borrowed.append(self.get_connection(timeout=0))
+                except PoolTimeout:
+                    break
+        finally:
+            for conn in borrowed:
+                conn.close()
+        return len(borrowed)
+
+    def stats(self):
+        with self._cond:
+            result = dict(self._stats)
+            result.update({
+                "size": self.pool_size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "waiting": self._waiting,
+            })
+        return result
 
 def _init_pool_connections():
     """後台非同步初始化連線池
-    在應用啟動後觸發，不阻塞應用啟動
+    在應用啟動後觸發，不阻塞應用啟動；預先建立與連線池大小相同數量的連線
     """
-    global db_pool
-    
     def _async_init():
         try:
-            # 在後台非同步建立 3 個連線
-            init_count = min(3, int(os.getenv("MYSQL_POOL_SIZE", 20)))
-            for i in range(init_count):
-                try:
-                    conn = db_pool.get_connection()
-                    conn.close()
-                    print(f"[INIT] Pool connection {i+1}/{init_count} ready")
-                except Exception as e:
-                    print(f"[INIT] Warning: Failed to initialize connection {i+1}: {e}")
+            ready = db_pool.warm_up()
+            print(f"[INIT] Pool warm-up: {ready}/{db_pool.pool_size} connections ready")
         except Exception as e:
             print(f"[INIT] Warning: Async pool initialization error: {e}")
-    
+
     # 在後台執行，不阻塞主線程
     thread = threading.Thread(target=_async_init, daemon=True)
     thread.start()
 
+def seed_known_ids():
+    """在背景把 MOVIE / ACTOR 既有的 tmdb_id 種入 known_movies / known_actors"""
+    def _seed():
+        for table, known in (("MOVIE", known_movies), ("ACTOR", known_actors)):
+            try:
+                with connect_db() as conn:
+                    cur = conn.cursor()
+                    cur.execute(f"SELECT tmdb_id FROM {table} WHERE tmdb_id IS NOT NULL")
+                    while True:
+                        rows = cur.fetchmany(10000)
+                        if not rows:
+                            break
+                        known.add_many([row[0] for row in rows])
+                known.seeded = True
+                print(f"[INIT] Seeded {len(known)} known {table} tmdb ids")
+            except Exception as e:
+                print(f"[INIT] Warning: Failed to seed known {table} tmdb ids: {e}")
+
+    thread = threading.Thread(target=_seed, name="seed-known-ids", daemon=True)
+    thread.start()
+
 def init_db_pool():
-    """初始化資料庫連線池"""
-    global db_pool
-    db_pool = pooling.MySQLConnectionPool(
-        pool_name="mypool",
-        pool_size=int(os.getenv("MYSQL_POOL_SIZE", 20)),  # 增加到 20，預先建立連線
-        pool_reset_session=False,  # 禁用連線重置，避免預初始化的連線被銷毀
-        host=os.getenv("MYSQLHOST", "localhost"),
+    """初始化資料庫連線池與副本連線池（連線在第一次使用或 warm-up 時才建立）"""
+    global db_pool, replica_pools, cmd_pool
+    credentials = dict(
         database=os.getenv("MYSQLDATABASE", "mydb"),
         user=os.getenv("MYSQLUSER", "myuser"),
         password=os.getenv("MYSQLPASSWORD", "myuser"),
-        port=int(os.getenv("MYSQLPORT", 3306)),
         autocommit=True  # 自動提交，減少往返
     )
+    db_pool = ConnectionPool(
+        size=MYSQL_POOL_SIZE,
+        host=os.getenv("MYSQLHOST", "localhost"),
+        port=int(os.getenv("MYSQLPORT", 3306)),
+        **credentials
+    )
+    replica_pools = []
+    if MYSQL_REPLICA_HOSTS and not response_cache.shared:
+        # read-your-writes 的寫入記錄存在 response_cache；只有本程序看得到時，
+        # 其他 worker 剛寫入的資料可能從落後的副本讀到舊值，因此不使用副本
+        print("Warning: MYSQL_REPLICA_HOSTS ignored because the response cache is not shared between workers "
+              "(set CACHE_BACKEND=sqlite); all reads use the primary")
+    for address in MYSQL_REPLICA_HOSTS if response_cache.shared else ():
+        host, _, port = address.partition(":")
+        replica_pools.append(ConnectionPool(size=MYSQL_REPLICA_POOL_SIZE, host=host,
+                                            port=int(port or os.getenv("MYSQLPORT", 3306)), **credentials))
+    cmd_pool = ConnectionPool(
+        size=CMD_POOL_SIZE,
+        timeout=CMD_POOL_TIMEOUT,
+        host=os.getenv("MYSQLHOST", "localhost"),
+        port=int(os.getenv("MYSQLPORT", 3306)),
+        **credentials
+    )
 
-def connect_db():
-    """從連線池獲取連線"""
+def connect_db(timeout=None):
+    """從連線池獲取連線，建議以 with connect_db() as conn: 使用，離開區塊時自動歸還"""
     global db_pool
     if db_pool is None:
         init_db_pool()
-    return db_pool.get_connection()
+    start = time.perf_counter()
+    try:
+        conn = db_pool.get_connection(timeout)
+    except Exception:
+        db_pool_checkout_errors.inc()
+        raise
+    db_pool_wait.observe(time.perf_counter() - start)
+    return conn
+
+# ==================== 讀寫分離 ====================
+
+_replica_turn = itertools.count()
+_read_stats = {"primary": 0, "replica": 0, "read_your_writes": 0, "replica_failures": 0}
+_read_stats_lock = threading.Lock()
+
+def _count_read(name):
+    with _read_stats_lock:
+        _read_stats[name] += 1
+
+def note_write(*keys):
+    """記錄剛寫入的資料表或實體（例如 "MOVIE"、"movie:12"），READ_YOUR_WRITES_SECONDS 內相關讀取走主庫
+    記在 response_cache；只有共用的快取（CACHE_BACKEND=sqlite）才會啟用副本，因此其他 worker 一定看得到
+    """
+    if not replica_pools:
+        return
+    for key in keys:
+        response_cache.set(f"db_write:{key}", True, ttl=READ_YOUR_WRITES_SECONDS)
+
+def _recently_written(keys):
+    return any(response_cache.get(f"db_write:{key}") is not None for key in keys)
+
+def connect_read(*keys):
+    """唯讀查詢用的連線
+    keys 為查詢依賴的資料表或實體；有副本且這些 key 最近沒有寫入時輪流使用副本，
+    副本連線失敗時暫停使用該副本並改走主庫
+    """
+    if not replica_pools:
+        return connect_db()
+    if keys and _recently_written(keys):
+        _count_read("read_your_writes")
+        return connect_db()
+    now = time.monotonic()
+    first = next(_replica_turn)
+    for i in range(len(replica_pools)):
+        pool = replica_pools[(first + i) % len(replica_pools)]
+        if pool.down_until > now:
+            continue
+        start = time.perf_counter()
+        try:
+            conn = pool.get_connection()
+        except Exception as e:
+            pool.down_until = now + MYSQL_REPLICA_RETRY_SECONDS
+            _count_read("replica_failures")
+            print(f"Warning: Replica {pool.address} unavailable, reading from primary: {e}")
+            continue
+        db_pool_wait.observe(time.perf_counter() - start)
+        _count_read("replica")
+        return conn
+    _count_read("primary")
+    return connect_db()
+
+def pool_stats():
+    """連線池統計（借出次數、等待、逾時、重建等），有副本時附上各副本與讀取分流的計數"""
+    if db_pool is None:
+        return {}
+    result = db_pool.stats()
+    if replica_pools:
+        result["replicas"] = {pool.address: pool.stats() for pool in replica_pools}
+        with _read_stats_lock:
+            result["reads"] = dict(_read_stats)
+    if cmd_pool is not None:
+        result["cmd"] = cmd_pool.stats()
+    return result
+
+@registry.register_collector
+def _pool_metrics():
+    """連線池大小與使用中連線數（抓取時計算）"""
+    if db_pool is None:
+        return []
+    stats = db_pool.stats()
+    return [
+        ("db_pool_size", "gauge", "Configured MySQL pool size.", [({}, stats["size"])]),
+        ("db_pool_connections_in_use", "gauge", "MySQL pool connections currently checked out.", [({}, stats["in_use"])]),
+        ("db_pool_connections_open", "gauge", "MySQL connections currently open.", [({}, stats["open"])]),
+        ("db_pool_waiting", "gauge", "Threads waiting for a MySQL connection.", [({}, stats["waiting"])]),
+        ("db_pool_timeouts_total", "counter", "Checkouts that timed out waiting for a connection.", [({}, stats["timeouts"])]),
+        ("db_pool_recycled_total", "counter", "Connections replaced after reaching their max lifetime.", [({}, stats["recycled"])]),
+        ("db_pool_ping_failures_total", "counter", "Idle connections dropped after a failed ping.", [({}, stats["ping_failures"])]),
+    ]
 
 # ==================== 內部工具函數 ====================
 
@@ -60,11 +423,12 @@ def check_movie(cur, tmdb_id):
     row = cur.fetchone()
     return row[0] if row else None
 
-def upsert_movie(cur, tmdb_id, title, release_year, genre, runtime, overview, rating, poster_url=None):
+def upsert_movie(cur, tmdb_id, title, release_year, genre, runtime, overview, rating, poster_url=None, fetched=False):
+    """fetched 為 True（資料來自 /movie/{id}）時記錄 last_fetched_at 並清除 TMDB 變更標記"""
     cur.execute(
         """
-        INSERT INTO MOVIE (tmdb_id, title, release_year, genre, runtime, overview, rating, poster_url)
-        VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
+        INSERT INTO MOVIE (tmdb_id, title, release_year, genre, runtime, overview, rating, poster_url, last_fetched_at)
+        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,IF(%s, CURRENT_TIMESTAMP, NULL))
         ON DUPLICATE KEY UPDATE
           movie_id=LAST_INSERT_ID(movie_id),
           title=COALESCE(VALUES(title), title),
@@ -73,9 +437,11 @@ def upsert_movie(cur, tmdb_id, title, release_year, genre, runtime, overview, ra
           runtime=COALESCE(VALUES(runtime), runtime),
           overview=COALESCE(VALUES(overview), overview),
           rating=COALESCE(VALUES(rating), rating),
-          poster_url=COALESCE(VALUES(poster_url), poster_url)
+          poster_url=COALESCE(VALUES(poster_url), poster_url),
+          tmdb_changed_at=IF(VALUES(last_fetched_at) IS NULL, tmdb_changed_at, NULL),
+          last_fetched_at=COALESCE(VALUES(last_fetched_at), last_fetched_at)
         """,
-        (tmdb_id, title, release_year, genre, runtime, overview, rating, poster_url),
+        (tmdb_id, title, release_year, genre, runtime, overview, rating, poster_url, fetched),
     )
     return cur.lastrowid
 
@@ -98,19 +464,22 @@ def upsert_actor(cur, tmdb_id, name, profile_url=None):
     )
     return cur.lastrowid
 
-def upsert_actor_detail(cur, tmdb_id, name, profile_url=None, birthdate=None, country=None):
+def upsert_actor_detail(cur, tmdb_id, name, profile_url=None, birthdate=None, country=None, fetched=False):
+    """fetched 為 True（資料來自 /person/{id}）時記錄 last_fetched_at 並清除 TMDB 變更標記"""
     cur.execute(
         """
-        INSERT INTO ACTOR (tmdb_id, name, profile_url, birthdate, country)
-        VALUES (%s,%s,%s,%s,%s)
+        INSERT INTO ACTOR (tmdb_id, name, profile_url, birthdate, country, last_fetched_at)
+        VALUES (%s,%s,%s,%s,%s,IF(%s, CURRENT_TIMESTAMP, NULL))
         ON DUPLICATE KEY UPDATE
             actor_id=LAST_INSERT_ID(actor_id),
             name=COALESCE(VALUES(name), name),
             profile_url=COALESCE(VALUES(profile_url), profile_url),
             birthdate=COALESCE(VALUES(birthdate), birthdate),
-            country=COALESCE(VALUES(country), country)
+            country=COALESCE(VALUES(country), country),
+            tmdb_changed_at=IF(VALUES(last_fetched_at) IS NULL, tmdb_changed_at, NULL),
+            last_fetched_at=COALESCE(VALUES(last_fetched_at), last_fetched_at)
     """,
-        (tmdb_id, name, profile_url, birthdate, country),
+        (tmdb_id, name, profile_url, birthdate, country, fetched),
     )
     return cur.lastrowid
 
@@ -130,12 +499,10 @@ def ensure_director(cur, movie_id, actor_id):
 
 def get_tmdb_id_from_movie_id(movie_id):
     """從 movie_id 獲取 tmdb_id"""
-    conn = connect_db()
-    cur = conn.cursor()
-    cur.execute("SELECT tmdb_id FROM MOVIE WHERE movie_id = %s", (movie_id,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    with connect_read(f"movie:{movie_id}") as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT tmdb_id FROM MOVIE WHERE movie_id = %s", (movie_id,))
+        row = cur.fetchone()
     return row[0] if row else None
 
 def get_movies_by_tmdb_ids(tmdb_ids):
@@ -143,8 +510,7 @@ def get_movies_by_tmdb_ids(tmdb_ids):
     if not tmdb_ids:
         return {}
     
-    conn = connect_db()
-    try:
+    with connect_read("MOVIE") as conn:
         cur = conn.cursor(dictionary=True)
         placeholders = ','.join(['%s'] * len(tmdb_ids))
         cur.execute(f"""
@@ -156,17 +522,13 @@ def get_movies_by_tmdb_ids(tmdb_ids):
         
         results = cur.fetchall()
         return {row['tmdb_id']: row for row in results}
-    finally:
-        cur.close()
-        conn.close()
 
 def get_movie_ids_from_tmdb_ids(tmdb_ids):
     """從多個 tmdb_id 批次獲取 movie_id，回傳 dict"""
     if not tmdb_ids:
         return {}
-    conn = connect_db()
-    cur = conn.cursor()
-    try:
+    with connect_read("MOVIE") as conn:
+        cur = conn.cursor()
         placeholders = ','.join(['%s'] * len(tmdb_ids))
         cur.execute(
             f"SELECT tmdb_id, movie_id FROM MOVIE WHERE tmdb_id IN ({placeholders})",
@@ -174,35 +536,28 @@ def get_movie_ids_from_tmdb_ids(tmdb_ids):
         )
         rows = cur.fetchall()
         return {tid: mid for tid, mid in rows}
-    finally:
-        cur.close()
-        conn.close()
 
 def check_movie_detail(movie_id):
-    if movie_id is not None:
-        conn = connect_db()
-        cur = conn.cursor()
-        cur.execute("SELECT poster_url, runtime FROM MOVIE WHERE movie_id=%s", (movie_id,))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
-        if row:
-            if row[0] is None:
-                return True
-            elif row[1] is None:
-                return False
-            else:
-                return True
-    return False
+    """電影詳細資料是否仍然新鮮（不需要向 TMDB 重新抓取）"""
+    state = get_movie_fetch_state(movie_id) if movie_id is not None else None
+    return state is not None and not movie_detail_stale(state)
+
+def get_movie_fetch_state(movie_id):
+    """回傳 {tmdb_id, last_fetched_at, tmdb_changed_at}，找不到回傳 None"""
+    with connect_read(f"movie:{movie_id}") as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(
+            "SELECT tmdb_id, last_fetched_at, tmdb_changed_at FROM MOVIE WHERE movie_id=%s",
+            (movie_id,),
+        )
+        return cur.fetchone()
 
 def get_tmdb_id_from_actor_id(actor_id):
     """從 actor_id 獲取 tmdb_id"""
-    conn = connect_db()
-    cur = conn.cursor()
-    cur.execute("SELECT tmdb_id FROM ACTOR WHERE actor_id = %s", (actor_id,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    with connect_read(f"actor:{actor_id}") as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT tmdb_id FROM ACTOR WHERE actor_id = %s", (actor_id,))
+        row = cur.fetchone()
     return row[0] if row else None
 
 def get_actors_by_tmdb_ids(tmdb_ids):
@@ -210,8 +565,7 @@ def get_actors_by_tmdb_ids(tmdb_ids):
     if not tmdb_ids:
         return {}
     
-    conn = connect_db()
-    try:
+    with connect_read("ACTOR") as conn:
         cur = conn.cursor(dictionary=True)
         placeholders = ','.join(['%s'] * len(tmdb_ids))
         cur.execute(f"""
@@ -223,58 +577,62 @@ def get_actors_by_tmdb_ids(tmdb_ids):
         
         results = cur.fetchall()
         return {row['tmdb_id']: row for row in results}
-    finally:
-        cur.close()
-        conn.close()
 
 def get_actor_id_from_tmdb_id(tmdb_id):
     """從 tmdb_id 獲取 actor_id"""
-    conn = connect_db()
-    cur = conn.cursor()
-    cur.execute("SELECT actor_id FROM ACTOR WHERE tmdb_id = %s", (tmdb_id,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
+    with connect_read("ACTOR") as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT actor_id FROM ACTOR WHERE tmdb_id = %s", (tmdb_id,))
+        row = cur.fetchone()
     return row[0] if row else None
 
+def _fetch_stale(fetched_at, changed_at, max_age_hours):
+    """從未抓取、抓取後 TMDB 回報過變更（changed_at 不為空）或超過 max_age_hours 時需要重新抓取"""
+    if fetched_at is None or changed_at is not None:
+        return True
+    return datetime.now() - fetched_at >= timedelta(hours=max_age_hours)
+
+def movie_detail_stale(movie):
+    """電影列（含 last_fetched_at、tmdb_changed_at）是否需要向 TMDB 重新抓取詳細資料"""
+    return _fetch_stale(movie['last_fetched_at'], movie['tmdb_changed_at'], DETAIL_MAX_AGE_HOURS)
+
+def actor_detail_stale(actor):
+    """演員列（含 last_fetched_at、tmdb_changed_at）是否需要向 TMDB 重新抓取詳細資料"""
+    return _fetch_stale(actor['last_fetched_at'], actor['tmdb_changed_at'], DETAIL_MAX_AGE_HOURS)
+
+def filmography_stale(actor):
+    """演員列（含 updated_at、tmdb_changed_at）的作品清單是否需要重新抓取
+    updated_at 為上次抓取作品清單的時間
+    """
+    return _fetch_stale(actor['updated_at'], actor['tmdb_changed_at'], FILMOGRAPHY_MAX_AGE_HOURS)
+
+def get_actor_fetch_state(actor_id):
+    """回傳 {tmdb_id, last_fetched_at, tmdb_changed_at, updated_at}，找不到回傳 None"""
+    with connect_read(f"actor:{actor_id}") as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(
+            "SELECT tmdb_id, last_fetched_at, tmdb_changed_at, updated_at FROM ACTOR WHERE actor_id=%s",
+            (actor_id,),
+        )
+        return cur.fetchone()
+
 def check_actor_update(actor_id):
-    check_detail = False
-    check_movie = False
-    if actor_id is not None:
-        conn = connect_db()
-        cur = conn.cursor()
-        cur.execute("SELECT profile_url, birthdate, updated_at FROM ACTOR WHERE actor_id=%s", (actor_id,))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
-        if row:
-            if row[2] is not None:
-                # 計算時間差是否在 24 小時內
-                from datetime import datetime, timedelta
-                updated_at = row[2]
-                if datetime.now() - updated_at < timedelta(days=1):
-                    check_movie = True
-                check_detail = True
-            else:
-                if row[0] is None:
-                    check_detail = True
-                elif row[1] is not None:
-                    check_detail = True
-    return [check_detail, check_movie]
+    """回傳 [詳細資料是否新鮮, 作品清單是否新鮮]"""
+    state = get_actor_fetch_state(actor_id) if actor_id is not None else None
+    if state is None:
+        return [False, False]
+    return [not actor_detail_stale(state), not filmography_stale(state)]
 
 def update_actor_time(actor_id):
     if actor_id is not None:
-        conn = connect_db()
-        cur = conn.cursor()
-        try:
+        with connect_db() as conn:
+            cur = conn.cursor()
             cur.execute(
                 "UPDATE ACTOR SET updated_at = CURRENT_TIMESTAMP WHERE actor_id=%s",
                 (actor_id,)
             )
             conn.commit()
-        finally:
-            cur.close()
-            conn.close()
+        invalidate_actor_detail(actor_id)
 
 def normalize_movie_row(row):
     if not row: return None
@@ -297,10 +655,27 @@ def normalize_actor_row(row):
         'profile_url': row.get('profile_url') if isinstance(row, dict) else row[4]
     }
 
+def tmdb_movie_row(tmdb_movie_id, movie_data):
+    """尚未寫入資料庫的 TMDB 電影 -> 與 normalize_movie_row 相同的欄位，movie_id 為 None"""
+    _, title, release_year, genre, _, _, rating, poster_url = _parse_movie(tmdb_movie_id, movie_data)
+    return {
+        'movie_id': None,
+        'title': title,
+        'release_year': int(release_year) if release_year and release_year.isdigit() else None,
+        'genre': genre,
+        'rating': rating,
+        'poster_url': poster_url,
+    }
+
+def tmdb_actor_row(tmdb_actor_id, actor_data):
+    """尚未寫入資料庫的 TMDB 人物 -> 與 normalize_actor_row 相同的欄位，actor_id 為 None"""
+    _, name, profile_url, birthdate, country = _parse_actor(tmdb_actor_id, actor_data)
+    return {'actor_id': None, 'name': name, 'birthdate': birthdate, 'country': country, 'profile_url': profile_url}
+
 # ==================== 存儲函數 ====================
 
-def store_movie(tmdb_movie_id, movie_data):
-    """將 TMDB 電影資料存入資料庫"""
+def store_movie(tmdb_movie_id, movie_data, fetched=False):
+    """將 TMDB 電影資料存入資料庫；fetched 為 True 表示 movie_data 是 /movie/{id} 的完整資料"""
     conn = connect_db()
     cur = conn.cursor()
 
@@ -312,113 +687,106 @@ def store_movie(tmdb_movie_id, movie_data):
     #     return movie_id
 
     try:
-        title = movie_data.get("title")
-        release_year = None
-        if movie_data.get("release_date"):
-            release_year = movie_data["release_date"].split("-")[0]
-        genres = ", ".join([g["name"] for g in movie_data.get("genres", [])]) if movie_data.get("genres") else None
-        runtime = movie_data.get("runtime")
-        overview = movie_data.get("overview")
-        rating = movie_data.get("vote_average")
-        poster_path = movie_data.get("poster_path")
-        poster_url = f"{TMDB_IMG_BASE_URL}{poster_path}" if poster_path else None
-
-        movie_id = upsert_movie(cur, tmdb_movie_id, title, release_year, genres, runtime, overview, rating, poster_url)
-
-        credits = movie_data.get("credits", {})
+        movie_id, actor_id_map = _store_movie(cur, tmdb_movie_id, movie_data, fetched)
+        credited = _credited_ids(cur, "movie_id", [movie_id])
+        conn.commit()
+        known_movies.add(tmdb_movie_id)
+        known_actors.add_many(actor_id_map)
+        note_write("MOVIE", "ACTOR")
+        invalidate_movie_detail(movie_id)
+        # 演員詳細資料內嵌參演電影的標題、海報等欄位
+        invalidate_actor_detail(*actor_id_map.values(), *credited)
+        return movie_id
+        
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
 
-        cast_members = credits.get("cast", [])[:20]
-        crew_members = credits.get("crew", [])[:20]
+def store_movies(items):
+    """批次將多部 TMDB 電影資料存入資料庫，items 為 [(tmdb_id, movie_data), ...]
+    - 每張表各一個多列 INSERT ... ON DUPLICATE KEY UPDATE
+    - 所有電影的演員合併去重，id 以一次查詢取回
+    - 整批只提交一次
+    回傳 {tmdb_id: movie_id}
+    """
+    movies = {tmdb_id: data for tmdb_id, data in items if tmdb_id}
+    if not movies:
+        return {}
 
-        tmdb_to_basic = {}
-        for m in cast_members:
-            tid = m.get("id")
-            if tid:
-                pp = m.get("profile_path")
-                tmdb_to_basic[tid] = (
-                    m.get("name"),
-                    f"{TMDB_IMG_BASE_URL}{pp}" if pp else None,
-                )
-        director_ids = []
-        for m in crew_members:
-            if m.get("job") == "Director":
-                tid = m.get("id")
-                if tid:
-                    director_ids.append(tid)
-                    if tid not in tmdb_to_basic:
-                        pp = m.get("profile_path")
-                        tmdb_to_basic[tid] = (
-                            m.get("name"),
-                            f"{TMDB_IMG_BASE_URL}{pp}" if pp else None,
-                        )
-
-        all_tmdb_ids = list(tmdb_to_basic.keys())
-        actor_id_map = {}
-        if all_tmdb_ids:
-            placeholders = ",".join(["%s"] * len(all_tmdb_ids))
-            cur.execute(
-                f"SELECT tmdb_id, actor_id FROM ACTOR WHERE tmdb_id IN ({placeholders})",
-                all_tmdb_ids,
-            )
-            for tid, aid in cur.fetchall() or []:
-                actor_id_map[tid] = aid
+    credits = {tmdb_id: _parse_credits(data) for tmdb_id, data in movies.items()}
+    people = {}
+    for _, _, tmdb_to_basic in credits.values():
+        for tid, basic in tmdb_to_basic.items():
+            people.setdefault(tid, basic)
 
-            missing = [tid for tid in all_tmdb_ids if tid not in actor_id_map]
-            if missing:
-                values = [(tid, tmdb_to_basic[tid][0], tmdb_to_basic[tid][1]) for tid in missing]
-                cur.executemany(
-                    """
-                    INSERT INTO ACTOR (tmdb_id, name, profile_url)
-                    VALUES (%s,%s,%s)
-                    ON DUPLICATE KEY UPDATE
-                        name=VALUES(name),
-                        profile_url=VALUES(profile_url)
-                    """,
-                    values,
-                )
-                cur.execute(
-                    f"SELECT tmdb_id, actor_id FROM ACTOR WHERE tmdb_id IN ({placeholders})",
-                    all_tmdb_ids,
-                )
-                for tid, aid in cur.fetchall() or []:
-                    actor_id_map[tid] = aid
+    conn = connect_db()
+    cur = conn.cursor()
+    try:
+        conn.start_transaction()
+        _insert_rows(
+            cur,
+            "INSERT INTO MOVIE (tmdb_id, title, release_year, genre, runtime, overview, rating, poster_url) VALUES",
+            "(%s,%s,%s,%s,%s,%s,%s,%s)",
+            [_parse_movie(tmdb_id, data) for tmdb_id, data in movies.items()],
+            """
+            ON DUPLICATE KEY UPDATE
+              title=COALESCE(VALUES(title), title),
+              release_year=COALESCE(VALUES(release_year), release_year),
+              genre=COALESCE(VALUES(genre), genre),
+              runtime=COALESCE(VALUES(runtime), runtime),
+              overview=COALESCE(VALUES(overview), overview),
+              rating=COALESCE(VALUES(rating), rating),
+              poster_url=COALESCE(VALUES(poster_url), poster_url)
+            """,
+        )
+        # 已存在的演員保持不變，只補上缺少的
+        _insert_rows(
+            cur,
+            "INSERT INTO ACTOR (tmdb_id, name, profile_url) VALUES",
+            "(%s,%s,%s)",
+            [(tid, name, profile_url) for tid, (name, profile_url) in people.items()],
+            "ON DUPLICATE KEY UPDATE tmdb_id=tmdb_id",
+        )
+        movie_id_map, actor_id_map = _resolve_ids(cur, list(movies), list(people))
 
-        if cast_members and actor_id_map:
-            cast_rows = []
+        cast_rows = []
+        dir_rows = []
+        for tmdb_id, (cast_members, director_ids, _) in credits.items():
+            movie_id = movie_id_map.get(tmdb_id)
+            if not movie_id:
+                continue
             for m in cast_members:
-                tid = m.get("id")
-                aid = actor_id_map.get(tid)
+                aid = actor_id_map.get(m.get("id"))
                 if aid:
-                    cast_rows.append(
-                        (movie_id, aid, m.get("character"), m.get("order"))
-                    )
-            if cast_rows:
-                cur.executemany(
-                    """
-                    INSERT IGNORE INTO MOVIE_CAST (movie_id, actor_id, character_name, billing_order)
-                    VALUES (%s,%s,%s,%s)
-                    """,
-                    cast_rows,
-                )
-
-        if director_ids and actor_id_map:
-            dir_rows = []
+                    cast_rows.append((movie_id, aid, m.get("character"), m.get("order")))
             for tid in director_ids:
                 aid = actor_id_map.get(tid)
                 if aid:
                     dir_rows.append((movie_id, aid))
-            if dir_rows:
-                cur.executemany(
-                    """
-                    INSERT IGNORE INTO DIRECTOR (movie_id, actor_id)
-                    VALUES (%s,%s)
-                    """,
-                    dir_rows,
-                )
+        _insert_rows(
+            cur,
+            "INSERT IGNORE INTO MOVIE_CAST (movie_id, actor_id, character_name, billing_order) VALUES",
+            "(%s,%s,%s,%s)",
+            cast_rows,
+        )
+        _insert_rows(
+            cur,
+            "INSERT IGNORE INTO DIRECTOR (movie_id, actor_id) VALUES",
+            "(%s,%s)",
+            dir_rows,
+        )
+        credited = _credited_ids(cur, "movie_id", movie_id_map.values())
 
         conn.commit()
-        return movie_id
-        
+        known_movies.add_many(movie_id_map)
+        known_actors.add_many(actor_id_map)
+        note_write("MOVIE", "ACTOR")
+        invalidate_movie_detail(*movie_id_map.values())
+        invalidate_actor_detail(*actor_id_map.values(), *credited)
+        return movie_id_map
     except Exception:
         conn.rollback()
         raise
@@ -426,8 +794,174 @@ def store_movie(tmdb_movie_id, movie_data):
         cur.close()
         conn.close()
 
-def store_actor(tmdb_actor_id, actor_data):
-    """將 TMDB 演員資料存入資料庫"""
+def _insert_rows(cur, prefix, row_placeholder, rows, suffix="", chunk_size=INSERT_CHUNK_ROWS):
+    """以多列 VALUES 寫入，每 chunk_size 列一個語句"""
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        values = ",".join([row_placeholder] * len(chunk))
+        cur.execute(
+            f"{prefix} {values} {suffix}",
+            [v for row in chunk for v in row],
+        )
+
+def _resolve_ids(cur, movie_tmdb_ids, actor_tmdb_ids):
+    """一次查詢取回 {tmdb_id: movie_id} 與 {tmdb_id: actor_id}"""
+    parts = []
+    params = []
+    if movie_tmdb_ids:
+        parts.append(f"SELECT 'M', tmdb_id, movie_id FROM MOVIE WHERE tmdb_id IN ({','.join(['%s'] * len(movie_tmdb_ids))})")
+        params.extend(movie_tmdb_ids)
+    if actor_tmdb_ids:
+        parts.append(f"SELECT 'A', tmdb_id, actor_id FROM ACTOR WHERE tmdb_id IN ({','.join(['%s'] * len(actor_tmdb_ids))})")
+        params.extend(actor_tmdb_ids)
+    movie_id_map, actor_id_map = {}, {}
+    if not parts:
+        return movie_id_map, actor_id_map
+    cur.execute(" UNION ALL ".join(parts), params)
+    for kind, tid, db_id in cur.fetchall() or []:
+        (movie_id_map if kind == 'M' else actor_id_map)[tid] = db_id
+    return movie_id_map, actor_id_map
+
+def _credited_ids(cur, column, ids):
+    """column 為 "movie_id" 時回傳參與這些電影的 actor_id，為 "actor_id" 時回傳這些人參與的 movie_id
+    對方的詳細資料內嵌了這些電影/演員的欄位，寫入後要一併失效
+    """
+    ids = [i for i in dict.fromkeys(ids) if i]
+    if not ids:
+        return []
+    other = "actor_id" if column == "movie_id" else "movie_id"
+    placeholders = ",".join(["%s"] * len(ids))
+    cur.execute(
+        f"SELECT {other} FROM MOVIE_CAST WHERE {column} IN ({placeholders}) "
+        f"UNION SELECT {other} FROM DIRECTOR WHERE {column} IN ({placeholders})",
+        ids + ids,
+    )
+    return [row[0] for row in cur.fetchall()]
+
+def _parse_movie(tmdb_movie_id, movie_data):
+    """TMDB 電影資料 -> MOVIE 欄位 (tmdb_id, title, release_year, genre, runtime, overview, rating, poster_url)"""
+    release_year = None
+    if movie_data.get("release_date"):
+        release_year = movie_data["release_date"].split("-")[0]
+    genres = ", ".join([g["name"] for g in movie_data.get("genres", [])]) if movie_data.get("genres") else None
+    poster_path = movie_data.get("poster_path")
+    poster_url = f"{TMDB_IMG_BASE_URL}{poster_path}" if poster_path else None
+    return (
+        tmdb_movie_id,
+        movie_data.get("title"),
+        release_year,
+        genres,
+        movie_data.get("runtime"),
+        movie_data.get("overview"),
+        movie_data.get("vote_average"),
+        poster_url,
+    )
+
+def _parse_credits(movie_data):
+    """從 TMDB 電影資料取出前 20 名演員、導演 tmdb_id 與 {tmdb_id: (name, profile_url)}"""
+    credits = movie_data.get("credits", {})
+
+    cast_members = credits.get("cast", [])[:20]
+    crew_members = credits.get("crew", [])[:20]
+
+    tmdb_to_basic = {}
+    for m in cast_members:
+        tid = m.get("id")
+        if tid:
+            pp = m.get("profile_path")
+            tmdb_to_basic[tid] = (
+                m.get("name"),
+                f"{TMDB_IMG_BASE_URL}{pp}" if pp else None,
+            )
+    director_ids = []
+    for m in crew_members:
+        if m.get("job") == "Director":
+            tid = m.get("id")
+            if tid:
+                director_ids.append(tid)
+                if tid not in tmdb_to_basic:
+                    pp = m.get("profile_path")
+                    tmdb_to_basic[tid] = (
+                        m.get("name"),
+                        f"{TMDB_IMG_BASE_URL}{pp}" if pp else None,
+                    )
+    return cast_members, director_ids, tmdb_to_basic
+
+def _store_movie(cur, tmdb_movie_id, movie_data, fetched=False):
+    """以現有 cursor 寫入一部電影及其演員、導演，不提交
+    回傳 (movie_id, 相關演員的 {tmdb_id: actor_id})
+    """
+    movie_id = upsert_movie(cur, *_parse_movie(tmdb_movie_id, movie_data), fetched=fetched)
+    cast_members, director_ids, tmdb_to_basic = _parse_credits(movie_data)
+
+    all_tmdb_ids = list(tmdb_to_basic.keys())
+    actor_id_map = {}
+    if all_tmdb_ids:
+        placeholders = ",".join(["%s"] * len(all_tmdb_ids))
+        cur.execute(
+            f"SELECT tmdb_id, actor_id FROM ACTOR WHERE tmdb_id IN ({placeholders})",
+            all_tmdb_ids,
+        )
+        for tid, aid in cur.fetchall() or []:
+            actor_id_map[tid] = aid
+
+        missing = [tid for tid in all_tmdb_ids if tid not in actor_id_map]
+        if missing:
+            values = [(tid, tmdb_to_basic[tid][0], tmdb_to_basic[tid][1]) for tid in missing]
+            cur.executemany(
+                """
+                INSERT INTO ACTOR (tmdb_id, name, profile_url)
+                VALUES (%s,%s,%s)
+                ON DUPLICATE KEY UPDATE
+                    name=VALUES(name),
+                    profile_url=VALUES(profile_url)
+                """,
+                values,
+            )
+            cur.execute(
+                f"SELECT tmdb_id, actor_id FROM ACTOR WHERE tmdb_id IN ({placeholders})",
+                all_tmdb_ids,
+            )
+            for tid, aid in cur.fetchall() or []:
+                actor_id_map[tid] = aid
+
+    if cast_members and actor_id_map:
+        cast_rows = []
+        for m in cast_members:
+            tid = m.get("id")
+            aid = actor_id_map.get(tid)
+            if aid:
+                cast_rows.append(
+                    (movie_id, aid, m.get("character"), m.get("order"))
+                )
+        if cast_rows:
+            cur.executemany(
+                """
+                INSERT IGNORE INTO MOVIE_CAST (movie_id, actor_id, character_name, billing_order)
+                VALUES (%s,%s,%s,%s)
+                """,
+                cast_rows,
+            )
+
+    if director_ids and actor_id_map:
+        dir_rows = []
+        for tid in director_ids:
+            aid = actor_id_map.get(tid)
+            if aid:
+                dir_rows.append((movie_id, aid))
+        if dir_rows:
+            cur.executemany(
+                """
+                INSERT IGNORE INTO DIRECTOR (movie_id, actor_id)
+                VALUES (%s,%s)
+                """,
+                dir_rows,
+            )
+
+    return movie_id, actor_id_map
+
+def store_actor(tmdb_actor_id, actor_data, fetched=False):
+    """將 TMDB 演員資料存入資料庫；fetched 為 True 表示 actor_data 是 /person/{id} 的完整資料"""
     conn = connect_db()
     cur = conn.cursor()
 
@@ -439,17 +973,14 @@ def store_actor(tmdb_actor_id, actor_data):
     #     return actor_id
 
     try:
-        # 解析演員資訊
-        name = actor_data.get("name")
-        profile_path = actor_data.get("profile_path")
-        profile_url = f"{TMDB_IMG_BASE_URL}{profile_path}" if profile_path else None
-        birthdate = actor_data.get("birthday")
-        country = actor_data.get("place_of_birth")
-        
-        # 儲存演員詳細資訊
-        actor_id = upsert_actor_detail(cur, tmdb_actor_id, name, profile_url, birthdate, country)
-        
+        actor_id = _store_actor(cur, tmdb_actor_id, actor_data, fetched)
+        credited = _credited_ids(cur, "actor_id", [actor_id])
         conn.commit()
+        known_actors.add(tmdb_actor_id)
+        note_write("ACTOR")
+        invalidate_actor_detail(actor_id)
+        # 電影詳細資料內嵌演員、導演的姓名與照片
+        invalidate_movie_detail(*credited)
         return actor_id
         
     except Exception:
@@ -459,29 +990,39 @@ def store_actor(tmdb_actor_id, actor_data):
         cur.close()
         conn.close()
 
-def insert_movie_cast_batch(actor_id, movie_ids, cast_members):
-    """批次更新/插入 MOVIE_CAST"""
+def store_actors(items):
+    """批次將多位 TMDB 演員資料存入資料庫，items 為 [(tmdb_id, actor_data), ...]
+    一個多列 INSERT ... ON DUPLICATE KEY UPDATE 加一次 id 查詢，整批只提交一次
+    回傳 {tmdb_id: actor_id}
+    """
+    actors = {tmdb_id: data for tmdb_id, data in items if tmdb_id}
+    if not actors:
+        return {}
     conn = connect_db()
     cur = conn.cursor()
-
     try:
-        cast_rows = []
-        for m in cast_members:
-            tid = m.get("id")
-            mid = movie_ids.get(tid)
-            if mid:
-                cast_rows.append(
-                    (mid, actor_id, m.get("character"), m.get("order"))
-                )
-        if cast_rows:
-            cur.executemany(
-                """
-                INSERT IGNORE INTO MOVIE_CAST (movie_id, actor_id, character_name, billing_order)
-                VALUES (%s,%s,%s,%s)
-                """,
-                cast_rows,
-            )
-        
+        conn.start_transaction()
+        _insert_rows(
+            cur,
+            "INSERT INTO ACTOR (tmdb_id, name, profile_url, birthdate, country) VALUES",
+            "(%s,%s,%s,%s,%s)",
+            [_parse_actor(tmdb_id, data) for tmdb_id, data in actors.items()],
+            """
+            ON DUPLICATE KEY UPDATE
+                name=COALESCE(VALUES(name), name),
+                profile_url=COALESCE(VALUES(profile_url), profile_url),
+                birthdate=COALESCE(VALUES(birthdate), birthdate),
+                country=COALESCE(VALUES(country), country)
+            """,
+        )
+        _, actor_id_map = _resolve_ids(cur, [], list(actors))
+        credited = _credited_ids(cur, "actor_id", actor_id_map.values())
+        conn.commit()
+        known_actors.add_many(actor_id_map)
+        note_write("ACTOR")
+        invalidate_actor_detail(*actor_id_map.values())
+        invalidate_movie_detail(*credited)
+        return actor_id_map
     except Exception:
         conn.rollback()
         raise
@@ -489,24 +1030,116 @@ def insert_movie_cast_batch(actor_id, movie_ids, cast_members):
         cur.close()
         conn.close()
 
-def insert_directors_batch(actor_id, movie_ids):
-    """批次更新/插入 DIRECTOR"""
+def _parse_actor(tmdb_actor_id, actor_data):
+    """TMDB 演員資料 -> ACTOR 欄位 (tmdb_id, name, profile_url, birthdate, country)"""
+    profile_path = actor_data.get("profile_path")
+    return (
+        tmdb_actor_id,
+        actor_data.get("name"),
+        f"{TMDB_IMG_BASE_URL}{profile_path}" if profile_path else None,
+        actor_data.get("birthday"),
+        actor_data.get("place_of_birth"),
+    )
+
+def _store_actor(cur, tmdb_actor_id, actor_data, fetched=False):
+    """以現有 cursor 寫入一位演員，不提交"""
+    return upsert_actor_detail(cur, *_parse_actor(tmdb_actor_id, actor_data), fetched=fetched)
+
+def filmography_fingerprint(cast_members, director_members):
+    """movie_credits 中會寫入 MOVIE_CAST / DIRECTOR 的內容摘要，內容相同時不需要重新同步
+    同一部電影出現多次時只取第一筆（與 (movie_id, actor_id) 唯一鍵一致）
+    """
+    cast = {}
+    for m in cast_members:
+        if m.get("id"):
+            cast.setdefault(m["id"], (m.get("character"), m.get("order")))
+    directors = sorted({m["id"] for m in director_members if m.get("id")})
+    payload = json.dumps([sorted(cast.items()), directors], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+def get_filmography_fingerprint(actor_id):
+    """上次完整同步時的 movie_credits 摘要，從未同步過回傳 None"""
+    with connect_read(f"actor:{actor_id}") as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT fingerprint FROM ACTOR_FILMOGRAPHY WHERE actor_id=%s", (actor_id,))
+        row = cur.fetchone()
+    return row[0] if row else None
+
+def sync_actor_filmography(actor_id, fingerprint, cast_rows, director_movie_ids, complete=True):
+    """以差集同步演員的 MOVIE_CAST / DIRECTOR，整個同步一個交易
+    - cast_rows 為 {movie_id: (character_name, billing_order)}，director_movie_ids 為 movie_id 集合
+    - 只新增缺少的列、刪除 TMDB 已沒有的列、更新角色名稱或順序有變的列
+    - complete 為 False（部分電影無法寫入）時不刪除也不記錄 fingerprint，下次重新比對
+    - fingerprint 與上次相同時（其他 worker 剛同步過）不做任何寫入
+    回傳 {"added": n, "removed": n, "updated": n}
+    """
+    counts = {"added": 0, "removed": 0, "updated": 0}
+    director_movie_ids = set(director_movie_ids)
     conn = connect_db()
     cur = conn.cursor()
-
     try:
-        dir_rows = []
-        for mid in movie_ids:
-            dir_rows.append((mid, actor_id))
-        if dir_rows:
+        conn.start_transaction()
+        # 鎖住同步記錄（不存在時鎖住間隙），同一演員的並行同步依序執行
+        cur.execute("SELECT fingerprint FROM ACTOR_FILMOGRAPHY WHERE actor_id=%s FOR UPDATE", (actor_id,))
+        row = cur.fetchone()
+        if row and row[0] == fingerprint:
+            conn.commit()
+            return counts
+
+        cur.execute(
+            "SELECT movie_id, character_name, billing_order FROM MOVIE_CAST WHERE actor_id=%s",
+            (actor_id,),
+        )
+        existing_cast = {mid: (character, order) for mid, character, order in cur.fetchall()}
+        cur.execute("SELECT movie_id FROM DIRECTOR WHERE actor_id=%s", (actor_id,))
+        existing_dirs = {mid for (mid,) in cur.fetchall()}
+
+        add_cast = [
+            (mid, actor_id, character, order)
+            for mid, (character, order) in cast_rows.items() if mid not in existing_cast
+        ]
+        changed_cast = [
+            (character, order, mid, actor_id)
+            for mid, (character, order) in cast_rows.items()
+            if mid in existing_cast and existing_cast[mid] != (character, order)
+        ]
+        add_dirs = [(mid, actor_id) for mid in director_movie_ids - existing_dirs]
+        remove_cast, remove_dirs = [], []
+        if complete:
+            remove_cast = [mid for mid in existing_cast if mid not in cast_rows]
+            remove_dirs = list(existing_dirs - director_movie_ids)
+
+        _insert_rows(
+            cur,
+            "INSERT IGNORE INTO MOVIE_CAST (movie_id, actor_id, character_name, billing_order) VALUES",
+            "(%s,%s,%s,%s)",
+            add_cast,
+        )
+        _insert_rows(cur, "INSERT IGNORE INTO DIRECTOR (movie_id, actor_id) VALUES", "(%s,%s)", add_dirs)
+        if changed_cast:
             cur.executemany(
+                "UPDATE MOVIE_CAST SET character_name=%s, billing_order=%s WHERE movie_id=%s AND actor_id=%s",
+                changed_cast,
+            )
+        if remove_cast:
+            cur.execute(
+                f"DELETE FROM MOVIE_CAST WHERE actor_id=%s AND movie_id IN ({','.join(['%s'] * len(remove_cast))})",
+                [actor_id] + remove_cast,
+            )
+        if remove_dirs:
+            cur.execute(
+                f"DELETE FROM DIRECTOR WHERE actor_id=%s AND movie_id IN ({','.join(['%s'] * len(remove_dirs))})",
+                [actor_id] + remove_dirs,
+            )
+        if complete:
+            cur.execute(
                 """
-                INSERT IGNORE INTO DIRECTOR (movie_id, actor_id)
-                VALUES (%s,%s)
+                INSERT INTO ACTOR_FILMOGRAPHY (actor_id, fingerprint) VALUES (%s,%s)
+                ON DUPLICATE KEY UPDATE fingerprint=VALUES(fingerprint)
                 """,
-                dir_rows,
+                (actor_id, fingerprint),
             )
-        
+        conn.commit()
     except Exception:
         conn.rollback()
         raise
@@ -514,6 +1147,92 @@ def insert_directors_batch(actor_id, movie_ids):
         cur.close()
         conn.close()
 
+    counts["added"] = len(add_cast) + len(add_dirs)
+    counts["removed"] = len(remove_cast) + len(remove_dirs)
+    counts["updated"] = len(changed_cast)
+    touched = {row[0] for row in add_cast} | {row[0] for row in add_dirs} \
+        | {row[2] for row in changed_cast} | set(remove_cast) | set(remove_dirs)
+    if touched:
+        note_write(f"actor:{actor_id}", *[f"movie:{mid}" for mid in touched])
+        invalidate_actor_detail(actor_id)
+        invalidate_movie_detail(*touched)
+    return counts
+
+# ==================== TMDB 變更同步 ====================
+
+# TMDB changes 的種類 -> (資料表, 主鍵)
+_CHANGE_TABLES = {
+    "movie": ("MOVIE", "movie_id"),
+    "person": ("ACTOR", "actor_id"),
+}
+
+def mark_tmdb_changed(kind, tmdb_ids):
+    """TMDB 回報有變更的 tmdb_id（kind 為 "movie" 或 "person"）：
+    已抓取過詳細資料的列設定 tmdb_changed_at，下次讀取或背景更新時重新抓取；回傳標記的列數
+    從未抓取過的列本來就會在第一次開啟詳細頁時抓取，不需要標記
+    """
+    table, pk = _CHANGE_TABLES[kind]
+    tmdb_ids = list(tmdb_ids)
+    marked = []
+    with connect_db() as conn:
+        cur = conn.cursor()
+        for start in range(0, len(tmdb_ids), INSERT_CHUNK_ROWS):
+            chunk = tmdb_ids[start:start + INSERT_CHUNK_ROWS]
+            cur.execute(
+                f"SELECT {pk} FROM {table} WHERE tmdb_id IN ({','.join(['%s'] * len(chunk))}) "
+                "AND last_fetched_at IS NOT NULL AND tmdb_changed_at IS NULL",
+                chunk,
+            )
+            ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                continue
+            # MOVIE.updated_at 保持不變：內容尚未改變，Last-Modified 不應前進；ACTOR.updated_at 本來就不會自動更新
+            cur.execute(
+                f"UPDATE {table} SET tmdb_changed_at=CURRENT_TIMESTAMP, updated_at=updated_at "
+                f"WHERE {pk} IN ({','.join(['%s'] * len(ids))}) AND tmdb_changed_at IS NULL",
+                ids,
+            )
+            marked.extend(ids)
+    if marked:
+        note_write(table, *[f"{table.lower()}:{i}" for i in marked])
+        # 快取的詳細資料與 ETag 失效，下次請求才會檢查是否需要重新抓取
+        if kind == "movie":
+            invalidate_movie_detail(*marked)
+        else:
+            invalidate_actor_detail(*marked)
+    return len(marked)
+
+def get_tmdb_changed(kind, limit):
+    """已標記變更、尚未重新抓取的 [(entity_id, tmdb_id)]，依標記時間排序"""
+    table, pk = _CHANGE_TABLES[kind]
+    with connect_db() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"SELECT {pk}, tmdb_id FROM {table} WHERE tmdb_changed_at IS NOT NULL "
+            "ORDER BY tmdb_changed_at LIMIT %s",
+            (limit,),
+        )
+        return cur.fetchall()
+
+def defer_tmdb_changed(kind, entity_id):
+    """重新抓取失敗：把標記時間改為現在，排到其他待抓取項目之後"""
+    table, pk = _CHANGE_TABLES[kind]
+    with connect_db() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            f"UPDATE {table} SET tmdb_changed_at=CURRENT_TIMESTAMP, updated_at=updated_at "
+            f"WHERE {pk}=%s AND tmdb_changed_at IS NOT NULL",
+            (entity_id,),
+        )
+
+def count_tmdb_changed(kind):
+    """已標記變更、尚未重新抓取的列數"""
+    table, _ = _CHANGE_TABLES[kind]
+    with connect_read() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT COUNT(*) FROM {table} WHERE tmdb_changed_at IS NOT NULL")
+        return cur.fetchone()[0]
+
 # ==================== 用戶管理 ====================
 
 def create_user(username, email, password_hash):
@@ -535,166 +1254,567 @@ def create_user(username, email, password_hash):
 
 def get_user_by_email(email):
     """根據 email 獲取用戶資料（含雜湊密碼）"""
-    conn = connect_db()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT user_id, username, email, password_hash FROM USER WHERE email = %s LIMIT 1", (email,))
-    user = cur.fetchone()
-    cur.close()
-    conn.close()
+    with connect_db() as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SELECT user_id, username, email, password_hash FROM USER WHERE email = %s LIMIT 1", (email,))
+        user = cur.fetchone()
     return user
 
+# ==================== 全文檢索 ====================
+
+_BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]')
+
+def fulltext_query(query):
+    """將使用者輸入轉為 ngram 全文索引的 BOOLEAN MODE 查詢
+    每個詞都必須出現（以片語比對，等同子字串比對）；
+    任何詞短於 ngram token 長度時無法使用索引，回傳 None 改用 LIKE
+    """
+    if not SEARCH_FULLTEXT:
+        return None
+    terms = _BOOLEAN_OPERATORS.sub(" ", query).split()
+    if not terms or any(len(t) < NGRAM_TOKEN_SIZE for t in terms):
+        return None
+    return " ".join(f'+"{t}"' for t in terms)
+
+# ==================== 分頁 ====================
+
+def encode_cursor(values):
+    """將排序鍵編碼為不透明的分頁 cursor"""
+    raw = json.dumps(values, default=str, ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor, size=2):
+    """解析分頁 cursor（size 個排序鍵），格式錯誤或排序鍵不是純量（字串、數字、null）時拋出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    # 陣列、物件會被當成查詢參數送進 MySQL 而出錯
+    if any(isinstance(v, bool) or not isinstance(v, (str, int, float, type(None))) for v in values):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return values
+
+def _search_filter(column, query):
+    """關鍵字條件：可用全文索引時用 MATCH，否則用 LIKE"""
+    if not query:
+        return [], []
+    ft_query = fulltext_query(query)
+    if ft_query:
+        return [f"MATCH({column}) AGAINST (%s IN BOOLEAN MODE)"], [ft_query]
+    return [f"{column} LIKE %s"], [f"%{query}%"]
+
+def _fetch_page(sql, params, limit):
+    """多取一列以判斷是否還有下一頁"""
+    with connect_read() as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(sql, params + [limit + 1])
+        return cur.fetchall()
+
+# ==================== 評論彙總 ====================
+
+REVIEW_BUCKETS = 10
+REVIEW_RATING_STEP = Decimal("0.1")  # REVIEW.rating 為 DECIMAL(3,1)
+MOVIE_SORTS = ('recent', 'user_rating')
+
+_BUCKET_COLUMNS = ", ".join(f"b{i}" for i in range(1, REVIEW_BUCKETS + 1))
+
+def normalize_rating(rating):
+    """評分四捨五入到 REVIEW.rating 的精度（與 MySQL 寫入 DECIMAL(3,1) 時相同），不在 0–10 時拋出 ValueError
+    彙總必須以寫入後的值計算，否則與從 REVIEW 重算的結果不一致
+    """
+    try:
+        value = Decimal(str(rating))
+    except (InvalidOperation, ValueError) as e:
+        raise ValueError(f"Invalid rating: {rating!r}") from e
+    if not value.is_finite() or not 0 <= value <= REVIEW_BUCKETS:
+        raise ValueError(f"Rating must be between 0 and {REVIEW_BUCKETS}: {rating!r}")
+    return value.quantize(REVIEW_RATING_STEP, ROUND_HALF_UP)
+
+def rating_bucket(rating):
+    """評分所屬的分布欄位編號：[0,1] -> 1，(N-1,N] -> N
+    與 SQL 的 LEAST(10, GREATEST(1, CEIL(rating))) 一致
+    """
+    return min(REVIEW_BUCKETS, max(1, math.ceil(Decimal(str(rating)))))
+
+def _review_stats(row):
+    """取出查詢中 agg_ 開頭的彙總欄位，組成 {'count', 'average', 'distribution', 'updated_at'}"""
+    distribution = row.pop('agg_distribution', None)
+    if isinstance(distribution, (bytes, bytearray)):
+        distribution = distribution.decode("utf-8")
+    if isinstance(distribution, str):
+        distribution = json.loads(distribution)
+    count = row.pop('agg_count', None)
+    average = row.pop('agg_avg', None)
+    updated_at = row.pop('agg_updated_at', None)
+    if not count:
+        # 沒有彙總列（尚無評論）時 LEFT JOIN 的欄位全為 NULL
+        return {'count': 0, 'average': None, 'distribution': [0] * REVIEW_BUCKETS, 'updated_at': None}
+    return {'count': count, 'average': average, 'distribution': distribution, 'updated_at': updated_at}
+
+def _rebuild_review_aggregate(cur, target_type, target_id):
+    """從 REVIEW 重新計算單一對象的彙總（彙總列遺失或不一致時使用）；已沒有評論時刪除彙總列"""
+    buckets = ", ".join(
+        f"SUM(LEAST({REVIEW_BUCKETS}, GREATEST(1, CEIL(rating))) = {i})" for i in range(1, REVIEW_BUCKETS + 1)
+    )
+    updates = ", ".join(f"{c} = VALUES({c})" for c in ["review_count", "rating_sum"] + _BUCKET_COLUMNS.split(", "))
+    cur.execute(f"""
+        INSERT INTO REVIEW_AGGREGATE (target_type, target_id, review_count, rating_sum, {_BUCKET_COLUMNS})
+        SELECT target_type, target_id, COUNT(*), SUM(rating), {buckets}
+        FROM REVIEW
+        WHERE target_type = %s AND target_id = %s
+        GROUP BY target_type, target_id
+        ON DUPLICATE KEY UPDATE {updates}
+    """, (target_type, target_id))
+    if cur.rowcount == 0:
+        # GROUP BY 沒有產生任何列（或內容未變）；沒有評論時不留下舊的彙總
+        cur.execute("""
+            DELETE FROM REVIEW_AGGREGATE
+            WHERE target_type = %s AND target_id = %s
+              AND NOT EXISTS (SELECT 1 FROM REVIEW WHERE target_type = %s AND target_id = %s)
+        """, (target_type, target_id, target_type, target_id))
+
+def _invalidate_review_target(target_type, target_id):
+    if target_type == 'MOVIE':
+        invalidate_movie_detail(target_id)
+    elif target_type == 'ACTOR':
+        invalidate_actor_detail(target_id)
+
+# ==================== 詳細資料快取 ====================
+
+# 每筆詳細資料的版本存在共用快取的 detail_gen:{命名空間}:{id}，每次失效換成新值；
+# 讀取前後版本不同表示查詢期間有寫入（可能來自其他 worker），結果不寫回快取
+
+def invalidate_movie_detail(*movie_ids):
+    """使指定電影的詳細資料快取失效（寫入後呼叫，同時記錄 read-your-writes）"""
+    note_write(*(f"movie:{i}" for i in movie_ids if i))
+    _invalidate_details("movie_detail", movie_ids)
+
+def invalidate_actor_detail(*actor_ids):
+    """使指定演員的詳細資料快取失效（寫入後呼叫，同時記錄 read-your-writes）"""
+    note_write(*(f"actor:{i}" for i in actor_ids if i))
+    _invalidate_details("actor_detail", actor_ids)
+
+def _invalidate_details(namespace, ids):
+    # 先換版本再刪除：刪除之後才寫回的讀取者，寫回後再比對版本時一定會看到變化
+    for i in {i for i in ids if i}:
+        response_cache.set(f"detail_gen:{namespace}:{i}", uuid.uuid4().hex, ttl=response_cache.ttl_for(namespace))
+        response_cache.delete(f"{namespace}:{i}")
+        response_cache.delete(f"etag:{namespace}:{i}")
+
+def detail_version(namespace, detail_id):
+    """共用快取中的詳細資料版本；讀取資料庫前記下，寫回快取前後比對（None 表示近期沒有失效）"""
+    return response_cache.get(f"detail_gen:{namespace}:{detail_id}")
+
+def cache_if_current(namespace, detail_id, version, key, value, ttl=None):
+    """版本仍為 version 時寫入 key；寫入後再比對一次，期間被失效（例如其他 worker 寫入）就刪除
+    回傳是否保留寫入的值
+    """
+    if detail_version(namespace, detail_id) != version:
+        return False
+    response_cache.set(key, value, ttl=ttl)
+    if detail_version(namespace, detail_id) != version:
+        response_cache.delete(key)
+        return False
+    return True
+
+_JSON_DATE_FIELDS = {'birthdate'}
+_JSON_DATETIME_FIELDS = {'created_at'}
+_JSON_INT_FIELDS = {'release_year'}
+
+def _json_rows(value):
+    """解析 JSON_ARRAYAGG 結果，還原成與一般查詢相同的型別（DECIMAL、DATE、TIMESTAMP）"""
+    if value is None:
+        return []
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode("utf-8")
+    rows = json.loads(value, parse_float=Decimal) if isinstance(value, str) else value
+    for row in rows:
+        for key, v in row.items():
+            if not isinstance(v, str):
+                continue
+            if key in _JSON_DATE_FIELDS:
+                row[key] = date.fromisoformat(v[:10])
+            elif key in _JSON_DATETIME_FIELDS:
+                row[key] = datetime.fromisoformat(v)
+            elif key in _JSON_INT_FIELDS and v.isdigit():
+                row[key] = int(v)
+    return rows
+
 # ==================== 電影查詢 ====================
 
-def search_movies(query, page=1, limit=20):
-    """搜尋電影"""
+_MOVIE_LIST_COLUMNS = """
+    m.movie_id, m.title, m.release_year, m.genre, m.rating, m.poster_url,
+    COALESCE(ra.review_count, 0) AS review_count, ra.rating_avg AS user_rating
+"""
+
+def search_movies(query, page=1, limit=20, sort='recent'):
+    """搜尋電影（有關鍵字時以全文索引依相關度排序）
+    sort='user_rating' 依社群評分（REVIEW_AGGREGATE）由高到低，只列出有評論的電影，
+    排序走 idx_review_agg_avg 索引，不需掃描 REVIEW
+    """
     offset = (page - 1) * limit
-    conn = connect_db()
-    cur = conn.cursor(dictionary=True)
-    
-    if query:
-        sql = """
-            SELECT movie_id, title, release_year, genre, rating, poster_url
-            FROM MOVIE
-            WHERE title LIKE %s
-            ORDER BY created_at DESC
+    ft_query = fulltext_query(query) if query else None
+    if sort == 'user_rating':
+        where, params = _search_filter("m.title", query)
+        sql = f"""
+            SELECT {_MOVIE_LIST_COLUMNS}
+            FROM REVIEW_AGGREGATE ra
+            JOIN MOVIE m ON m.movie_id = ra.target_id
+            WHERE {" AND ".join(["ra.target_type = 'MOVIE'"] + where)}
+            ORDER BY ra.rating_avg DESC, ra.review_count DESC, ra.target_id DESC
+            LIMIT %s OFFSET %s
+        """
+        params = tuple(params) + (limit, offset)
+    elif ft_query:
+        sql = f"""
+            SELECT {_MOVIE_LIST_COLUMNS}
+            FROM MOVIE m
+            LEFT JOIN REVIEW_AGGREGATE ra ON ra.target_type = 'MOVIE' AND ra.target_id = m.movie_id
+            WHERE MATCH(m.title) AGAINST (%s IN BOOLEAN MODE)
+            ORDER BY MATCH(m.title) AGAINST (%s IN BOOLEAN MODE) DESC, m.created_at DESC, m.movie_id DESC
+            LIMIT %s OFFSET %s
+        """
+        params = (ft_query, ft_query, limit, offset)
+    elif query:
+        sql = f"""
+            SELECT {_MOVIE_LIST_COLUMNS}
+            FROM MOVIE m
+            LEFT JOIN REVIEW_AGGREGATE ra ON ra.target_type = 'MOVIE' AND ra.target_id = m.movie_id
+            WHERE m.title LIKE %s
+            ORDER BY m.created_at DESC, m.movie_id DESC
             LIMIT %s OFFSET %s
         """
-        cur.execute(sql, (f'%{query}%', limit, offset))
+        params = (f'%{query}%', limit, offset)
     else:
-        sql = """
-            SELECT movie_id, title, release_year, genre, rating, poster_url
-            FROM MOVIE
-            ORDER BY created_at DESC
+        sql = f"""
+            SELECT {_MOVIE_LIST_COLUMNS}
+            FROM MOVIE m
+            LEFT JOIN REVIEW_AGGREGATE ra ON ra.target_type = 'MOVIE' AND ra.target_id = m.movie_id
+            ORDER BY m.created_at DESC, m.movie_id DESC
             LIMIT %s OFFSET %s
         """
-        cur.execute(sql, (limit, offset))
-    movies = cur.fetchall()
-    
-    cur.close()
-    conn.close()
+        params = (limit, offset)
+    with connect_read() as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(sql, params)
+        movies = cur.fetchall()
+    return movies
+
+def search_movies_after(query, cursor=None, limit=20, sort='recent'):
+    """以 keyset 分頁搜尋電影，依 (created_at, movie_id) 由新到舊
+    cursor 為上一頁回傳的 next_cursor（None 表示第一頁），回傳 (movies, next_cursor)
+    有關鍵字時仍以全文索引過濾，但排序固定為時間順序（相關度無法作為 keyset）
+    sort='user_rating' 改依 (rating_avg, review_count, movie_id) 由高到低，只列出有評論的電影
+    """
+    where, params = _search_filter("m.title", query)
+    if sort == 'user_rating':
+        where.insert(0, "ra.target_type = 'MOVIE'")
+        if cursor:
+            avg, count, movie_id = decode_cursor(cursor, 3)
+            where.append(
+                "(ra.rating_avg < %s OR (ra.rating_avg = %s AND (ra.review_count < %s"
+                " OR (ra.review_count = %s AND ra.target_id < %s))))"
+            )
+            params.extend([avg, avg, count, count, movie_id])
+        sql = f"""
+            SELECT {_MOVIE_LIST_COLUMNS}
+            FROM REVIEW_AGGREGATE ra
+            JOIN MOVIE m ON m.movie_id = ra.target_id
+            WHERE {" AND ".join(where)}
+            ORDER BY ra.rating_avg DESC, ra.review_count DESC, ra.target_id DESC
+            LIMIT %s
+        """
+        rows = _fetch_page(sql, params, limit)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor([last['user_rating'], last['review_count'], last['movie_id']])
+        return rows, next_cursor
+
+    if cursor:
+        created_at, movie_id = decode_cursor(cursor)
+        where.append("(m.created_at < %s OR (m.created_at = %s AND m.movie_id < %s))")
+        params.extend([created_at, created_at, movie_id])
+    sql = f"""
+        SELECT {_MOVIE_LIST_COLUMNS}, m.created_at
+        FROM MOVIE m
+        LEFT JOIN REVIEW_AGGREGATE ra ON ra.target_type = 'MOVIE' AND ra.target_id = m.movie_id
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY m.created_at DESC, m.movie_id DESC
+        LIMIT %s
+    """
+    rows = _fetch_page(sql, params, limit)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]['created_at'], rows[-1]['movie_id']])
+    for row in rows:
+        del row['created_at']
+    return rows, next_cursor
+
+_MOVIE_DETAIL_SQL = """
+    SELECT m.*,
+      (SELECT JSON_ARRAYAGG(JSON_OBJECT(
+          'actor_id', a.actor_id, 'name', a.name, 'birthdate', a.birthdate,
+          'country', a.country, 'profile_url', a.profile_url,
+          'character_name', mc.character_name, 'billing_order', mc.billing_order))
+       FROM MOVIE_CAST mc JOIN ACTOR a ON a.actor_id = mc.actor_id
+       WHERE mc.movie_id = m.movie_id) AS actors_json,
+      (SELECT JSON_ARRAYAGG(JSON_OBJECT(
+          'actor_id', a.actor_id, 'name', a.name, 'birthdate', a.birthdate,
+          'country', a.country, 'profile_url', a.profile_url))
+       FROM DIRECTOR d JOIN ACTOR a ON a.actor_id = d.actor_id
+       WHERE d.movie_id = m.movie_id) AS directors_json,
+      (SELECT JSON_ARRAYAGG(JSON_OBJECT(
+          'review_id', r.review_id, 'rating', r.rating, 'title', r.title,
+          'body', r.body, 'created_at', r.created_at, 'username', u.username))
+       FROM REVIEW r JOIN USER u ON r.user_id = u.user_id
+       WHERE r.target_type = 'MOVIE' AND r.target_id = m.movie_id) AS reviews_json,
+      ra.review_count AS agg_count, ra.rating_avg AS agg_avg, ra.updated_at AS agg_updated_at,
+      JSON_ARRAY(ra.b1, ra.b2, ra.b3, ra.b4, ra.b5, ra.b6, ra.b7, ra.b8, ra.b9, ra.b10) AS agg_distribution
+    FROM MOVIE m
+    LEFT JOIN REVIEW_AGGREGATE ra ON ra.target_type = 'MOVIE' AND ra.target_id = m.movie_id
+    WHERE m.movie_id IN ({ids})
+"""
+
+class SharedRead:
+    """批次讀取共用一條唯讀連線：第一次需要時才借出（全部命中快取就不借），離開 with 區塊時歸還"""
+
+    def __init__(self, *keys):
+        self._keys = keys
+        self._conn = None
+        self._depth = 0
+
+    def cursor(self, *args, **kwargs):
+        if self._conn is None:
+            self._conn = connect_read(*self._keys)
+        return self._conn.cursor(*args, **kwargs)
+
+    def __enter__(self):
+        self._depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 巢狀使用時只有最外層離開才歸還
+        self._depth -= 1
+        if self._depth == 0 and self._conn is not None:
+            self._conn.__exit__(exc_type, exc, tb)
+            self._conn = None
+
+def _cached_details(namespace, ids):
+    """回傳 (已快取的 {id: 文件}, 未命中的 id 清單)，id 去除重複
+    文件為快取內容的複本，呼叫端修改不會影響快取（記憶體後端回傳的是同一個物件）
+    """
+    found, misses = {}, []
+    for i in dict.fromkeys(ids):
+        doc = response_cache.get(f"{namespace}:{i}")
+        if doc is not None:
+            found[i] = copy.deepcopy(doc)
+        else:
+            misses.append(i)
+    return found, misses
+
+def get_movie_details(movie_ids, shared=None):
+    """批次獲取電影詳細資訊（含演員、導演、評論），回傳 {movie_id: movie}，找不到的 id 不在結果中
+    先查快取，未命中的以一次 IN 查詢取回並各自快取；shared 為批次共用的 SharedRead
+    """
+    movies, misses = _cached_details("movie_detail", movie_ids)
+    if not misses:
+        return movies
+
+    versions = {i: detail_version("movie_detail", i) for i in misses}
+    with (shared or SharedRead(*(f"movie:{i}" for i in misses))) as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(_MOVIE_DETAIL_SQL.format(ids=", ".join(["%s"] * len(misses))), misses)
+        rows = cur.fetchall()
+
+    for movie in rows:
+        # JSON_ARRAYAGG 不保證順序，依原本各查詢的 ORDER BY 排序
+        movie['actors'] = sorted(
+            _json_rows(movie.pop('actors_json')),
+            key=lambda r: (r['billing_order'] is not None, r['billing_order'] or 0),
+        )
+        movie['directors'] = _json_rows(movie.pop('directors_json'))
+        movie['reviews'] = sorted(
+            _json_rows(movie.pop('reviews_json')),
+            key=lambda r: r['created_at'] or datetime.min,
+            reverse=True,
+        )
+        movie['review_stats'] = _review_stats(movie)
+        movie_id = movie['movie_id']
+        cache_if_current("movie_detail", movie_id, versions.get(movie_id),
+                         f"movie_detail:{movie_id}", copy.deepcopy(movie))
+        movies[movie_id] = movie
     return movies
 
 def get_movie_detail(movie_id):
-    """獲取電影詳細資訊（含演員、導演、評論）"""
-    conn = connect_db()
-    cur = conn.cursor(dictionary=True)
-    
-    cur.execute("SELECT * FROM MOVIE WHERE movie_id = %s", (movie_id,))
-    movie = cur.fetchone()
-    if not movie:
-        cur.close()
-        conn.close()
-        return None
-    
-    cur.execute("""
-        SELECT a.actor_id, a.name, a.birthdate, a.country, a.profile_url, mc.character_name, mc.billing_order
-        FROM ACTOR a
-        JOIN MOVIE_CAST mc ON a.actor_id = mc.actor_id
-        WHERE mc.movie_id = %s
-        ORDER BY mc.billing_order
-    """, (movie_id,))
-    movie['actors'] = cur.fetchall()
-    
-    cur.execute("""
-        SELECT a.actor_id, a.name, a.birthdate, a.country, a.profile_url
-        FROM ACTOR a
-        JOIN DIRECTOR d ON a.actor_id = d.actor_id
-        WHERE d.movie_id = %s
-    """, (movie_id,))
-    movie['directors'] = cur.fetchall()
-    
-    cur.execute("""
-        SELECT r.review_id, r.rating, r.title, r.body, r.created_at, u.username
-        FROM REVIEW r
-        JOIN USER u ON r.user_id = u.user_id
-        WHERE r.target_type = 'MOVIE' AND r.target_id = %s
-        ORDER BY r.created_at DESC
-    """, (movie_id,))
-    movie['reviews'] = cur.fetchall()
-    
-    cur.close()
-    conn.close()
-    return movie
+    """獲取電影詳細資訊（含演員、導演、評論）
+    以 JSON 彙總在一次查詢中取回，組好的文件依 movie_id 快取，寫入時失效
+    """
+    return get_movie_details([movie_id]).get(movie_id)
 
 # ==================== 演員查詢 ====================
 
 def search_actors(query, page=1, limit=20):
-    """搜尋演員"""
+    """搜尋演員（有關鍵字時以全文索引依相關度排序）"""
     offset = (page - 1) * limit
-    conn = connect_db()
-    cur = conn.cursor(dictionary=True)
-    
-    if query:
+    ft_query = fulltext_query(query) if query else None
+    if ft_query:
+        sql = """
+            SELECT actor_id, name, birthdate, country, profile_url
+            FROM ACTOR
+            WHERE MATCH(name) AGAINST (%s IN BOOLEAN MODE)
+            ORDER BY MATCH(name) AGAINST (%s IN BOOLEAN MODE) DESC, name, actor_id
+            LIMIT %s OFFSET %s
+        """
+        params = (ft_query, ft_query, limit, offset)
+    elif query:
         sql = """
             SELECT actor_id, name, birthdate, country, profile_url
             FROM ACTOR
             WHERE name LIKE %s
-            ORDER BY name
+            ORDER BY name, actor_id
             LIMIT %s OFFSET %s
         """
-        cur.execute(sql, (f'%{query}%', limit, offset))
+        params = (f'%{query}%', limit, offset)
     else:
         sql = """
             SELECT actor_id, name, birthdate, country, profile_url
             FROM ACTOR
-            ORDER BY name
+            ORDER BY name, actor_id
             LIMIT %s OFFSET %s
         """
-        cur.execute(sql, (limit, offset))
-    actors = cur.fetchall()
-    
-    cur.close()
-    conn.close()
+        params = (limit, offset)
+    with connect_read() as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(sql, params)
+        actors = cur.fetchall()
+    return actors
+
+def search_actors_after(query, cursor=None, limit=20):
+    """以 keyset 分頁搜尋演員，依 (name, actor_id) 排序
+    cursor 為上一頁回傳的 next_cursor（None 表示第一頁），回傳 (actors, next_cursor)
+    """
+    where, params = _search_filter("name", query)
+    if cursor:
+        name, actor_id = decode_cursor(cursor)
+        where.append("(name > %s OR (name = %s AND actor_id > %s))")
+        params.extend([name, name, actor_id])
+    sql = f"""
+        SELECT actor_id, name, birthdate, country, profile_url
+        FROM ACTOR
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY name, actor_id
+        LIMIT %s
+    """
+    rows = _fetch_page(sql, params, limit)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1]['name'], rows[-1]['actor_id']])
+    return rows, next_cursor
+
+_ACTOR_DETAIL_SQL = """
+    SELECT a.*,
+      (SELECT JSON_ARRAYAGG(JSON_OBJECT(
+          'movie_id', m.movie_id, 'title', m.title, 'release_year', m.release_year,
+          'genre', m.genre, 'rating', m.rating, 'poster_url', m.poster_url,
+          'character_name', mc.character_name))
+       FROM MOVIE m JOIN MOVIE_CAST mc ON m.movie_id = mc.movie_id
+       WHERE mc.actor_id = a.actor_id) AS movies_as_actor_json,
+      (SELECT JSON_ARRAYAGG(JSON_OBJECT(
+          'movie_id', m.movie_id, 'title', m.title, 'release_year', m.release_year,
+          'genre', m.genre, 'rating', m.rating, 'poster_url', m.poster_url))
+       FROM MOVIE m JOIN DIRECTOR d ON m.movie_id = d.movie_id
+       WHERE d.actor_id = a.actor_id) AS movies_as_director_json,
+      ra.review_count AS agg_count, ra.rating_avg AS agg_avg, ra.updated_at AS agg_updated_at,
+      JSON_ARRAY(ra.b1, ra.b2, ra.b3, ra.b4, ra.b5, ra.b6, ra.b7, ra.b8, ra.b9, ra.b10) AS agg_distribution
+    FROM ACTOR a
+    LEFT JOIN REVIEW_AGGREGATE ra ON ra.target_type = 'ACTOR' AND ra.target_id = a.actor_id
+    WHERE a.actor_id IN ({ids})
+"""
+
+def get_actor_details(actor_ids, shared=None):
+    """批次獲取演員詳細資訊（含參演電影），回傳 {actor_id: actor}，找不到的 id 不在結果中
+    先查快取，未命中的以一次 IN 查詢取回並各自快取；shared 為批次共用的 SharedRead
+    """
+    actors, misses = _cached_details("actor_detail", actor_ids)
+    if not misses:
+        return actors
+
+    versions = {i: detail_version("actor_detail", i) for i in misses}
+    with (shared or SharedRead(*(f"actor:{i}" for i in misses))) as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(_ACTOR_DETAIL_SQL.format(ids=", ".join(["%s"] * len(misses))), misses)
+        rows = cur.fetchall()
+
+    by_year_desc = lambda r: (r['release_year'] is not None, r['release_year'] or 0)
+    for actor in rows:
+        actor['movies_as_actor'] = sorted(_json_rows(actor.pop('movies_as_actor_json')), key=by_year_desc, reverse=True)
+        actor['movies_as_director'] = sorted(_json_rows(actor.pop('movies_as_director_json')), key=by_year_desc, reverse=True)
+        actor['review_stats'] = _review_stats(actor)
+        actor_id = actor['actor_id']
+        cache_if_current("actor_detail", actor_id, versions.get(actor_id),
+                         f"actor_detail:{actor_id}", copy.deepcopy(actor))
+        actors[actor_id] = actor
     return actors
 
 def get_actor_detail(actor_id):
-    """獲取演員詳細資訊（含參演電影）"""
-    conn = connect_db()
-    cur = conn.cursor(dictionary=True)
-    
-    cur.execute("SELECT * FROM ACTOR WHERE actor_id = %s", (actor_id,))
-    actor = cur.fetchone()
-    if not actor:
-        cur.close()
-        conn.close()
-        return None
-    
-    cur.execute("""
-        SELECT m.movie_id, m.title, m.release_year, m.genre, m.rating, m.poster_url, mc.character_name
-        FROM MOVIE m
-        JOIN MOVIE_CAST mc ON m.movie_id = mc.movie_id
-        WHERE mc.actor_id = %s
-        ORDER BY m.release_year DESC
-    """, (actor_id,))
-    actor['movies_as_actor'] = cur.fetchall()
-    
-    cur.execute("""
-        SELECT m.movie_id, m.title, m.release_year, m.genre, m.rating, m.poster_url
-        FROM MOVIE m
-        JOIN DIRECTOR d ON m.movie_id = d.movie_id
-        WHERE d.actor_id = %s
-        ORDER BY m.release_year DESC
-    """, (actor_id,))
-    actor['movies_as_director'] = cur.fetchall()
-    
-    cur.close()
-    conn.close()
-    return actor
+    """獲取演員詳細資訊（含參演電影）
+    以 JSON 彙總在一次查詢中取回，組好的文件依 actor_id 快取，寫入時失效
+    """
+    return get_actor_details([actor_id]).get(actor_id)
 
 # ==================== 評論管理 ====================
 
 def add_review(user_id, target_type, target_id, rating, title, body):
-    """新增或更新評論"""
+    """新增或更新評論，並在同一交易內增量更新 REVIEW_AGGREGATE
+    先以 FOR UPDATE 鎖住該使用者對此對象的評論（不存在時鎖住間隙），
+    依是否已有舊評分決定彙總是計數加一，還是把舊評分移到新評分
+    """
+    rating = normalize_rating(rating)
+    new_bucket = rating_bucket(rating)
     conn = connect_db()
     cur = conn.cursor()
-    
+
     try:
+        conn.start_transaction()
+        cur.execute("""
+            SELECT rating FROM REVIEW
+            WHERE user_id = %s AND target_type = %s AND target_id = %s
+            FOR UPDATE
+        """, (user_id, target_type, target_id))
+        row = cur.fetchone()
+        old_rating = row[0] if row else None
         cur.execute("""
             INSERT INTO REVIEW (user_id, target_type, target_id, rating, title, body)
             VALUES (%s, %s, %s, %s, %s, %s)
             ON DUPLICATE KEY UPDATE rating=VALUES(rating), title=VALUES(title), body=VALUES(body)
         """, (user_id, target_type, target_id, rating, title, body))
+        new = f"b{new_bucket}"
+        if old_rating is None:
+            cur.execute(f"""
+                INSERT INTO REVIEW_AGGREGATE (target_type, target_id, review_count, rating_sum, {new})
+                VALUES (%s, %s, 1, %s, 1)
+                ON DUPLICATE KEY UPDATE review_count = review_count + 1,
+                    rating_sum = rating_sum + VALUES(rating_sum), {new} = {new} + 1
+            """, (target_type, target_id, rating))
+        elif old_rating != rating:
+            old = f"b{rating_bucket(old_rating)}"
+            moves = "" if old == new else f", {old} = IF({old} > 0, {old} - 1, 0), {new} = {new} + 1"
+            cur.execute(f"""
+                UPDATE REVIEW_AGGREGATE SET rating_sum = rating_sum + %s{moves}
+                WHERE target_type = %s AND target_id = %s
+            """, (rating - old_rating, target_type, target_id))
+            if cur.rowcount == 0:
+                # 彙總列不存在（例如建表前的評論尚未回填），直接從 REVIEW 重算
+                _rebuild_review_aggregate(cur, target_type, target_id)
         conn.commit()
+        _invalidate_review_target(target_type, target_id)
         return True
     except Exception as e:
         conn.rollback()
@@ -705,35 +1825,106 @@ def add_review(user_id, target_type, target_id, rating, title, body):
 
 def get_movie_reviews(movie_id):
     """獲取電影評論"""
-    conn = connect_db()
-    cur = conn.cursor(dictionary=True)
-    
-    cur.execute("""
-        SELECT r.review_id, r.rating, r.title, r.body, r.created_at, u.username, u.email
-        FROM REVIEW r
-        JOIN USER u ON r.user_id = u.user_id
-        WHERE r.target_type = 'MOVIE' AND r.target_id = %s
-        ORDER BY r.created_at DESC
-    """, (movie_id,))
-    reviews = cur.fetchall()
-    
-    cur.close()
-    conn.close()
+    return get_reviews([('MOVIE', movie_id)])[('MOVIE', movie_id)]
+
+def get_reviews(targets, shared=None):
+    """批次獲取多個對象的評論，targets 為 (target_type, target_id) 清單
+    以一次查詢取回，回傳 {(target_type, target_id): [review, ...]}（新到舊，沒有評論時為空清單）
+    """
+    targets = list(dict.fromkeys(targets))
+    reviews = {t: [] for t in targets}
+    if not targets:
+        return reviews
+    keys = [f"{t.lower()}:{i}" for t, i in targets]
+    with (shared or SharedRead(*keys)) as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(f"""
+            SELECT r.target_type, r.target_id,
+                   r.review_id, r.rating, r.title, r.body, r.created_at, u.username, u.email
+            FROM REVIEW r
+            JOIN USER u ON r.user_id = u.user_id
+            WHERE (r.target_type, r.target_id) IN ({", ".join(["(%s, %s)"] * len(targets))})
+            ORDER BY r.created_at DESC
+        """, [v for t in targets for v in t])
+        for row in cur.fetchall():
+            reviews[(row.pop('target_type'), row.pop('target_id'))].append(row)
     return reviews
 
+def get_batch(movie_ids=(), actor_ids=(), review_targets=()):
+    """以一條連線批次取回電影詳細資料、演員詳細資料與評論（快取命中的部分不查詢）
+    回傳 (movies, actors, reviews)，格式同 get_movie_details / get_actor_details / get_reviews
+    """
+    keys = [f"movie:{i}" for i in movie_ids] + [f"actor:{i}" for i in actor_ids] \
+        + [f"{t.lower()}:{i}" for t, i in review_targets]
+    with SharedRead(*keys) as shared:
+        movies = get_movie_details(movie_ids, shared)
+        actors = get_actor_details(actor_ids, shared)
+        reviews = get_reviews(review_targets, shared)
+    return movies, actors, reviews
+
 # ==================== SQL 指令執行 ====================
 
-def execute_sql_query(command):
-    """執行 SQL 查詢（僅限 SELECT）"""
-    conn = connect_db()
-    cur = conn.cursor(dictionary=True)
-    
-    try:
-        cur.execute(command)
-        results = cur.fetchall()
-        return results
-    except Exception as e:
-        raise e
-    finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+_SELECT_KEYWORD = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+
+def _with_time_limit(command):
+    """在最外層 SELECT 加上 MAX_EXECUTION_TIME 提示（MySQL 只對唯讀 SELECT 生效）"""
+    if CMD_MAX_EXECUTION_MS <= 0 or "MAX_EXECUTION_TIME" in command.upper():
+        return command
+    return _SELECT_KEYWORD.sub(lambda m: f"{m.group(0)} /*+ MAX_EXECUTION_TIME({CMD_MAX_EXECUTION_MS}) */", command, count=1)
+
+class SqlQueryStream:
+    """/api/cmd 的查詢結果，以未緩衝的 cursor 分批讀取
+    - 連線來自 cmd_pool，讀完、達到 max_rows 或 close() 時歸還
+    - 達到 max_rows 時不再讀取剩下的列，直接關閉連線（truncated = True）
+    - 非查詢語句（沒有結果集）時 rows 為受影響的列數，迭代不產生任何列
+    """
+
+    def __init__(self, command, max_rows=CMD_MAX_ROWS, fetch_size=CMD_FETCH_SIZE):
+        global cmd_pool
+        if cmd_pool is None:
+            init_db_pool()
+        self.max_rows = max_rows
+        self.fetch_size = fetch_size
+        self.rows = 0
+        self.truncated = False
+        self._conn = cmd_pool.get_connection()
+        try:
+            self._cur = self._conn.cursor(dictionary=True)
+            self._cur.execute(_with_time_limit(command))
+        except Exception:
+            self._conn.close()
+            raise
+        self.has_result = self._cur.description is not None
+        self.columns = [d[0] for d in self._cur.description] if self.has_result else []
+        if not self.has_result:
+            self.rows = max(self._cur.rowcount, 0)
+            self.close()
+
+    def __iter__(self):
+        try:
+            while self.has_result and self._conn is not None:
+                batch = self._cur.fetchmany(min(self.fetch_size, self.max_rows - self.rows + 1))
+                if not batch:
+                    break
+                if self.rows + len(batch) > self.max_rows:
+                    batch = batch[:self.max_rows - self.rows]
+                    self.truncated = True
+                self.rows += len(batch)
+                yield from batch
+                if self.truncated:
+                    break
+        finally:
+            self.close()
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if self.truncated or (self.has_result and conn.unread_result):
+            conn.discard()
+        else:
+            conn.close()
+
+def execute_sql_query(command, max_rows=CMD_MAX_ROWS):
+    """執行 SQL 查詢，一次回傳全部結果（最多 max_rows 列）"""
+    return list(SqlQueryStream(command, max_rows))
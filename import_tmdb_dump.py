@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+TMDB 匯出檔大量匯入腳本
+- 目的：不經過 API 請求，直接把本機的 TMDB 匯出檔寫入 MOVIE、ACTOR、MOVIE_CAST、DIRECTOR。
+- 支援的檔案（每行一個 JSON，可為 .gz）：
+    * 每日 ID 匯出檔（movie_ids_MM_DD_YYYY.json.gz、person_ids_MM_DD_YYYY.json.gz）：只補上不存在的電影／人物，不覆寫既有資料
+    * 完整詳細資料（/movie/{id}?append_to_response=credits、/person/{id} 的回應）：與 store_movies / store_actors 相同的合併方式寫入
+- 解析在多個程序中平行進行，主程序以多列 INSERT 依批次寫入（每批一個交易）。
+- 匯入期間設定 @skip_entity_triggers 略過 ENTITY 新增觸發器，結束時再一次回填 ENTITY
+  （資料庫需先套用 MySQL.migrations.sql 的「大量匯入」區段）。
+- 每批提交後把各檔案已處理的行數寫入 checkpoint 檔，中斷後以相同參數重新執行即從該處繼續。
+- 連線設定：由環境變數讀取 MYSQL* 設定（與應用一致）。
+
+使用範例：
+    匯入電影與人物的每日 ID 匯出檔
+        python import_tmdb_dump.py --movies movie_ids_05_01_2026.json.gz --people person_ids_05_01_2026.json.gz
+    匯入完整詳細資料，8 個解析程序、每批 2000 行
+        python import_tmdb_dump.py --movies movie_details.jsonl.gz --workers 8 --batch-lines 2000
+    只回填 ENTITY（例如匯入中斷且不打算繼續）
+        python import_tmdb_dump.py --backfill-only
+
+注意：
+- 執行中的應用程式不會知道匯入的資料，已快取的詳細資料在 CACHE_TTL_DETAIL 後才會更新。
+- ON DUPLICATE KEY 合併需要逐列比對唯一鍵，因此使用多列 INSERT 而非 LOAD DATA LOCAL INFILE。
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+import itertools
+from collections import deque
+from multiprocessing import Pool
+import mysql.connector
+from database import _parse_movie, _parse_credits, _parse_actor, _insert_rows, _resolve_ids
+
+DEFAULT_CHECKPOINT = "import_tmdb_dump.checkpoint.json"
+
+# 表 -> (ENTITY 類型, 主鍵)
+ENTITY_TABLES = {
+    "MOVIE": ("MOVIE", "movie_id"),
+    "ACTOR": ("ACTOR", "actor_id"),
+    "MOVIE_CAST": ("MOVIE_CAST", "cast_id"),
+    "DIRECTOR": ("DIRECTOR", "director_id"),
+}
+
+MOVIE_MERGE = """
+    ON DUPLICATE KEY UPDATE
+      title=COALESCE(VALUES(title), title),
+      release_year=COALESCE(VALUES(release_year), release_year),
+      genre=COALESCE(VALUES(genre), genre),
+      runtime=COALESCE(VALUES(runtime), runtime),
+      overview=COALESCE(VALUES(overview), overview),
+      rating=COALESCE(VALUES(rating), rating),
+      poster_url=COALESCE(VALUES(poster_url), poster_url)
+"""
+ACTOR_MERGE = """
+    ON DUPLICATE KEY UPDATE
+        name=COALESCE(VALUES(name), name),
+        profile_url=COALESCE(VALUES(profile_url), profile_url),
+        birthdate=COALESCE(VALUES(birthdate), birthdate),
+        country=COALESCE(VALUES(country), country)
+"""
+# 已存在的資料保持不變，只補上缺少的
+KEEP_EXISTING = "ON DUPLICATE KEY UPDATE tmdb_id=tmdb_id"
+
+
+def get_db_conn():
+    conn = mysql.connector.connect(
+        host=os.getenv("MYSQLHOST", "localhost"),
+        database=os.getenv("MYSQLDATABASE", "mydb"),
+        user=os.getenv("MYSQLUSER", "myuser"),
+        password=os.getenv("MYSQLPASSWORD", "myuser"),
+        port=int(os.getenv("MYSQLPORT", 3306)),
+    )
+    return conn
+
+
+# ==================== 解析（在子程序執行） ====================
+
+def parse_lines(job):
+    """解析一批 JSON 行，回傳各表要寫入的資料列
+    kind 為 "movie" 或 "person"；沒有 title 的電影行視為 ID 匯出檔（以 original_title 只補上不存在的）
+    lines_done 原樣傳回，主程序提交後寫入 checkpoint
+    """
+    kind, lines, lines_done, include_adult = job
+    batch = {
+        "movies": [], "movies_basic": [], "actors": [], "actors_basic": {},
+        "cast": [], "directors": [], "skipped": 0, "lines_done": lines_done,
+    }
+    for line in lines:
+        try:
+            data = json.loads(line)
+        except ValueError:
+            batch["skipped"] += 1
+            continue
+        tmdb_id = data.get("id")
+        if not tmdb_id or (data.get("adult") and not include_adult):
+            batch["skipped"] += 1
+            continue
+
+        if kind == "person":
+            if not data.get("name"):
+                batch["skipped"] += 1
+            elif "birthday" in data or "place_of_birth" in data:
+                batch["actors"].append(_parse_actor(tmdb_id, data))
+            else:
+                batch["actors_basic"][tmdb_id] = (tmdb_id, data["name"], None)
+            continue
+
+        if data.get("title"):
+            batch["movies"].append(_parse_movie(tmdb_id, data))
+        elif data.get("original_title"):
+            batch["movies_basic"].append(_parse_movie(tmdb_id, dict(data, title=data["original_title"])))
+        else:
+            batch["skipped"] += 1
+            continue
+        if data.get("credits"):
+            cast_members, director_ids, tmdb_to_basic = _parse_credits(data)
+            for tid, (name, profile_url) in tmdb_to_basic.items():
+                batch["actors_basic"].setdefault(tid, (tid, name, profile_url))
+            for m in cast_members:
+                if m.get("id"):
+                    batch["cast"].append((tmdb_id, m["id"], m.get("character"), m.get("order")))
+            batch["directors"].extend((tmdb_id, tid) for tid in director_ids)
+    batch["actors_basic"] = list(batch["actors_basic"].values())
+    return batch
+
+
+# ==================== 寫入（主程序） ====================
+
+def write_batch(cur, batch, chunk_rows):
+    """寫入一批資料，回傳寫入（含更新）的列數；呼叫端負責提交"""
+    _insert_rows(
+        cur,
+        "INSERT INTO MOVIE (tmdb_id, title, release_year, genre, runtime, overview, rating, poster_url) VALUES",
+        "(%s,%s,%s,%s,%s,%s,%s,%s)", batch["movies"], MOVIE_MERGE, chunk_rows,
+    )
+    _insert_rows(
+        cur,
+        "INSERT INTO MOVIE (tmdb_id, title, release_year, genre, runtime, overview, rating, poster_url) VALUES",
+        "(%s,%s,%s,%s,%s,%s,%s,%s)", batch["movies_basic"], KEEP_EXISTING, chunk_rows,
+    )
+    _insert_rows(
+        cur,
+        "INSERT INTO ACTOR (tmdb_id, name, profile_url, birthdate, country) VALUES",
+        "(%s,%s,%s,%s,%s)", batch["actors"], ACTOR_MERGE, chunk_rows,
+    )
+    _insert_rows(
+        cur,
+        "INSERT INTO ACTOR (tmdb_id, name, profile_url) VALUES",
+        "(%s,%s,%s)", batch["actors_basic"], KEEP_EXISTING, chunk_rows,
+    )
+
+    cast_rows, dir_rows = [], []
+    if batch["cast"] or batch["directors"]:
+        movie_tids = {row[0] for row in batch["cast"]} | {row[0] for row in batch["directors"]}
+        actor_tids = {row[1] for row in batch["cast"]} | {row[1] for row in batch["directors"]}
+        movie_id_map, actor_id_map = _resolve_ids(cur, list(movie_tids), list(actor_tids))
+        for movie_tid, actor_tid, character, order in batch["cast"]:
+            if movie_tid in movie_id_map and actor_tid in actor_id_map:
+                cast_rows.append((movie_id_map[movie_tid], actor_id_map[actor_tid], character, order))
+        for movie_tid, actor_tid in batch["directors"]:
+            if movie_tid in movie_id_map and actor_tid in actor_id_map:
+                dir_rows.append((movie_id_map[movie_tid], actor_id_map[actor_tid]))
+    _insert_rows(
+        cur,
+        "INSERT IGNORE INTO MOVIE_CAST (movie_id, actor_id, character_name, billing_order) VALUES",
+        "(%s,%s,%s,%s)", cast_rows, "", chunk_rows,
+    )
+    _insert_rows(
+        cur,
+        "INSERT IGNORE INTO DIRECTOR (movie_id, actor_id) VALUES",
+        "(%s,%s)", dir_rows, "", chunk_rows,
+    )
+    return sum(len(batch[k]) for k in ("movies", "movies_basic", "actors", "actors_basic")) \
+        + len(cast_rows) + len(dir_rows)
+
+
+def backfill_entities(cur, start_ids):
+    """為匯入期間新增（略過觸發器）的列補上 ENTITY；start_ids 為匯入開始前各表的最大 id"""
+    for table, (entity_type, pk) in ENTITY_TABLES.items():
+        cur.execute(
+            f"INSERT IGNORE INTO ENTITY (entity_type, entity_id) SELECT %s, {pk} FROM {table} WHERE {pk} > %s",
+            (entity_type, start_ids.get(table, 0)),
+        )
+        print(f"[ENTITY] {table}: 補上 {cur.rowcount} 筆")
+
+
+# ==================== checkpoint ====================
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return {"files": {}, "start_ids": None}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    """先寫入暫存檔再取代，中斷時不會留下寫到一半的 checkpoint"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+# ==================== 主流程 ====================
+
+def open_dump(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def read_batches(path, kind, skip_lines, batch_lines, include_adult):
+    """略過已匯入的 skip_lines 行，之後每 batch_lines 行產生一個解析工作（含該批結束時的行數）"""
+    with open_dump(path) as f:
+        lines = itertools.islice(f, skip_lines, None)
+        done = skip_lines
+        while True:
+            chunk = list(itertools.islice(lines, batch_lines))
+            if not chunk:
+                return
+            done += len(chunk)
+            yield kind, chunk, done, include_adult
+
+
+def parse_in_order(pool, jobs, window):
+    """依序回傳解析結果，同時最多 window 批送進程序池
+    資料庫寫入比解析慢時，不會把整個檔案讀進記憶體等待寫入
+    """
+    pending = deque()
+    for job in jobs:
+        pending.append(pool.apply_async(parse_lines, (job,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def import_file(pool, conn, path, kind, args, checkpoint):
+    key = os.path.abspath(path)
+    state = checkpoint["files"].setdefault(key, {"kind": kind, "lines": 0, "done": False})
+    if state["done"]:
+        print(f"[SKIP] {path} 已匯入完成")
+        return 0
+    if state["lines"]:
+        print(f"[RESUME] {path} 從第 {state['lines']} 行繼續")
+
+    jobs = read_batches(path, kind, state["lines"], args.batch_lines, args.include_adult)
+    # 依序回傳，checkpoint 的行數只會前進到已提交的批次
+    parsed = parse_in_order(pool, jobs, 2 * args.workers)
+
+    cur = conn.cursor()
+    written = 0
+    start = time.time()
+    try:
+        for batch in parsed:
+            conn.start_transaction()
+            written += write_batch(cur, batch, args.chunk_rows)
+            conn.commit()
+            lines_done = state["lines"] = batch["lines_done"]
+            save_checkpoint(args.checkpoint, checkpoint)
+            elapsed = max(time.time() - start, 1e-6)
+            print(f"[PROGRESS] {path}: {lines_done} 行，寫入 {written} 列（{written / elapsed * 3600:,.0f} 列/小時）")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    state["done"] = True
+    save_checkpoint(args.checkpoint, checkpoint)
+    return written
+
+
+def run(args):
+    checkpoint = load_checkpoint(args.checkpoint)
+    conn = get_db_conn()
+    conn.autocommit = False
+    cur = conn.cursor()
+    try:
+        if checkpoint["start_ids"] is None:
+            # 第一次執行時記下各表目前的最大 id，回填 ENTITY 時只需處理之後新增的列
+            start_ids = {}
+            for table, (_, pk) in ENTITY_TABLES.items():
+                cur.execute(f"SELECT COALESCE(MAX({pk}), 0) FROM {table}")
+                start_ids[table] = cur.fetchone()[0]
+            conn.commit()
+            checkpoint["start_ids"] = start_ids
+            save_checkpoint(args.checkpoint, checkpoint)
+
+        if not args.backfill_only:
+            cur.execute("SET @skip_entity_triggers = 1")
+            if args.disable_fk_checks:
+                # MOVIE_CAST / DIRECTOR 的 id 皆剛由 _resolve_ids 查得，略過外鍵檢查可加快寫入
+                cur.execute("SET SESSION foreign_key_checks = 0")
+            files = [(p, "movie") for p in args.movies] + [(p, "person") for p in args.people]
+            total = 0
+            with Pool(args.workers) as pool:
+                for path, kind in files:
+                    total += import_file(pool, conn, path, kind, args, checkpoint)
+            cur.execute("SET @skip_entity_triggers = NULL")
+            cur.execute("SET SESSION foreign_key_checks = 1")
+            print(f"[DONE] 共寫入 {total} 列")
+
+        conn.start_transaction()
+        backfill_entities(cur, checkpoint["start_ids"])
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TMDB 匯出檔大量匯入腳本")
+    parser.add_argument("--movies", nargs="*", default=[], help="電影檔案（ID 匯出檔或詳細資料，JSON lines，可為 .gz）")
+    parser.add_argument("--people", nargs="*", default=[], help="人物檔案（ID 匯出檔或詳細資料，JSON lines，可為 .gz）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="解析用的程序數（預設 CPU 數）")
+    parser.add_argument("--batch-lines", type=int, default=1000, help="每批（一個交易）處理的行數")
+    parser.add_argument("--chunk-rows", type=int, default=2000, help="每個多列 INSERT 語句的列數上限")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="checkpoint 檔路徑")
+    parser.add_argument("--include-adult", action="store_true", help="一併匯入 adult 標記的項目")
+    parser.add_argument("--disable-fk-checks", action="store_true", help="匯入期間關閉外鍵檢查")
+    parser.add_argument("--backfill-only", action="store_true", help="不匯入，只回填 ENTITY")
+    args = parser.parse_args()
+    if not (args.movies or args.people or args.backfill_only):
+        parser.error("請指定 --movies、--people 或 --backfill-only")
+
+    try:
+        run(args)
+    except mysql.connector.Error as e:
+        print(f"[ERROR] MySQL 連線/執行錯誤: {e}")
+        print(f"[ERROR] 已完成的批次記錄在 {args.checkpoint}，以相同參數重新執行即可繼續")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print(f"\n[STOP] 已中斷，已完成的批次記錄在 {args.checkpoint}，以相同參數重新執行即可繼續")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
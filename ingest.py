@@ -0,0 +1,123 @@
+# ingest.py - 背景寫入佇列（write-behind）
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 1000))
+INGEST_BATCH_ROWS = int(os.getenv("INGEST_BATCH_ROWS", 200))
+INGEST_FLUSH_SECONDS = float(os.getenv("INGEST_FLUSH_MS", 50)) / 1000
+
+class IngestionQueue:
+    """將 TMDB 資料列交給背景執行緒批次寫入
+    - 佇列有上限，滿了就丟棄並計數（下次請求仍會重新提交）
+    - 背景執行緒把多個請求的資料列合併成一批，依種類各以一個交易寫入
+    - submit_* 回傳 Future，完成時結果為 {tmdb_id: db_id}
+    """
+
+    def __init__(self, writers, maxsize=INGEST_QUEUE_SIZE,
+                 batch_rows=INGEST_BATCH_ROWS, flush_seconds=INGEST_FLUSH_SECONDS):
+        # writers: {kind: fn(items) -> {tmdb_id: db_id}}
+        self._writers = writers
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._batch_rows = batch_rows
+        self._flush_seconds = flush_seconds
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0, "dropped": 0, "batches": 0, "rows_written": 0,
+            "errors": 0, "last_lag": 0.0, "max_lag": 0.0,
+        }
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ingest-worker", daemon=True)
+                self._thread.start()
+
+    def submit(self, kind, items):
+        """提交 [(tmdb_id, data), ...]；佇列已滿時回傳 None"""
+        if not items:
+            return None
+        self._ensure_worker()
+        future = Future()
+        try:
+            self._queue.put_nowait((kind, list(items), time.time(), future))
+        except queue.Full:
+            self._count("dropped", len(items))
+            return None
+        self._count("enqueued", len(items))
+        return future
+
+    def submit_movies(self, items):
+        return self.submit("movie", items)
+
+    def submit_actors(self, items):
+        return self.submit("actor", items)
+
+    def _count(self, name, n=1):
+        with self._stats_lock:
+            self._stats[name] += n
+
+    def _next_batch(self):
+        entries = [self._queue.get()]
+        rows = len(entries[0][1])
+        deadline = time.time() + self._flush_seconds
+        while rows < self._batch_rows:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            entries.append(entry)
+            rows += len(entry[1])
+        return entries
+
+    def _run(self):
+        while True:
+            entries = self._next_batch()
+            for kind in {e[0] for e in entries}:
+                group = [e for e in entries if e[0] == kind]
+                self._write_group(kind, group)
+
+    def _write_group(self, kind, group):
+        # 同一批內相同 tmdb_id 只寫一次（以最後提交的資料為準）
+        merged = {}
+        for _, items, _, _ in group:
+            for tmdb_id, data in items:
+                merged[tmdb_id] = data
+        try:
+            ids = self._writers[kind](list(merged.items()))
+            error = None
+        except Exception as e:
+            print(f"[INGEST] Warning: Failed to write {len(merged)} {kind} rows: {e}")
+            self._count("errors")
+            ids, error = {}, e
+
+        now = time.time()
+        oldest = min(e[2] for e in group)
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            if error is None:
+                self._stats["rows_written"] += len(merged)
+            self._stats["last_lag"] = now - oldest
+            self._stats["max_lag"] = max(self._stats["max_lag"], now - oldest)
+
+        for _, items, _, future in group:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result({tid: ids.get(tid) for tid, _ in items})
+
+    def stats(self):
+        """佇列深度、延遲與處理量"""
+        with self._stats_lock:
+            result = dict(self._stats)
+        result["depth"] = self._queue.qsize()
+        return result
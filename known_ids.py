@@ -0,0 +1,64 @@
+# known_ids.py - 已存在於資料庫的 tmdb_id（點陣圖）
+import os
+import threading
+
+KNOWN_IDS_MAX = int(os.getenv("KNOWN_IDS_MAX", 1 << 24))  # 超過此值的 tmdb_id 不記錄，一律查資料庫
+
+class KnownIdBitmap:
+    """以點陣圖記錄 tmdb_id，每個 id 佔 1 bit
+    - 依最大 id 逐步擴充，上限 KNOWN_IDS_MAX / 8 位元組（預設 2MB）
+    - 只會誤判為「未知」（未種入或超出上限），呼叫端此時改查資料庫
+    - 讀取不加鎖；寫入以鎖保護讀改寫
+    """
+
+    def __init__(self, max_id=KNOWN_IDS_MAX):
+        self._max_id = max_id
+        self._bits = bytearray()
+        self._count = 0
+        self._lock = threading.Lock()
+        self.seeded = False
+
+    def __contains__(self, tmdb_id):
+        if not isinstance(tmdb_id, int) or tmdb_id < 0:
+            return False
+        bits = self._bits
+        index = tmdb_id >> 3
+        return index < len(bits) and bool(bits[index] & (1 << (tmdb_id & 7)))
+
+    def add(self, tmdb_id):
+        self.add_many((tmdb_id,))
+
+    def add_many(self, tmdb_ids):
+        ids = [i for i in tmdb_ids if isinstance(i, int) and 0 <= i <= self._max_id]
+        if not ids:
+            return
+        with self._lock:
+            needed = (max(ids) >> 3) + 1
+            if needed > len(self._bits):
+                # 以倍數擴充，避免逐筆重新配置
+                self._bits.extend(bytes(max(needed, min(len(self._bits) * 2, (self._max_id >> 3) + 1)) - len(self._bits)))
+            bits = self._bits
+            for i in ids:
+                index, mask = i >> 3, 1 << (i & 7)
+                if not bits[index] & mask:
+                    bits[index] |= mask
+                    self._count += 1
+
+    def discard(self, tmdb_id):
+        """資料庫中已不存在時移除（例如資料被手動刪除）"""
+        if tmdb_id not in self:
+            return
+        with self._lock:
+            index, mask = tmdb_id >> 3, 1 << (tmdb_id & 7)
+            if self._bits[index] & mask:
+                self._bits[index] &= ~mask & 0xFF
+                self._count -= 1
+
+    def __len__(self):
+        return self._count
+
+    def stats(self):
+        return {"ids": self._count, "bytes": len(self._bits), "seeded": self.seeded}
+
+known_movies = KnownIdBitmap()
+known_actors = KnownIdBitmap()
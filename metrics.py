@@ -0,0 +1,208 @@
+# metrics.py - Prometheus 文字格式指標（計數器、直方圖、抓取時計算的數值）
+import os
+import re
+import time
+import bisect
+import threading
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_PROCESS_START = time.time()
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+def endpoint_family(path):
+    """把路徑中的數字 id 換成 {id}，例如 /person/123/movie_credits -> /person/{id}/movie_credits"""
+    return _ID_SEGMENT.sub("/{id}", path.split("?", 1)[0])
+
+class _Shards:
+    """每個執行緒各自一份資料，寫入時不需要鎖；抓取時才合併所有執行緒的資料"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = []
+
+    def mine(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            with self._lock:
+                self._all.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def snapshot(self):
+        """回傳所有執行緒資料的複本（清單）"""
+        with self._lock:
+            shards = list(self._all)
+        result = []
+        for shard in shards:
+            for _ in range(5):
+                try:
+                    # 擁有者執行緒可能同時新增 key，複製失敗就重試
+                    result.append([(k, list(v) if isinstance(v, list) else v) for k, v in list(shard.items())])
+                    break
+                except RuntimeError:
+                    continue
+        return result
+
+class Counter:
+    """name 需包含 _total 結尾"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._shards = _Shards()
+
+    def inc(self, *labels, amount=1):
+        shard = self._shards.mine()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def collect(self):
+        totals = {}
+        for items in self._shards.snapshot():
+            for labels, value in items:
+                totals[labels] = totals.get(labels, 0) + value
+        return "counter", [(self.name, dict(zip(self.labelnames, labels)), v) for labels, v in totals.items()]
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _Shards()
+
+    def observe(self, value, *labels):
+        shard = self._shards.mine()
+        counts = shard.get(labels)
+        if counts is None:
+            # 各 bucket 的計數（非累積），最後兩格為總和與次數
+            counts = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def collect(self):
+        totals = {}
+        width = len(self.buckets) + 3
+        for items in self._shards.snapshot():
+            for labels, counts in items:
+                merged = totals.setdefault(labels, [0] * width)
+                for i, v in enumerate(counts):
+                    merged[i] += v
+        samples = []
+        for labels, counts in totals.items():
+            base = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                samples.append((self.name + "_bucket", dict(base, le=_format_value(bound)), cumulative))
+            samples.append((self.name + "_sum", base, counts[-2]))
+            samples.append((self.name + "_count", base, counts[-1]))
+        return "histogram", samples
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, fn):
+        """fn() 回傳 [(name, type, help, [(labels_dict, value), ...]), ...]，在抓取時才計算"""
+        with self._lock:
+            self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        """輸出 Prometheus 文字格式（0.0.4）"""
+        lines = [
+            "# HELP process_start_time_seconds Start time of the process since unix epoch in seconds.",
+            "# TYPE process_start_time_seconds gauge",
+            f"process_start_time_seconds {_format_value(_PROCESS_START)}",
+            "# HELP process_info Worker process id; each gunicorn worker reports its own metrics.",
+            "# TYPE process_info gauge",
+            f'process_info{{pid="{os.getpid()}"}} 1',
+        ]
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        for metric in metrics:
+            kind, samples = metric.collect()
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {kind}")
+            lines.extend(_format_sample(name, labels, value) for name, labels, value in samples)
+        for fn in collectors:
+            try:
+                families = fn()
+            except Exception as e:
+                print(f"Warning: Metrics collector {getattr(fn, '__name__', fn)} failed: {e}")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(_format_sample(name, labels, value) for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+def _format_sample(name, labels, value):
+    if labels:
+        inner = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        return f"{name}{{{inner}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+registry = Registry()
+
+# ==================== 共用指標 ====================
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Flask request latency by route.", ("route", "method", "status")
+)
+db_pool_checkout_errors = registry.counter(
+    "db_pool_checkout_errors_total", "MySQL pool checkouts that failed (pool exhausted or connection error).",
+)
+db_pool_wait = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a MySQL pool connection.", (),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+tmdb_request_duration = registry.histogram(
+    "tmdb_request_duration_seconds", "TMDB HTTP request latency by endpoint family and status.",
+    ("family", "status", "client"),
+)
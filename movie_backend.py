@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 from flask_compress import Compress
 import os
@@ -6,36 +6,69 @@ import concurrent.futures
 import jwt
 import datetime
 import time
+import hashlib
+import gzip
+try:
+    import brotli
+except ImportError:
+    # 選用：未安裝時預先壓縮的 payload 只有 gzip
+    print("Warning: brotli not installed, precompressed payloads use gzip only")
+    brotli = None
 from threading import Lock
 from werkzeug.security import generate_password_hash, check_password_hash
 from database import (
     store_movie,
     store_actor,
+    store_movies,
+    store_actors,
     check_movie_detail,
     check_actor_update,
     update_actor_time,
-    insert_movie_cast_batch,
-    insert_directors_batch,
+    filmography_fingerprint,
+    get_filmography_fingerprint,
+    sync_actor_filmography,
     get_movies_by_tmdb_ids,
     get_movie_ids_from_tmdb_ids,
-    get_tmdb_id_from_movie_id,
     get_actors_by_tmdb_ids,
-    get_tmdb_id_from_actor_id,
     normalize_movie_row,
     normalize_actor_row,
+    tmdb_movie_row,
+    tmdb_actor_row,
     create_user,
     get_user_by_email,
     search_movies,
+    search_movies_after,
+    MOVIE_SORTS,
     get_movie_detail,
     search_actors,
+    search_actors_after,
     get_actor_detail,
     add_review,
     get_movie_reviews,
-    execute_sql_query,
+    get_batch,
+    detail_version,
+    get_movie_fetch_state,
+    get_actor_fetch_state,
+    movie_detail_stale,
+    actor_detail_stale,
+    filmography_stale,
+    SqlQueryStream,
+    PoolTimeout,
     init_db_pool,
+    seed_known_ids,
+    pool_stats,
     _init_pool_connections,
 )
 from tmdb_api import fetch_tmdb_data
+from tmdb_async import fetch_tmdb_many
+from rate_limit import tmdb_limiter, LANE_INTERACTIVE, LANE_BACKGROUND
+from cache import response_cache
+from singleflight import SingleFlight
+from ingest import IngestionQueue
+from prewarm import Prewarmer, PREWARM_ENABLED
+from tmdb_changes import ChangeFeedPoller, TMDB_CHANGES_ENABLED
+from known_ids import known_movies, known_actors
+from metrics import registry, http_request_duration, METRICS_ENABLED
 
 app = Flask(__name__, static_folder='Movie_UI', static_url_path='')
 CORS(app)
@@ -43,6 +76,8 @@ Compress(app)
 
 # 初始化資料庫連線池
 init_db_pool()
+# 背景載入資料庫中已有的 tmdb_id，已知的 id 不必再查詢是否存在
+seed_known_ids()
 
 # 應用啟動完成後，在後台觸發連線池預初始化
 @app.after_request
@@ -55,118 +90,382 @@ def _trigger_pool_init(response):
         print("[INIT] Pool warm-up triggered in background")
     return response
 
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def _observe_request(response):
+    """記錄各路由的延遲（以路由樣板為標籤，例如 /movies/<int:movie_id>）"""
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        http_request_duration.observe(time.perf_counter() - start, route, request.method, str(response.status_code))
+    return response
+
 SECRET_KEY = os.getenv('SECRET_KEY', 'dev_secret_key')
-CACHE_TTL_SECONDS = 1800
-_cache = {}
-_cache_lock = Lock()
+# 搜尋/排行榜含尚未寫入資料庫的項目（id 為 None）時，快取與 Cache-Control 的秒數
+INGEST_PENDING_TTL = int(os.getenv('INGEST_PENDING_TTL', 15))
+CACHE_CONTROL_PENDING = f'public, max-age={INGEST_PENDING_TTL}'
+# 同一 TMDB 請求已由其他請求抓取時，等待其結果的上限秒數
+TMDB_FOLLOWER_WAIT_SECONDS = float(os.getenv('TMDB_FOLLOWER_WAIT_SECONDS', 30))
+# 詳細頁 stale-while-revalidate：資料庫已有資料時先回傳，過期的部分改在背景更新
+DETAIL_STALE_WHILE_REVALIDATE = os.getenv('DETAIL_STALE_WHILE_REVALIDATE', '1') == '1'
+DETAIL_REFRESH_WORKERS = int(os.getenv('DETAIL_REFRESH_WORKERS', 2))
+BATCH_MAX_IDS = int(os.getenv('BATCH_MAX_IDS', 50))  # /api/batch 每種清單最多的 id 數
+# 各路由的 Cache-Control；詳細頁預設每次都向伺服器驗證（ETag 相符時回 304）
+CACHE_CONTROL_TRENDING = os.getenv('CACHE_CONTROL_TRENDING', 'public, max-age=300')
+CACHE_CONTROL_DETAIL = os.getenv('CACHE_CONTROL_DETAIL', 'public, no-cache')
+CACHE_CONTROL_SEARCH = os.getenv('CACHE_CONTROL_SEARCH', 'public, max-age=60')
+# 快取的 trending / 搜尋結果預先序列化並壓縮（每次重建只做一次，因此用較高的壓縮等級）
+PRECOMPRESS_GZIP_LEVEL = int(os.getenv('PRECOMPRESS_GZIP_LEVEL', 9))
+PRECOMPRESS_BR_QUALITY = int(os.getenv('PRECOMPRESS_BR_QUALITY', 11))
+PRECOMPRESS_REFILL_TTL = int(os.getenv('PRECOMPRESS_REFILL_TTL', 60))
+_cache = response_cache
 
 def cache_get(key):
-    with _cache_lock:
-        item = _cache.get(key)
-        if not item:
-            return None
-        if time.time() - item['ts'] > CACHE_TTL_SECONDS:
-            _cache.pop(key, None)
-            return None
-        return item['data']
+    return _cache.get(key)
 
-def cache_set(key, data):
-    with _cache_lock:
-        _cache[key] = {'ts': time.time(), 'data': data}
+def cache_set(key, data, ttl=None):
+    """寫入快取並刪除該 key 的驗證資訊，舊 ETag 不會再比對到新內容"""
+    _cache.set(key, data, ttl=ttl)
+    _cache.delete(f"etag:{key}")
 
-_seen_tmdb_movies = set()
-_seen_tmdb_persons = set()
-_seen_lock = Lock()
+# 合併相同 TMDB 路徑/參數與相同 tmdb_id 的並行抓取與寫入
+_inflight = SingleFlight()
 
-def mark_seen_movie(tmdb_id):
-    with _seen_lock:
-        _seen_tmdb_movies.add(tmdb_id)
+def _ingest_movies(items):
+    """背景寫入電影：只寫入資料庫中尚不存在的 tmdb_id"""
+    ids = get_movie_ids_from_tmdb_ids([tid for tid, _ in items])
+    missing = [(tid, data) for tid, data in items if tid not in ids]
+    try:
+        ids.update(store_movies(missing))
+    except Exception as e:
+        print(f"Warning: Bulk store of {len(missing)} movies failed, retrying one by one: {e}")
+        for tid, data in missing:
+            try:
+                ids[tid] = store_movie(tid, data)
+            except Exception as e:
+                print(f"Warning: Failed to store movie {tid}: {e}")
+    known_movies.add_many(ids)
+    return ids
 
-def is_seen_movie(tmdb_id):
-    with _seen_lock:
-        return tmdb_id in _seen_tmdb_movies
+def _ingest_actors(items):
+    """背景寫入演員：只寫入資料庫中尚不存在的 tmdb_id"""
+    existing = get_actors_by_tmdb_ids([tid for tid, _ in items])
+    ids = {tid: row['actor_id'] for tid, row in existing.items()}
+    missing = [(tid, data) for tid, data in items if tid not in ids]
+    try:
+        ids.update(store_actors(missing))
+    except Exception as e:
+        print(f"Warning: Bulk store of {len(missing)} actors failed, retrying one by one: {e}")
+        for tid, data in missing:
+            try:
+                ids[tid] = store_actor(tid, data)
+            except Exception as e:
+                print(f"Warning: Failed to store actor {tid}: {e}")
+    known_actors.add_many(ids)
+    return ids
+
+def forget_missing(known, tmdb_ids, found):
+    """已知但資料庫查無資料的 id（例如被手動刪除）從 known 移除，下次會重新寫入"""
+    for tid in tmdb_ids:
+        if tid not in found and tid in known:
+            known.discard(tid)
+
+_ingest = IngestionQueue({"movie": _ingest_movies, "actor": _ingest_actors})
 
-def mark_seen_person(tmdb_id):
-    with _seen_lock:
-        _seen_tmdb_persons.add(tmdb_id)
+def movie_entries(tmdb_ids, tmdb_movies, rows):
+    """依 TMDB 順序組成電影清單：資料庫已有的用資料庫的列，
+    尚未寫入的（背景佇列還沒寫完）以 TMDB 資料組成，movie_id 為 None；每項都帶 tmdb_id
+    """
+    return [
+        dict(normalize_movie_row(rows[tid]) if tid in rows else tmdb_movie_row(tid, tmdb_movies[tid]), tmdb_id=tid)
+        for tid in tmdb_ids
+    ]
+
+def actor_entries(tmdb_ids, tmdb_people, rows):
+    """同 movie_entries，尚未寫入的演員 actor_id 為 None"""
+    return [
+        dict(normalize_actor_row(rows[tid]) if tid in rows else tmdb_actor_row(tid, tmdb_people[tid]), tmdb_id=tid)
+        for tid in tmdb_ids
+    ]
 
-def is_seen_person(tmdb_id):
-    with _seen_lock:
-        return tmdb_id in _seen_tmdb_persons
+def payload_pending(data):
+    """payload 中是否有尚未寫入資料庫（movie_id / actor_id 為 None）的項目"""
+    return isinstance(data, dict) and any(
+        isinstance(entry, dict) and (entry.get('movie_id', 0) is None or entry.get('actor_id', 0) is None)
+        for block in data.values() if isinstance(block, list)
+        for entry in block
+    )
 
-def reset_seen_sets():
-    with _seen_lock:
-        _seen_tmdb_movies.clear()
-        _seen_tmdb_persons.clear()
+def fetch_and_store_movie(movie_id, tmdb_movie_id, lane=LANE_INTERACTIVE):
+    """從 TMDB 獲取電影資料並存入資料庫（相同 tmdb_id 的並行呼叫共用一次執行）"""
+    return _inflight.do(f"fetch_movie:{tmdb_movie_id}", _fetch_and_store_movie, movie_id, tmdb_movie_id, lane)
 
-def fetch_and_store_movie(movie_id, tmdb_movie_id):
-    """從 TMDB 獲取電影資料並存入資料庫"""
+def _fetch_and_store_movie(movie_id, tmdb_movie_id, lane=LANE_INTERACTIVE):
     if movie_id is None or check_movie_detail(movie_id) is False:
         try:
-            movie_data = fetch_tmdb_data(f"/movie/{tmdb_movie_id}", params={"append_to_response": "credits,genres"})
-            return store_movie(tmdb_movie_id, movie_data)
+            movie_data = fetch_tmdb_data(f"/movie/{tmdb_movie_id}", params={"append_to_response": "credits,genres"}, lane=lane)
+            return store_movie(tmdb_movie_id, movie_data, fetched=True)
         except Exception as e:
             print(f"Error fetching/storing movie {tmdb_movie_id}: {e}")
             raise
     else:
         return movie_id
 
-def fetch_and_store_actor(actor_id, tmdb_actor_id):
-    """從 TMDB 獲取演員資料並存入資料庫"""
-    updated = False
-    if actor_id is None:
-        try:
-            actor_data = fetch_tmdb_data(f"/person/{tmdb_actor_id}")
-            actor_id = store_actor(tmdb_actor_id, actor_data)
-            updated = True
-        except Exception as e:
-            print(f"Error fetching/storing actor {tmdb_actor_id}: {e}")
-            raise
+def fetch_and_store_actor(actor_id, tmdb_actor_id, lane=LANE_INTERACTIVE):
+    """從 TMDB 獲取演員資料並存入資料庫（相同 tmdb_id 的並行呼叫共用一次執行）"""
+    return _inflight.do(f"fetch_actor:{tmdb_actor_id}", _fetch_and_store_actor, actor_id, tmdb_actor_id, lane)
 
-    check = check_actor_update(actor_id)
-    if updated is False and check[0] is False:
+def _fetch_and_store_actor(actor_id, tmdb_actor_id, lane=LANE_INTERACTIVE):
+    need_detail, need_movies = actor_refresh_needs(actor_id)
+
+    urls_params = []
+    if need_detail:
+        urls_params.append((f"/person/{tmdb_actor_id}", None, lane))
+    if need_movies:
+        urls_params.append((f"/person/{tmdb_actor_id}/movie_credits", None, LANE_BACKGROUND))
+    if not urls_params:
+        return actor_id
+
+    # 詳細資料與作品清單同時抓取，耗時約等於較慢的一個
+    results = fetch_tmdb_many(urls_params)
+
+    if need_detail:
         try:
-            actor_data = fetch_tmdb_data(f"/person/{tmdb_actor_id}")
-            store_actor(tmdb_actor_id, actor_data)
+            actor_data = results[0]
+            if isinstance(actor_data, Exception):
+                raise actor_data
+            actor_id = store_actor(tmdb_actor_id, actor_data, fetched=True)
         except Exception as e:
             print(f"Error fetching/storing actor {tmdb_actor_id}: {e}")
             raise
-    if check[1] is False:
-        fetch_actor_movies(actor_id, tmdb_actor_id)
+    if need_movies:
+        fetch_actor_movies(actor_id, tmdb_actor_id, results[-1])
         update_actor_time(actor_id)
 
     return actor_id
 
-def fetch_actor_movies(actor_id, tmdb_actor_id):
-    """獲取某演員參與的所有電影"""
+def actor_refresh_needs(actor_id):
+    """回傳 (need_detail, need_movies)：詳細資料、作品清單是否需要重新抓取"""
+    if actor_id is None:
+        return True, True
+    check = check_actor_update(actor_id)
+    return check[0] is False, check[1] is False
+
+# ==================== 背景更新（stale-while-revalidate） ====================
+
+_refresh_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=DETAIL_REFRESH_WORKERS, thread_name_prefix="detail-refresh"
+)
+_refresh_stats = {"scheduled": 0, "deduped": 0, "failed": 0, "served_stale": 0}
+_refresh_stats_lock = Lock()
+
+def _count_refresh(name):
+    with _refresh_stats_lock:
+        _refresh_stats[name] += 1
+
+def schedule_refresh(key, fn, *args):
+    """在背景執行 fn(*args)
+    與前景呼叫共用 _inflight 的 key，相同 key 正在執行（不論前景或背景）時不重複排程
+    """
+    future, leader = _inflight.claim(key)
+    if not leader:
+        _count_refresh("deduped")
+        return future
+
+    def run():
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            _count_refresh("failed")
+            print(f"Warning: Background refresh {key} failed: {e}")
+            _inflight.resolve(key, future, exception=e)
+            return
+        _inflight.resolve(key, future, result=result)
+
     try:
-        data = fetch_tmdb_data(f"/person/{tmdb_actor_id}/movie_credits")
-        cast_movie_block = data.get("cast", []) 
+        _refresh_executor.submit(run)
+    except RuntimeError as e:
+        # 執行緒池已關閉（程序結束中）
+        _inflight.resolve(key, future, exception=e)
+        return future
+    _count_refresh("scheduled")
+    return future
+
+def detail_response(data, stale):
+    """詳細頁回應；stale 時加上 X-Data-Stale 標頭，表示背景更新尚未完成"""
+    response = jsonify(data)
+    if stale:
+        _count_refresh("served_stale")
+        response.headers['X-Data-Stale'] = '1'
+    return response
+
+# ==================== 條件式 GET（ETag / Last-Modified） ====================
+# 驗證資訊 (etag, last_modified) 存在 response_cache 的 etag:{快取 key}，存活時間與該快取相同，
+# 快取內容重寫或詳細資料失效時一併刪除；快取內容已過期時不使用驗證資訊，因此比對時只需查快取，不必查資料庫
+
+def _matching_etag(etag):
+    """If-None-Match 中與 etag 相符的值（flask_compress 壓縮後會加上 :gzip 等後綴）"""
+    if request.if_none_match.star_tag:
+        return etag
+    for tag in request.if_none_match.as_set(include_weak=True):
+        if tag.split(":", 1)[0] == etag:
+            return tag
+    return None
+
+def not_modified(resource_key, cache_control):
+    """請求的 If-None-Match / If-Modified-Since 與快取的驗證資訊相符時回傳 304 回應，否則回傳 None"""
+    if not request.if_none_match and request.if_modified_since is None:
+        return None
+    validator = _cache.get(f"etag:{resource_key}")
+    if validator is None or not _cache.contains(resource_key):
+        # 驗證資訊比快取內容晚寫入、可能活得較久；內容過期後要重建，不能再以舊 ETag 回 304
+        return None
+    etag, last_modified = validator
+    if request.if_none_match:
+        matched = _matching_etag(etag)
+        if matched is None:
+            return None
+    elif last_modified is None or request.if_modified_since < last_modified.replace(microsecond=0):
+        return None
+    else:
+        matched = etag
+    response = Response(status=304)
+    response.set_etag(matched)
+    response.headers['Cache-Control'] = cache_control
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+def add_validators(response, resource_key, cache_control, last_modified=None, remember=True, etag=None):
+    """加上 ETag（回應內容的雜湊，已算好時由 etag 傳入）、Last-Modified 與 Cache-Control
+    remember 為 True 時記錄驗證資訊，之後相同 ETag 的請求可直接回 304；
+    last_modified 未提供時沿用第一次記錄該 ETag 的時間
+    """
+    if etag is None:
+        etag = hashlib.blake2b(response.get_data(), digest_size=16).hexdigest()
+    if last_modified is not None and last_modified.tzinfo is None:
+        last_modified = last_modified.astimezone(datetime.timezone.utc)
+    if remember:
+        validator = _cache.get(f"etag:{resource_key}")
+        if validator is not None and validator[0] == etag:
+            last_modified = last_modified or validator[1]
+        else:
+            last_modified = last_modified or datetime.datetime.now(datetime.timezone.utc)
+            _cache.set(f"etag:{resource_key}", (etag, last_modified), ttl=_cache.ttl_for(resource_key))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+# ==================== 預先壓縮的回應 ====================
+# 熱門 payload 在寫入快取時一併存下序列化後的位元組與 gzip / br 壓縮結果（encoded:{快取 key}），
+# 之後的請求依 Accept-Encoding 直接回傳，不再做 JSON 編碼與壓縮
+
+def cache_payload(key, data):
+    """寫入快取並預先序列化、壓縮，回傳 encoded 項目
+    驗證資訊同時換成新內容的 ETag，舊 ETag 的條件式請求會拿到新內容；
+    含尚未寫入資料庫的項目時只快取 INGEST_PENDING_TTL 秒，寫入完成後的請求會拿到資料庫 id
+    """
+    ttl = min(INGEST_PENDING_TTL, _cache.ttl_for(key)) if payload_pending(data) else _cache.ttl_for(key)
+    cache_set(key, data, ttl)
+    entry = _encode_payload(key, data, ttl)
+    _cache.set(f"etag:{key}", (entry['etag'], datetime.datetime.now(datetime.timezone.utc)), ttl=ttl)
+    return entry
+
+def _encode_payload(key, data, ttl=None):
+    body = app.json.response(data).get_data()
+    entry = {
+        'identity': body,
+        'gzip': gzip.compress(body, compresslevel=PRECOMPRESS_GZIP_LEVEL),
+        'etag': hashlib.blake2b(body, digest_size=16).hexdigest(),
+        'pending': payload_pending(data),
+    }
+    if brotli is not None:
+        entry['br'] = brotli.compress(body, quality=PRECOMPRESS_BR_QUALITY)
+    _cache.set(f"encoded:{key}", entry, ttl=_cache.ttl_for(key) if ttl is None else ttl)
+    return entry
+
+def payload_response(key, cache_control, entry=None, remember=True):
+    """以預先壓縮的位元組回應快取中的 payload；快取中沒有資料時回傳 None
+    encoded 項目被淘汰而資料仍在時重新編碼，但只保留 PRECOMPRESS_REFILL_TTL 秒，
+    因為不知道原資料還剩多久過期，避免壓縮結果比原資料活得更久
+    """
+    if entry is None:
+        entry = _cache.get(f"encoded:{key}")
+    if entry is None:
+        data = cache_get(key)
+        if not data:
+            return None
+        entry = _encode_payload(key, data, ttl=min(PRECOMPRESS_REFILL_TTL, _cache.ttl_for(key)))
+    encoding = request.accept_encodings.best_match([e for e in ('br', 'gzip') if e in entry]) or 'identity'
+    response = Response(entry[encoding], mimetype='application/json')
+    if encoding != 'identity':
+        # 已有 Content-Encoding 的回應 flask_compress 不會再壓縮；ETag 後綴與 flask_compress 的格式一致
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    if entry.get('pending'):
+        cache_control = CACHE_CONTROL_PENDING
+    add_validators(response, key, cache_control, remember=remember, etag=entry['etag'])
+    if encoding != 'identity':
+        response.set_etag(f"{entry['etag']}:{encoding}")
+    return response
+
+def detail_watermark(data):
+    """詳細資料的最後修改時間：實體本身與評論彙總 updated_at 較新者"""
+    stamps = [data.get('updated_at'), (data.get('review_stats') or {}).get('updated_at')]
+    stamps = [t for t in stamps if isinstance(t, datetime.datetime)]
+    return max(stamps) if stamps else None
+
+def detail_validators(response, namespace, detail_id, version, data, stale):
+    """詳細頁的驗證資訊；讀取期間版本有變（包括其他 worker 的寫入）時不記錄 ETag，
+    記錄之後才被失效的也刪除，舊內容的 ETag 不會留到下次寫入
+    """
+    resource_key = f"{namespace}:{detail_id}"
+    add_validators(response, resource_key, CACHE_CONTROL_DETAIL, detail_watermark(data),
+                   remember=not stale and detail_version(namespace, detail_id) == version)
+    if detail_version(namespace, detail_id) != version:
+        _cache.delete(f"etag:{resource_key}")
+    return response
+
+def fetch_actor_movies(actor_id, tmdb_actor_id, data=None):
+    """同步某演員參與的所有電影（data 為已抓取的 movie_credits 結果或例外）
+    movie_credits 的摘要與上次相同時不做任何寫入；否則補上缺少的電影，
+    再以差集更新 MOVIE_CAST / DIRECTOR
+    """
+    try:
+        if data is None:
+            data = fetch_tmdb_data(f"/person/{tmdb_actor_id}/movie_credits", lane=LANE_BACKGROUND)
+        if isinstance(data, Exception):
+            raise data
+        if "cast" not in data and "crew" not in data:
+            # 不完整的回應不能當作「作品清單為空」，否則會刪掉既有的演出記錄
+            raise ValueError("movie_credits response has no cast or crew")
+        cast_movie_block = data.get("cast", [])
         dir_movie_block = [m for m in data.get("crew", []) if m.get("job") == "Director"]
 
-        movie_block = cast_movie_block + dir_movie_block
-        movie_tmdb_ids = [m.get('id') for m in movie_block if m.get('id') and not is_seen_movie(m.get('id'))]
-        if movie_tmdb_ids:
-            existing_movie_map = get_movies_by_tmdb_ids(movie_tmdb_ids)
-            missing_movie_ids = [mid for mid in movie_tmdb_ids if mid not in existing_movie_map]
-            for tmdb_id in missing_movie_ids:
-                m = next((x for x in movie_block if x.get('id') == tmdb_id), None)
-                if m:
-                    try:
-                        store_movie(tmdb_id, m)
-                    except Exception as e:
-                        print(f"Warning: Failed to store movie {tmdb_id}: {e}")
-                mark_seen_movie(tmdb_id)
-        
-        cast_movie_tmdb_ids = [m.get('id') for m in cast_movie_block if m.get('id')]
-        if cast_movie_tmdb_ids:
-            cast_movie_ids = get_movie_ids_from_tmdb_ids(cast_movie_tmdb_ids)
-            insert_movie_cast_batch(actor_id, cast_movie_ids, cast_movie_block)
+        fingerprint = filmography_fingerprint(cast_movie_block, dir_movie_block)
+        if fingerprint == get_filmography_fingerprint(actor_id):
+            return
+
+        movie_block = {}
+        for m in cast_movie_block + dir_movie_block:
+            if m.get('id'):
+                movie_block.setdefault(m['id'], m)
+        # 一次查詢取回既有電影的 id，缺少的以一個交易批次寫入
+        movie_ids = _ingest_movies(list(movie_block.items()))
 
-        dir_movie_tmdb_ids = [m.get('id') for m in dir_movie_block if m.get('id')]
-        if dir_movie_tmdb_ids:
-            dir_movie_ids = get_movie_ids_from_tmdb_ids(dir_movie_tmdb_ids)
-            insert_directors_batch(actor_id, dir_movie_ids)
+        cast_rows = {}
+        for m in cast_movie_block:
+            mid = movie_ids.get(m.get('id'))
+            if mid:
+                cast_rows.setdefault(mid, (m.get("character"), m.get("order")))
+        director_movie_ids = {movie_ids[m['id']] for m in dir_movie_block if m.get('id') in movie_ids}
+        complete = all(tid in movie_ids for tid in movie_block)
+        sync_actor_filmography(actor_id, fingerprint, cast_rows, director_movie_ids, complete)
 
     except Exception as e:
         print(f"Warning: Failed to fetch movies for person {tmdb_actor_id}: {e}")
@@ -221,51 +520,125 @@ def logout():
 
 @app.route('/movies', methods=['GET'])
 def get_movies():
-    """獲取電影清單"""
+    """獲取電影清單
+    帶 cursor 參數（第一頁可為空字串）時使用 keyset 分頁，回傳 {'results', 'next_cursor'}；
+    否則沿用 page 分頁，回傳清單
+    sort=user_rating 依社群評分排序（只列出有評論的電影），預設 recent 依加入時間
+    """
     query = request.args.get('q', '')
-    page = int(request.args.get('page', 1))
     limit = int(request.args.get('limit', 20))
-    
-    movies = search_movies(query, page, limit)
+    sort = request.args.get('sort', 'recent')
+    if sort not in MOVIE_SORTS:
+        return jsonify({'error': f"sort must be one of {', '.join(MOVIE_SORTS)}"}), 400
+
+    if 'cursor' in request.args:
+        try:
+            movies, next_cursor = search_movies_after(query, request.args.get('cursor') or None, limit, sort)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'results': movies, 'next_cursor': next_cursor})
+
+    page = int(request.args.get('page', 1))
+    movies = search_movies(query, page, limit, sort)
     return jsonify(movies)
 
 @app.route('/movies/<int:movie_id>', methods=['GET'])
 def get_movie_detail_route(movie_id):
-    """獲取電影詳細資訊"""
-    tmdb_id = get_tmdb_id_from_movie_id(movie_id)
-    if tmdb_id is not None:
-        fetch_and_store_movie(movie_id, tmdb_id)
-    else:
+    """獲取電影詳細資訊
+    詳細資料新鮮（抓取後 TMDB 未回報變更且未超過 DETAIL_MAX_AGE_HOURS）時不連 TMDB；
+    從未抓取過詳細資料時等待 TMDB，stale-while-revalidate 模式下 TMDB 失敗時改回傳資料庫現有的資料；
+    已有詳細資料但過期時，stale-while-revalidate 模式下先回傳現有資料並在背景重新抓取；
+    If-None-Match 與快取的 ETag 相符時直接回 304，不查資料庫
+    """
+    resource_key = f"movie_detail:{movie_id}"
+    response = not_modified(resource_key, CACHE_CONTROL_DETAIL)
+    if response is not None:
+        return response
+
+    stale = False
+    state = get_movie_fetch_state(movie_id)
+    tmdb_id = state['tmdb_id'] if state else None
+    if tmdb_id is None:
         print(f"Warning: Failed to get movie_tmdb_id: {movie_id}")
+    elif not movie_detail_stale(state):
+        pass
+    elif DETAIL_STALE_WHILE_REVALIDATE and state['last_fetched_at'] is not None:
+        schedule_refresh(f"fetch_movie:{tmdb_id}", _fetch_and_store_movie, movie_id, tmdb_id)
+        stale = True
+    else:
+        try:
+            fetch_and_store_movie(movie_id, tmdb_id)
+        except Exception:
+            if not DETAIL_STALE_WHILE_REVALIDATE:
+                raise
+            stale = True
 
+    version = detail_version("movie_detail", movie_id)
     movie = get_movie_detail(movie_id)
     if not movie:
         return jsonify({'error': 'Movie not found'}), 404
-    return jsonify(movie)
+    return detail_validators(detail_response(movie, stale), "movie_detail", movie_id, version, movie, stale)
 
 @app.route('/actors', methods=['GET'])
 def get_actors():
-    """獲取演員清單"""
+    """獲取演員清單
+    帶 cursor 參數（第一頁可為空字串）時使用 keyset 分頁，回傳 {'results', 'next_cursor'}；
+    否則沿用 page 分頁，回傳清單
+    """
     query = request.args.get('q', '')
-    page = int(request.args.get('page', 1))
     limit = int(request.args.get('limit', 20))
-    
+
+    if 'cursor' in request.args:
+        try:
+            actors, next_cursor = search_actors_after(query, request.args.get('cursor') or None, limit)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'results': actors, 'next_cursor': next_cursor})
+
+    page = int(request.args.get('page', 1))
     actors = search_actors(query, page, limit)
     return jsonify(actors)
 
 @app.route('/actors/<int:actor_id>', methods=['GET'])
 def get_actor_detail_route(actor_id):
-    """獲取演員詳細資訊"""
-    tmdb_id = get_tmdb_id_from_actor_id(actor_id)
-    if tmdb_id is not None:
+    """獲取演員詳細資訊
+    詳細資料與作品清單都新鮮時不連 TMDB；
+    stale-while-revalidate 模式下，只有從未抓取過演員詳細資料時才等待 TMDB；
+    詳細資料或作品清單過期時先回傳資料庫現有的資料，並在背景重新抓取；
+    If-None-Match 與快取的 ETag 相符時直接回 304，不查資料庫
+    """
+    resource_key = f"actor_detail:{actor_id}"
+    response = not_modified(resource_key, CACHE_CONTROL_DETAIL)
+    if response is not None:
+        return response
+
+    stale = False
+    state = get_actor_fetch_state(actor_id)
+    tmdb_id = state['tmdb_id'] if state else None
+    need_detail = need_movies = False
+    if state is not None:
+        need_detail, need_movies = actor_detail_stale(state), filmography_stale(state)
+    if tmdb_id is None:
+        print(f"Warning: Failed to get actor_tmdb_id: {actor_id}")
+    elif not (need_detail or need_movies):
+        pass
+    elif not DETAIL_STALE_WHILE_REVALIDATE:
         fetch_and_store_actor(actor_id, tmdb_id)
     else:
-        print(f"Warning: Failed to get actor_tmdb_id: {actor_id}")
-    
+        if need_detail and state['last_fetched_at'] is None:
+            try:
+                fetch_and_store_actor(actor_id, tmdb_id)
+            except Exception:
+                stale = True
+        else:
+            schedule_refresh(f"fetch_actor:{tmdb_id}", _fetch_and_store_actor, actor_id, tmdb_id)
+            stale = True
+
+    version = detail_version("actor_detail", actor_id)
     actor = get_actor_detail(actor_id)
     if not actor:
         return jsonify({'error': 'Actor not found'}), 404
-    return jsonify(actor)
+    return detail_validators(detail_response(actor, stale), "actor_detail", actor_id, version, actor, stale)
 
 @app.route('/reviews/add', methods=['POST'])
 def add_review_route():
@@ -296,6 +669,8 @@ def add_review_route():
     try:
         add_review(user_id, target_type, target_id, rating, title, body)
         return jsonify({'success': True, 'message': 'Review added successfully'}), 201
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
@@ -305,29 +680,155 @@ def get_movie_review_route(movie_id):
     reviews = get_movie_reviews(movie_id)
     return jsonify({'reviews': reviews}), 200
 
-def fetch_tmdb_concurrent(urls_params):
-    """並發獲取 TMDB 資料（帶快取）"""
+def _batch_list(data, field):
+    """從批次請求取出清單（JSON 陣列或以逗號分隔的字串），超過 BATCH_MAX_IDS 時拋出 ValueError"""
+    value = data.get(field) or []
+    if isinstance(value, str):
+        value = [v for v in value.split(',') if v.strip()]
+    if not isinstance(value, list):
+        raise ValueError(f"{field} must be a list")
+    if len(value) > BATCH_MAX_IDS:
+        raise ValueError(f"{field} accepts at most {BATCH_MAX_IDS} items")
+    return value
+
+def _batch_review_target(item):
+    """評論對象：電影 id，或 {"type": "ACTOR", "id": 3}"""
+    if not isinstance(item, dict):
+        return ('MOVIE', int(item))
+    target_type = str(item.get('type', 'MOVIE')).upper()
+    if target_type not in ('MOVIE', 'ACTOR'):
+        raise ValueError(f"Unsupported review target type: {target_type}")
+    return (target_type, int(item.get('id')))
+
+@app.route('/api/batch', methods=['GET', 'POST'])
+def batch_route():
+    """一次取回多部電影、多位演員的詳細資料與評論
+    POST JSON {"movies": [1, 2], "actors": [3], "reviews": [1, {"type": "ACTOR", "id": 3}]}，
+    或 GET ?movies=1,2&actors=3&reviews=1
+    只讀資料庫（共用一條連線、IN 查詢）；詳細資料或作品清單過期的項目在背景向 TMDB 更新，
+    並列在 stale 中（同時加上 X-Data-Stale 標頭）
+    """
+    data = request.get_json(silent=True) if request.method == 'POST' else request.args
+    if not data:
+        return jsonify({'error': 'Empty batch'}), 400
+    try:
+        movie_ids = [int(i) for i in _batch_list(data, 'movies')]
+        actor_ids = [int(i) for i in _batch_list(data, 'actors')]
+        review_targets = [_batch_review_target(i) for i in _batch_list(data, 'reviews')]
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    movies, actors, reviews = get_batch(movie_ids, actor_ids, review_targets)
+
+    stale = {'movies': [], 'actors': []}
+    for movie_id, movie in movies.items():
+        if movie['tmdb_id'] is not None and movie_detail_stale(movie):
+            schedule_refresh(f"fetch_movie:{movie['tmdb_id']}", _fetch_and_store_movie, movie_id, movie['tmdb_id'])
+            stale['movies'].append(movie_id)
+    for actor_id, actor in actors.items():
+        if actor['tmdb_id'] is not None and (actor_detail_stale(actor) or filmography_stale(actor)):
+            schedule_refresh(f"fetch_actor:{actor['tmdb_id']}", _fetch_and_store_actor, actor_id, actor['tmdb_id'])
+            stale['actors'].append(actor_id)
+
+    review_groups = {}
+    for (target_type, target_id), rows in reviews.items():
+        review_groups.setdefault(target_type, {})[target_id] = rows
+    return detail_response({
+        'movies': movies,
+        'actors': actors,
+        'reviews': review_groups,
+        'missing': {
+            'movies': [i for i in dict.fromkeys(movie_ids) if i not in movies],
+            'actors': [i for i in dict.fromkeys(actor_ids) if i not in actors],
+        },
+        'stale': stale,
+    }, bool(stale['movies'] or stale['actors']))
+
+def fetch_tmdb_concurrent(urls_params, fresh=False, lane=LANE_INTERACTIVE):
+    """並發獲取 TMDB 資料（帶快取）
+    未命中快取且沒有其他請求正在抓取的項目，在共用事件迴圈上一次送出；
+    fresh 為 True 時不讀快取（預熱用，抓到的結果仍會寫回快取）
+    """
     import json
-    
-    def fetch_single(url, params):
-        cache_key = f"tmdb:{url}:{json.dumps(params, sort_keys=True)}"
-        cached = cache_get(cache_key)
-        if cached is not None:
-            return cached
-        data = fetch_tmdb_data(url, params)
-        cache_set(cache_key, data)
-        return data
-    
-    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-        futures = [executor.submit(fetch_single, url, params) for url, params in urls_params]
-        results = [None] * len(futures)
-        for idx, future in enumerate(futures):
+
+    results = [None] * len(urls_params)
+    claims = {}
+    try:
+        for idx, (url, params) in enumerate(urls_params):
+            cache_key = f"tmdb:{url}:{json.dumps(params, sort_keys=True)}"
+            cached = None if fresh else cache_get(cache_key)
+            if cached is not None:
+                results[idx] = cached
+                continue
+            future, leader = _inflight.claim(cache_key)
+            claims[idx] = (cache_key, future, leader)
+            if leader and not fresh:
+                # 取得 leader 前可能已有其他呼叫者寫入快取
+                cached = cache_get(cache_key)
+                if cached is not None:
+                    _inflight.resolve(cache_key, future, result=cached)
+
+        to_fetch = [idx for idx, (_, future, leader) in claims.items() if leader and not future.done()]
+        if to_fetch:
             try:
-                results[idx] = future.result()
+                fetched = fetch_tmdb_many([urls_params[idx] for idx in to_fetch], lane)
             except Exception as e:
-                results[idx] = {'error': str(e)}
+                fetched = [e] * len(to_fetch)
+            for idx, data in zip(to_fetch, fetched):
+                cache_key, future, _ = claims[idx]
+                try:
+                    if isinstance(data, Exception):
+                        raise data
+                    cache_set(cache_key, data)
+                except Exception as e:
+                    _inflight.resolve(cache_key, future, exception=e)
+                else:
+                    _inflight.resolve(cache_key, future, result=data)
+    finally:
+        # 自己取得的 key 一定要完成，否則等待同一 key 的其他請求會一直卡住
+        for cache_key, future, leader in claims.values():
+            if leader and not future.done():
+                _inflight.resolve(cache_key, future, exception=RuntimeError(f"TMDB fetch aborted: {cache_key}"))
+
+    for idx, (_, future, _) in claims.items():
+        try:
+            # 其他請求負責抓取時最多等待 TMDB_FOLLOWER_WAIT_SECONDS 秒
+            results[idx] = future.result(timeout=TMDB_FOLLOWER_WAIT_SECONDS)
+        except Exception as e:
+            results[idx] = {'error': str(e) or type(e).__name__}
     return results
 
+def build_search_payload(query, fresh=False, lane=LANE_INTERACTIVE):
+    """向 TMDB 搜尋並把新資料交給背景寫入，回傳 (payload, complete)；complete 為 False 表示 TMDB 抓取失敗，不應快取
+    尚未寫入資料庫的項目 id 為 None（見 movie_entries / actor_entries）
+    """
+    urls_params = [
+        ('/search/movie', {'query': query}),
+        ('/search/person', {'query': query})
+    ]
+    results = fetch_tmdb_concurrent(urls_params, fresh, lane)
+    movie_block, person_block = results[0], results[1]
+
+    movies = {m['id']: m for m in movie_block.get('results', []) if m.get('id')}
+    people = {p['id']: p for p in person_block.get('results', []) if p.get('id')}
+
+    # 尚未見過的資料交給背景佇列寫入，不等待寫入完成；回應由 TMDB 結果加上一次 id 查詢組成
+    _ingest.submit_movies([(tid, m) for tid, m in movies.items() if tid not in known_movies])
+    _ingest.submit_actors([(tid, p) for tid, p in people.items() if tid not in known_actors])
+
+    movie_map = get_movies_by_tmdb_ids(list(movies))
+    actor_map = get_actors_by_tmdb_ids(list(people))
+    forget_missing(known_movies, movies, movie_map)
+    forget_missing(known_actors, people, actor_map)
+
+    payload = {
+        'movie': movie_entries(list(movies), movies, movie_map),
+        'person': actor_entries(list(people), people, actor_map),
+    }
+    # TMDB 抓取失敗（回傳 {'error': ...}）時不快取，避免空結果留到下次過期
+    complete = 'error' not in movie_block and 'error' not in person_block
+    return payload, complete
+
 @app.route('/api/search/all', methods=['GET'])
 def search_all():
     """搜尋電影與演員（回傳 DB id）"""
@@ -336,136 +837,164 @@ def search_all():
         return jsonify({'error': 'Missing query'}), 400
 
     cache_key = f"search_all:{query}"
-    cached = cache_get(cache_key)
-    if cached:
-        return jsonify(cached)
-    
-    urls_params = [
-        ('/search/movie', {'query': query}),
-        ('/search/person', {'query': query})
-    ]
-    results = fetch_tmdb_concurrent(urls_params)
-    movie_block, person_block = results[0], results[1]
+    response = not_modified(cache_key, CACHE_CONTROL_SEARCH) or payload_response(cache_key, CACHE_CONTROL_SEARCH)
+    if response is not None:
+        return response
 
     try:
-        movie_tmdb_ids = [m.get('id') for m in movie_block.get('results', []) if m.get('id') and not is_seen_movie(m.get('id'))]
-        actor_tmdb_ids = [p.get('id') for p in person_block.get('results', []) if p.get('id') and not is_seen_person(p.get('id'))]
-
-        if movie_tmdb_ids:
-            existing_movie_map = get_movies_by_tmdb_ids(movie_tmdb_ids)
-            missing_movie_ids = [mid for mid in movie_tmdb_ids if mid not in existing_movie_map]
-            for tmdb_id in missing_movie_ids:
-                m = next((x for x in movie_block.get('results', []) if x.get('id') == tmdb_id), None)
-                if m:
-                    try:
-                        store_movie(tmdb_id, m)
-                    except Exception as e:
-                        print(f"Warning: Failed to store movie {tmdb_id}: {e}")
-                mark_seen_movie(tmdb_id)
-
-        if actor_tmdb_ids:
-            existing_actor_map = get_actors_by_tmdb_ids(actor_tmdb_ids)
-            missing_actor_ids = [aid for aid in actor_tmdb_ids if aid not in existing_actor_map]
-            for tmdb_id in missing_actor_ids:
-                p = next((x for x in person_block.get('results', []) if x.get('id') == tmdb_id), None)
-                if p:
-                    try:
-                        store_actor(tmdb_id, p)
-                    except Exception as e:
-                        print(f"Warning: Failed to store actor {tmdb_id}: {e}")
-                mark_seen_person(tmdb_id)
-
-        movie_map = get_movies_by_tmdb_ids([m.get('id') for m in movie_block.get('results', []) if m.get('id')])
-        actor_map = get_actors_by_tmdb_ids([p.get('id') for p in person_block.get('results', []) if p.get('id')])
-        
-        normalized_movies = [normalize_movie_row(movie_map[mid]) for mid in movie_map if movie_map[mid]]
-        normalized_people = [normalize_actor_row(actor_map[aid]) for aid in actor_map if actor_map[aid]]
-        
-        payload = {'movie': normalized_movies, 'person': normalized_people}
-        cache_set(cache_key, payload)
-        return jsonify(payload)
+        payload, complete = build_search_payload(query)
+        if complete:
+            return payload_response(cache_key, CACHE_CONTROL_SEARCH, cache_payload(cache_key, payload))
+        return add_validators(jsonify(payload), cache_key, CACHE_CONTROL_SEARCH, remember=False)
         
     except Exception as e:
         print(f"Error in search_all: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/trending/all', methods=['GET'])
-def trending_all():
-    """獲取所有 trending 資料"""
-    cache_key = "trending_all"
-    cached = cache_get(cache_key)
-    if cached:
-        return jsonify(cached)
-
+def build_trending_payload(fresh=False, lane=LANE_INTERACTIVE):
+    """向 TMDB 取得 trending 各區塊並把新電影交給背景寫入，回傳 (payload, complete)，意義同 build_search_payload"""
     urls_params = [
         ('/trending/movie/day', {}),
         ('/trending/movie/week', {}),
         ('/movie/now_playing', {'region': 'TW'}),
         ('/movie/upcoming', {'region': 'TW'})
     ]
-    results = fetch_tmdb_concurrent(urls_params)
+    results = fetch_tmdb_concurrent(urls_params, fresh, lane)
 
-    try:
-        all_blocks_tmdb_ids = []
-        for block in results:
-            movie_results = block.get('results', []) if isinstance(block, dict) else []
-            movie_tmdb_ids = [m.get('id') for m in movie_results if m.get('id')]
-            all_blocks_tmdb_ids.append(movie_tmdb_ids)
-
-        all_unique_tmdb_ids = list(set([tid for block_ids in all_blocks_tmdb_ids for tid in block_ids]))
-        all_movies_map = get_movies_by_tmdb_ids(all_unique_tmdb_ids) if all_unique_tmdb_ids else {}
-        
-        missing = [mid for mid in all_unique_tmdb_ids if mid not in all_movies_map]
-        if missing:
-            for block_idx, block in enumerate(results):
-                movie_results = block.get('results', []) if isinstance(block, dict) else []
-                for tmdb_id in missing:
-                    if tmdb_id in all_blocks_tmdb_ids[block_idx]:
-                        mark_seen_movie(tmdb_id)
-                        m = next((x for x in movie_results if x.get('id') == tmdb_id), None)
-                        if m:
-                            try:
-                                store_movie(tmdb_id, m)
-                            except Exception as e:
-                                print(f"Warning: Failed to store movie {tmdb_id}: {e}")
-
-        normalized_blocks = []
-        for movie_tmdb_ids in all_blocks_tmdb_ids:
-            normalized_movies = [normalize_movie_row(all_movies_map[tid]) for tid in movie_tmdb_ids if tid in all_movies_map]
-            normalized_blocks.append(normalized_movies)
-        
-        payload = {
-            'day': normalized_blocks[0] if len(normalized_blocks) > 0 else [],
-            'week': normalized_blocks[1] if len(normalized_blocks) > 1 else [],
-            'now_playing': normalized_blocks[2] if len(normalized_blocks) > 2 else [],
-            'upcoming': normalized_blocks[3] if len(normalized_blocks) > 3 else []
-        }
+    all_blocks_tmdb_ids = []
+    unique_movies = {}
+    for block in results:
+        movie_results = block.get('results', []) if isinstance(block, dict) else []
+        movie_tmdb_ids = [m.get('id') for m in movie_results if m.get('id')]
+        all_blocks_tmdb_ids.append(movie_tmdb_ids)
+        for m in movie_results:
+            if m.get('id'):
+                unique_movies.setdefault(m['id'], m)
+
+    # 尚未見過的電影交給背景佇列寫入，不等待寫入完成；回應由 TMDB 結果加上一次 id 查詢組成
+    _ingest.submit_movies([(tid, m) for tid, m in unique_movies.items() if tid not in known_movies])
+    all_movies_map = get_movies_by_tmdb_ids(list(unique_movies)) if unique_movies else {}
+    forget_missing(known_movies, unique_movies, all_movies_map)
+
+    normalized_blocks = [movie_entries(ids, unique_movies, all_movies_map) for ids in all_blocks_tmdb_ids]
+    
+    payload = {
+        'day': normalized_blocks[0] if len(normalized_blocks) > 0 else [],
+        'week': normalized_blocks[1] if len(normalized_blocks) > 1 else [],
+        'now_playing': normalized_blocks[2] if len(normalized_blocks) > 2 else [],
+        'upcoming': normalized_blocks[3] if len(normalized_blocks) > 3 else []
+    }
+    # 任何區塊抓取失敗時同樣不快取
+    complete = all('error' not in block for block in results if isinstance(block, dict))
+    return payload, complete
+
+@app.route('/api/trending/all', methods=['GET'])
+def trending_all():
+    """獲取所有 trending 資料（If-None-Match 相符時回 304）
+    預熱開啟時 payload 在過期前由背景重建，請求通常直接命中快取
+    """
+    cache_key = "trending_all"
+    response = not_modified(cache_key, CACHE_CONTROL_TRENDING) or payload_response(cache_key, CACHE_CONTROL_TRENDING)
+    if response is not None:
+        return response
 
-        cache_set(cache_key, payload)
-        reset_seen_sets()
-        return jsonify(payload)
+    try:
+        payload, complete = build_trending_payload()
+        if complete:
+            return payload_response(cache_key, CACHE_CONTROL_TRENDING, cache_payload(cache_key, payload))
+        return add_validators(jsonify(payload), cache_key, CACHE_CONTROL_TRENDING, remember=False)
         
     except Exception as e:
-        print(f"Error in search_all: {e}")
+        print(f"Error in trending_all: {e}")
         return jsonify({'error': str(e)}), 500
 
+# ==================== 熱門 key 預熱 ====================
+
+# 除了 trending 之外要預熱的搜尋關鍵字（以逗號分隔）
+PREWARM_SEARCH_QUERIES = [q.strip() for q in os.getenv('PREWARM_SEARCH_QUERIES', '').split(',') if q.strip()]
+
+def _persisted_only(built):
+    """預熱時含尚未寫入資料庫的項目視為未完成：保留舊 payload，稍後重試"""
+    payload, complete = built
+    return payload, complete and not payload_pending(payload)
+
+_prewarm_builders = {"trending_all": lambda: _persisted_only(build_trending_payload(fresh=True, lane=LANE_BACKGROUND))}
+for _query in PREWARM_SEARCH_QUERIES:
+    _prewarm_builders[f"search_all:{_query}"] = \
+        lambda q=_query: _persisted_only(build_search_payload(q, fresh=True, lane=LANE_BACKGROUND))
+_prewarmer = Prewarmer(_cache, _prewarm_builders, cache_payload)
+if PREWARM_ENABLED:
+    _prewarmer.start()
+
+# ==================== TMDB 變更同步 ====================
+
+_change_poller = ChangeFeedPoller(
+    _cache,
+    lambda path, params: fetch_tmdb_data(path, params=params, lane=LANE_BACKGROUND),
+    {
+        "movie": lambda movie_id, tmdb_id: fetch_and_store_movie(movie_id, tmdb_id, LANE_BACKGROUND),
+        "person": lambda actor_id, tmdb_id: fetch_and_store_actor(actor_id, tmdb_id, LANE_BACKGROUND),
+    },
+)
+if TMDB_CHANGES_ENABLED:
+    _change_poller.start()
+
+@app.route('/api/stats', methods=['GET'])
+def stats_route():
+    """快取、連線池、背景寫入佇列、TMDB 限流、詳細頁背景更新、已知 tmdb_id、預熱與 TMDB 變更同步的統計"""
+    return jsonify({
+        'cache': _cache.stats(),
+        'db_pool': pool_stats(),
+        'ingest': _ingest.stats(),
+        'tmdb_rate_limit': tmdb_limiter.stats(),
+        'detail_refresh': dict(_refresh_stats),
+        'known_ids': {'movie': known_movies.stats(), 'actor': known_actors.stats()},
+        'prewarm': _prewarmer.stats(),
+        'tmdb_changes': _change_poller.stats(),
+    })
+
+@registry.register_collector
+def _cache_metrics():
+    """快取、背景寫入佇列與 TMDB 限流的計數（抓取時從各自的 stats() 取得）"""
+    cache_stats = _cache.stats()
+    ingest_stats = _ingest.stats()
+    limiter_stats = tmdb_limiter.stats()
+    return [
+        ("cache_hits_total", "counter", "Response cache hits by namespace.",
+         [({'namespace': ns}, n) for ns, n in cache_stats['hits'].items()]),
+        ("cache_misses_total", "counter", "Response cache misses by namespace.",
+         [({'namespace': ns}, n) for ns, n in cache_stats['misses'].items()]),
+        ("cache_evictions_total", "counter", "Response cache entries evicted for space.", [({}, cache_stats['evictions'])]),
+        ("cache_bytes", "gauge", "Estimated bytes held by the response cache.", [({}, cache_stats['bytes'])]),
+        ("cache_entries", "gauge", "Entries held by the response cache.", [({}, cache_stats['entries'])]),
+        ("ingest_queue_depth", "gauge", "Pending write-behind ingest submissions.", [({}, ingest_stats['depth'])]),
+        ("ingest_dropped_total", "counter", "Ingest submissions dropped because the queue was full.", [({}, ingest_stats['dropped'])]),
+        ("tmdb_throttled_total", "counter", "TMDB 429 responses seen by the rate limiter.", [({}, limiter_stats['throttled'])]),
+    ]
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    """Prometheus 文字格式指標（每個 worker 程序各自的數字）"""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics disabled'}), 404
+    return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/cmd', methods=['POST'])
 def cli_cmd():
-    """執行 SQL 指令（僅限開發環境）"""
+    """執行 SQL 指令（僅限開發環境）
+    使用獨立的小連線池與未緩衝 cursor，邊讀邊以 chunked JSON 回傳，最多 CMD_MAX_ROWS 列；
+    ?format=ndjson（或 Accept: application/x-ndjson）時每列一行，最後一行為 {success, rows, truncated}
+    """
     data = request.json
     command = data.get('command', '').strip()
     
     if not command:
         return jsonify({'error': 'Empty command'}), 400
-    
+
     try:
-        results = execute_sql_query(command)
-        return jsonify({
-            'success': True,
-            'command': command,
-            'rows': len(results),
-            'data': results
-        }), 200
+        stream = SqlQueryStream(command)
+    except PoolTimeout as e:
+        return jsonify({'success': False, 'command': command, 'error': str(e)}), 503
     except Exception as e:
         return jsonify({
             'success': False,
@@ -473,5 +1002,43 @@ def cli_cmd():
             'error': str(e)
         }), 400
 
+    dumps = app.json.dumps
+    ndjson = request.args.get('format') == 'ndjson' or \
+        request.accept_mimetypes.best == 'application/x-ndjson'
+
+    def summary(error=None):
+        result = {'success': error is None, 'rows': stream.rows, 'truncated': stream.truncated}
+        if error is not None:
+            result['error'] = error
+        return result
+
+    def generate_ndjson():
+        error = None
+        try:
+            for row in stream:
+                yield dumps(row) + "\n"
+        except Exception as e:
+            error = str(e)
+        yield dumps(summary(error)) + "\n"
+
+    def generate_json():
+        # 結果列數與是否成功要讀完才知道，放在 data 之後
+        yield '{"command": ' + dumps(command) + ', "data": ['
+        error = None
+        try:
+            for i, row in enumerate(stream):
+                yield ("," if i else "") + dumps(row)
+        except Exception as e:
+            error = str(e)
+        yield "], " + dumps(summary(error))[1:]
+
+    if ndjson:
+        response = Response(generate_ndjson(), mimetype='application/x-ndjson')
+    else:
+        response = Response(generate_json(), mimetype='application/json')
+    # 沒有開始迭代（例如用戶端提早斷線）時也要歸還連線
+    response.call_on_close(stream.close)
+    return response
+
 if __name__ == '__main__':
     pass
\ No newline at end of file
@@ -0,0 +1,99 @@
+# prewarm.py - 熱門快取 key 的背景預熱（在過期前重建）
+import os
+import time
+import random
+import threading
+
+PREWARM_ENABLED = os.getenv("PREWARM_ENABLED", "1") == "1"
+PREWARM_LEAD_SECONDS = float(os.getenv("PREWARM_LEAD_SECONDS", 120))  # 在過期前多久開始重建
+PREWARM_JITTER_SECONDS = float(os.getenv("PREWARM_JITTER_SECONDS", 60))  # 隨機提早的上限，錯開各 worker
+PREWARM_RETRY_SECONDS = float(os.getenv("PREWARM_RETRY_SECONDS", 30))  # 重建失敗或資料未寫完時多久後重試
+
+class Prewarmer:
+    """在快取過期前於背景重建熱門 key，讓請求不必走冷路徑
+    - builders: {key: fn() -> (payload, complete)}，complete 為 False 時不寫入，稍後重試
+    - store(key, payload) 以新值一次取代舊值（讀取端只會看到舊的或新的 payload）
+    - 每個 key 在「上次重建時間 + TTL - lead - 隨機 jitter」時重建；
+      重建時間記在共用快取的 prewarm:{key}，其他 worker 剛重建過就順延
+    """
+
+    def __init__(self, cache, builders, store, lead=PREWARM_LEAD_SECONDS,
+                 jitter=PREWARM_JITTER_SECONDS, retry=PREWARM_RETRY_SECONDS):
+        self._cache = cache
+        self._builders = dict(builders)
+        self._store = store
+        self._lead = lead
+        self._jitter = jitter
+        self._retry = retry
+        self._due = {}
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"refreshed": 0, "skipped": 0, "incomplete": 0, "failed": 0, "last_seconds": 0.0}
+
+    def start(self):
+        """啟動背景執行緒；第一次重建延後 0–jitter 秒，避免所有 worker 同時啟動時一起抓取"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            now = time.time()
+            for key in self._builders:
+                self._due[key] = now + random.uniform(0, self._jitter)
+            self._thread = threading.Thread(target=self._run, name="prewarmer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            now = time.time()
+            for key, due in list(self._due.items()):
+                if now >= due:
+                    self._due[key] = self._refresh_or_retry(key)
+            time.sleep(max(0.5, min(self._due.values()) - time.time()))
+
+    def _threshold(self, key, built_at):
+        """built_at 重建的資料，在此時間之後才需要再次重建（最早的可能時間）"""
+        return built_at + self._cache.ttl_for(key) - self._lead - self._jitter
+
+    def _refresh_or_retry(self, key):
+        """重建 key；任何錯誤（建立 payload、寫入或讀取快取）都只影響這個 key，retry 秒後再試"""
+        try:
+            return self._refresh(key)
+        except Exception as e:
+            print(f"Warning: Prewarm {key} failed: {e}")
+            self._count("failed")
+            return time.time() + self._retry
+
+    def _refresh(self, key):
+        """重建 key，回傳下次執行的時間"""
+        built_at = self._cache.get(f"prewarm:{key}")
+        now = time.time()
+        if built_at is not None and now < self._threshold(key, built_at):
+            # 其他 worker 已經重建過
+            self._count("skipped")
+            return self._threshold(key, built_at) + random.uniform(0, self._jitter)
+
+        start = time.perf_counter()
+        payload, complete = self._builders[key]()
+        if not complete:
+            self._count("incomplete")
+            return now + self._retry
+
+        self._store(key, payload)
+        built_at = time.time()
+        self._cache.set(f"prewarm:{key}", built_at, ttl=self._cache.ttl_for(key))
+        with self._stats_lock:
+            self._stats["refreshed"] += 1
+            self._stats["last_seconds"] = time.perf_counter() - start
+        return self._threshold(key, built_at) + random.uniform(0, self._jitter)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """各項計數與每個 key 距離下次重建的秒數"""
+        with self._stats_lock:
+            result = dict(self._stats)
+        now = time.time()
+        result["next_in"] = {key: max(0.0, due - now) for key, due in self._due.items()}
+        return result
@@ -0,0 +1,134 @@
+# rate_limit.py - TMDB 用戶端限流（token bucket、優先權通道、Retry-After）
+import os
+import time
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+LANE_INTERACTIVE = "interactive"  # 使用者正在等待的請求（搜尋、詳細頁）
+LANE_BACKGROUND = "background"    # 背景工作（演員作品清單、預熱）
+LANES = (LANE_INTERACTIVE, LANE_BACKGROUND)
+
+TMDB_RATE_LIMIT = float(os.getenv("TMDB_RATE_LIMIT", 40))  # 每秒請求數（每個程序）
+TMDB_RATE_BURST = float(os.getenv("TMDB_RATE_BURST", 20))
+TMDB_BACKGROUND_RESERVE = float(os.getenv("TMDB_BACKGROUND_RESERVE", 0.5))  # 背景通道不可動用的容量比例
+
+def retry_after_seconds(value, default):
+    """解析 Retry-After 標頭（秒數或 HTTP 日期），無法解析時回傳 default"""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+class TokenBucketLimiter:
+    """token bucket 限流
+    - 背景通道只能使用高於保留量的 token，且有互動請求在等待時一律讓路
+    - 收到 429 時 pause() 讓所有執行緒一起暫停到 Retry-After 之後，而不是各自重試
+    """
+
+    def __init__(self, rate=TMDB_RATE_LIMIT, burst=TMDB_RATE_BURST, background_reserve=TMDB_BACKGROUND_RESERVE):
+        self._lock = threading.Lock()
+        self._rate = rate
+        self._burst = burst
+        self._reserve = burst * background_reserve
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._interactive_waiting = 0
+        self._throttled = 0
+        self._stats = {lane: {"acquired": 0, "waited": 0, "wait_seconds": 0.0, "max_wait": 0.0} for lane in LANES}
+
+    def try_acquire(self, lane=LANE_INTERACTIVE):
+        """嘗試取得一個 token；成功回傳 0，否則回傳建議等待的秒數"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            floor = 0.0
+            if lane == LANE_BACKGROUND:
+                if self._interactive_waiting:
+                    return 1.0 / self._rate
+                floor = self._reserve
+            if self._tokens - floor >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 + floor - self._tokens) / self._rate
+
+    def acquire(self, lane=LANE_INTERACTIVE):
+        """阻塞直到取得 token，回傳等待秒數"""
+        start = None
+        waiting = False
+        try:
+            while True:
+                wait = self.try_acquire(lane)
+                if wait <= 0:
+                    break
+                if start is None:
+                    start = time.monotonic()
+                if lane == LANE_INTERACTIVE and not waiting:
+                    waiting = self._add_waiter(1)
+                time.sleep(wait)
+        finally:
+            if waiting:
+                self._add_waiter(-1)
+        return self._record(lane, 0.0 if start is None else time.monotonic() - start)
+
+    async def acquire_async(self, lane=LANE_INTERACTIVE):
+        """acquire 的 asyncio 版本"""
+        start = None
+        waiting = False
+        try:
+            while True:
+                wait = self.try_acquire(lane)
+                if wait <= 0:
+                    break
+                if start is None:
+                    start = time.monotonic()
+                if lane == LANE_INTERACTIVE and not waiting:
+                    waiting = self._add_waiter(1)
+                await asyncio.sleep(wait)
+        finally:
+            if waiting:
+                self._add_waiter(-1)
+        return self._record(lane, 0.0 if start is None else time.monotonic() - start)
+
+    def pause(self, seconds):
+        """收到 429：清空 token 並讓所有通道暫停 seconds 秒"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._throttled += 1
+
+    def _add_waiter(self, delta):
+        with self._lock:
+            self._interactive_waiting += delta
+        return True
+
+    def _record(self, lane, waited):
+        with self._lock:
+            s = self._stats[lane]
+            s["acquired"] += 1
+            if waited > 0:
+                s["waited"] += 1
+                s["wait_seconds"] += waited
+                s["max_wait"] = max(s["max_wait"], waited)
+        return waited
+
+    def stats(self):
+        """各通道的取得次數與等待時間、429 次數"""
+        with self._lock:
+            result = {lane: dict(s) for lane, s in self._stats.items()}
+            result["throttled"] = self._throttled
+            result["paused_for"] = max(0.0, self._blocked_until - time.monotonic())
+            result["tokens"] = self._tokens
+        return result
+
+tmdb_limiter = TokenBucketLimiter()
@@ -0,0 +1,52 @@
+# singleflight.py - 合併相同 key 的並行呼叫
+import threading
+from concurrent.futures import Future
+
+class SingleFlight:
+    """同一時間相同 key 只執行一次
+    第一個呼叫者（leader）實際執行函數，其他並行呼叫者等待同一個 Future 並共用結果或例外
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def claim(self, key):
+        """取得 key 對應的 Future，回傳 (future, leader)
+        leader 為 True 時呼叫者必須以 resolve() 完成該 Future
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def resolve(self, key, future, result=None, exception=None):
+        """leader 完成 Future 並釋放 key"""
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, *args, **kwargs):
+        future, leader = self.claim(key)
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.resolve(key, future, exception=e)
+            raise
+        self.resolve(key, future, result=result)
+        return result
+
+    def in_flight(self):
+        """目前執行中的 key 數量"""
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,16 @@
+# conftest.py - 測試不需要 MySQL 與 TMDB：連線一律失敗，背景執行緒不啟動
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TMDB_API_KEY", "test")
+os.environ["CACHE_BACKEND"] = "memory"
+os.environ["PREWARM_ENABLED"] = "0"
+os.environ["TMDB_CHANGES_ENABLED"] = "0"
+
+import mysql.connector
+
+def _no_database(*args, **kwargs):
+    raise mysql.connector.Error("no database in tests")
+
+mysql.connector.connect = _no_database
@@ -0,0 +1,38 @@
+# test_conditional_get.py - 快取內容更新後，舊 ETag 不可再回 304
+import movie_backend
+
+def _client():
+    movie_backend._cache.clear()
+    return movie_backend.app.test_client()
+
+def test_unchanged_payload_is_not_modified():
+    client = _client()
+    movie_backend.cache_payload("trending_all", {"trending_day": [{"movie_id": 1}]})
+    etag = client.get("/api/trending/all").headers["ETag"].strip('"')
+    assert client.get("/api/trending/all", headers={"If-None-Match": f'"{etag}"'}).status_code == 304
+
+def test_changed_payload_is_served_again():
+    client = _client()
+    movie_backend.cache_payload("trending_all", {"trending_day": [{"movie_id": 1}]})
+    old_etag = client.get("/api/trending/all").headers["ETag"].strip('"')
+    movie_backend.cache_payload("trending_all", {"trending_day": [{"movie_id": 2}]})
+    response = client.get("/api/trending/all", headers={"If-None-Match": f'"{old_etag}"'})
+    assert response.status_code == 200
+    assert response.get_json() == {"trending_day": [{"movie_id": 2}]}
+    assert response.headers["ETag"].strip('"') != old_etag
+
+def test_expired_payload_ignores_validator():
+    client = _client()
+    movie_backend.cache_payload("trending_all", {"trending_day": [{"movie_id": 1}]})
+    etag = client.get("/api/trending/all").headers["ETag"].strip('"')
+    movie_backend._cache.delete("trending_all")
+    headers = {"If-None-Match": f'"{etag}"'}
+    with movie_backend.app.test_request_context("/api/trending/all", headers=headers):
+        assert movie_backend.not_modified("trending_all", movie_backend.CACHE_CONTROL_TRENDING) is None
+
+def test_rebuilt_payload_validator_uses_new_etag():
+    client = _client()
+    movie_backend.cache_payload("trending_all", {"trending_day": [{"movie_id": 1}]})
+    entry = movie_backend.cache_payload("trending_all", {"trending_day": [{"movie_id": 2}]})
+    response = client.get("/api/trending/all", headers={"If-None-Match": f'"{entry["etag"]}"'})
+    assert response.status_code == 304
@@ -0,0 +1,89 @@
+# test_detail_cache.py - 詳細資料讀取期間被其他 worker 失效時，不把舊資料寫回共用快取
+import pytest
+
+import database
+from cache import SQLiteCache
+
+def _movie_row(title):
+    return {
+        'movie_id': 1, 'title': title, 'updated_at': None,
+        'actors_json': None, 'directors_json': None, 'reviews_json': None,
+        'agg_count': None, 'agg_avg': None, 'agg_updated_at': None, 'agg_distribution': None,
+    }
+
+class _Read:
+    """假的 SharedRead：查詢時先執行 during_query（模擬同時間的寫入），再回傳 rows"""
+
+    def __init__(self, rows, during_query):
+        self.rows = rows
+        self.during_query = during_query
+
+    def __call__(self, *keys):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self, dictionary=False):
+        return self
+
+    def execute(self, sql, params=()):
+        self.during_query()
+
+    def fetchall(self):
+        return [dict(row) for row in self.rows]
+
+@pytest.fixture
+def workers(tmp_path, monkeypatch):
+    """兩個 worker 各自開啟同一個 SQLite 快取檔（如同 gunicorn 的多個程序）"""
+    path = str(tmp_path / "cache" / "shared.sqlite3")
+    worker_a, worker_b = SQLiteCache(path), SQLiteCache(path)
+    monkeypatch.setattr(database, "response_cache", worker_a)
+    monkeypatch.setattr(database, "note_write", lambda *keys: None)
+    return worker_a, worker_b
+
+def _invalidate_on(monkeypatch, cache):
+    """在另一個 worker 上執行失效"""
+    def invalidate():
+        with monkeypatch.context() as m:
+            m.setattr(database, "response_cache", cache)
+            database.invalidate_movie_detail(1)
+    return invalidate
+
+def test_stale_read_is_not_cached_after_another_worker_invalidates(workers, monkeypatch):
+    worker_a, worker_b = workers
+    monkeypatch.setattr(database, "SharedRead", _Read([_movie_row("Old")], _invalidate_on(monkeypatch, worker_b)))
+
+    movie = database.get_movie_detail(1)
+
+    assert movie['title'] == "Old"
+    assert worker_a.get("movie_detail:1") is None
+    assert worker_b.get("movie_detail:1") is None
+
+def test_invalidation_between_check_and_write_back_is_detected(workers, monkeypatch):
+    worker_a, worker_b = workers
+    monkeypatch.setattr(database, "SharedRead", _Read([_movie_row("Old")], lambda: None))
+    invalidate = _invalidate_on(monkeypatch, worker_b)
+    original_set = worker_a.set
+
+    def invalidate_then_set(key, value, ttl=None):
+        # 版本比對已通過，寫回之前另一個 worker 完成失效
+        if key == "movie_detail:1":
+            invalidate()
+        return original_set(key, value, ttl=ttl)
+
+    monkeypatch.setattr(worker_a, "set", invalidate_then_set)
+    database.get_movie_detail(1)
+
+    assert worker_b.get("movie_detail:1") is None
+
+def test_unchanged_version_is_cached(workers, monkeypatch):
+    worker_a, worker_b = workers
+    monkeypatch.setattr(database, "SharedRead", _Read([_movie_row("Current")], lambda: None))
+
+    database.get_movie_detail(1)
+
+    assert worker_b.get("movie_detail:1")['title'] == "Current"
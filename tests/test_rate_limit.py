@@ -0,0 +1,80 @@
+# test_rate_limit.py - tmdb_limiter 對本機 TMDB 模擬伺服器的 429 / Retry-After 與通道優先權
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+import tmdb_api
+from rate_limit import TokenBucketLimiter, LANE_INTERACTIVE, LANE_BACKGROUND
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from fake_tmdb import FakeTMDBServer  # noqa: E402
+
+class _RecordingServer(FakeTMDBServer):
+    """記錄實際處理（未被 429 擋下）的請求路徑與順序"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.served = []
+
+    def payload(self, path, query):
+        with self._lock:
+            self.served.append(path)
+        return super().payload(path, query)
+
+@pytest.fixture
+def tmdb(monkeypatch):
+    def start(limiter, **server_options):
+        server = _RecordingServer(("127.0.0.1", 0), **server_options).start()
+        monkeypatch.setattr(tmdb_api, "TMDB_BASE_URL", server.base_url)
+        monkeypatch.setattr(tmdb_api, "tmdb_limiter", limiter)
+        servers.append(server)
+        return server
+
+    servers = []
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_429_pauses_the_bucket_for_retry_after(tmdb):
+    limiter = TokenBucketLimiter(rate=100, burst=20)
+    server = tmdb(limiter, rate_limit=2, retry_after=1)
+
+    for _ in range(2):
+        tmdb_api.fetch_tmdb_data("/movie/popular")
+    start = time.monotonic()
+    tmdb_api.fetch_tmdb_data("/movie/popular")  # 第三個請求收到 429，暫停 Retry-After 秒後重試成功
+    elapsed = time.monotonic() - start
+
+    stats = limiter.stats()
+    assert server.counts == {"requests": 4, "throttled": 1}
+    assert stats["throttled"] == 1
+    assert elapsed >= 0.9
+    assert stats[LANE_INTERACTIVE]["max_wait"] >= 0.9
+
+def test_interactive_calls_go_ahead_of_queued_background_calls(tmdb):
+    limiter = TokenBucketLimiter(rate=5, burst=1, background_reserve=0)
+    server = tmdb(limiter)
+
+    def call(path, lane):
+        tmdb_api.fetch_tmdb_data(path, lane=lane)
+
+    threads = [threading.Thread(target=call, args=(f"/person/{15_500_000 + n}", LANE_BACKGROUND)) for n in range(4)]
+    for t in threads:
+        t.start()
+    time.sleep(0.05)  # 第一個背景請求用掉唯一的 token，其餘在排隊
+    interactive = threading.Thread(target=call, args=("/movie/15000000", LANE_INTERACTIVE))
+    interactive.start()
+    for t in threads + [interactive]:
+        t.join()
+
+    assert server.served.index("/movie/15000000") == 1
+    stats = limiter.stats()
+    assert stats[LANE_INTERACTIVE]["acquired"] == 1
+    assert stats[LANE_INTERACTIVE]["waited"] == 1 and stats[LANE_INTERACTIVE]["wait_seconds"] > 0
+    assert stats[LANE_BACKGROUND]["acquired"] == 4
+    assert stats[LANE_BACKGROUND]["waited"] == 3
+    assert stats[LANE_BACKGROUND]["max_wait"] > stats[LANE_INTERACTIVE]["max_wait"]
@@ -0,0 +1,100 @@
+# test_read_routing.py - 寫入走主庫；寫入後 READ_YOUR_WRITES_SECONDS 內，任何 worker 的相關讀取都走主庫
+import pytest
+
+import database
+from cache import ResponseCache, SQLiteCache
+
+class _Conn:
+    """記錄執行過的語句；add_review 的 SELECT ... FOR UPDATE 查無舊評論"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.rowcount = 1
+
+    def cursor(self, *args, **kwargs):
+        return self
+
+    def execute(self, sql, params=()):
+        self.pool.statements.append(" ".join(sql.split()))
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+    def start_transaction(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class _Pool:
+    def __init__(self, address):
+        self.address = address
+        self.down_until = 0.0
+        self.statements = []
+
+    def get_connection(self, timeout=None):
+        return _Conn(self)
+
+@pytest.fixture
+def routing(tmp_path, monkeypatch):
+    """主庫、一個副本，以及兩個開啟同一個 SQLite 快取檔的 worker"""
+    primary, replica = _Pool("primary"), _Pool("replica")
+    path = str(tmp_path / "cache" / "shared.sqlite3")
+    worker_a, worker_b = SQLiteCache(path), SQLiteCache(path)
+    monkeypatch.setattr(database, "db_pool", primary)
+    monkeypatch.setattr(database, "replica_pools", [replica])
+    monkeypatch.setattr(database, "response_cache", worker_a)
+    return primary, replica, worker_a, worker_b
+
+def test_reads_use_the_replica_without_recent_writes(routing):
+    primary, replica, _, _ = routing
+    with database.connect_read("movie:42") as conn:
+        assert conn.pool is replica
+
+def test_write_on_one_worker_sends_reads_on_another_to_primary(routing, monkeypatch):
+    primary, replica, _, worker_b = routing
+
+    database.add_review(1, "MOVIE", 42, 8, "title", "body")
+
+    assert any(s.startswith("INSERT INTO REVIEW (") for s in primary.statements)
+    assert replica.statements == []
+
+    # 另一個 worker 讀取剛寫入的電影評論：走主庫；其他電影仍走副本
+    monkeypatch.setattr(database, "response_cache", worker_b)
+    database.get_movie_reviews(42)
+    assert any("FROM REVIEW r" in s for s in primary.statements)
+    database.get_movie_reviews(43)
+    assert any("FROM REVIEW r" in s for s in replica.statements)
+
+def test_window_expires(routing, monkeypatch):
+    primary, replica, _, _ = routing
+    monkeypatch.setattr(database, "READ_YOUR_WRITES_SECONDS", -1)
+    database.note_write("movie:42")
+    with database.connect_read("movie:42") as conn:
+        assert conn.pool is replica
+
+def test_replicas_are_disabled_without_a_shared_cache(monkeypatch):
+    for name in ("db_pool", "replica_pools", "cmd_pool"):
+        monkeypatch.setattr(database, name, getattr(database, name))
+    monkeypatch.setattr(database, "MYSQL_REPLICA_HOSTS", ["replica-host:3307"])
+    monkeypatch.setattr(database, "response_cache", ResponseCache())
+    database.init_db_pool()
+    assert database.replica_pools == []
+    monkeypatch.setattr(database, "response_cache", SQLiteCache.__new__(SQLiteCache))
+    database.init_db_pool()
+    assert [pool.address for pool in database.replica_pools] == ["replica-host:3307"]
@@ -0,0 +1,105 @@
+# test_review_aggregate.py - add_review 的增量彙總與從 REVIEW 重算的結果一致
+import re
+from decimal import Decimal, ROUND_HALF_UP
+
+import pytest
+
+import database
+
+class _FakeReviewDB:
+    """只實作 add_review 用到的語句；REVIEW.rating 與 MySQL 的 DECIMAL(3,1) 一樣四捨五入後儲存"""
+
+    def __init__(self):
+        self.reviews = {}  # (user_id, target_type, target_id) -> rating
+        self.aggregates = {}  # (target_type, target_id) -> {'review_count', 'rating_sum', 'b1'..'b10'}
+        self._row = None
+        self.rowcount = 0
+
+    # 連線
+    def cursor(self):
+        return self
+
+    def start_transaction(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    # cursor
+    def fetchone(self):
+        return self._row
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        if sql.startswith("SELECT rating FROM REVIEW"):
+            rating = self.reviews.get(tuple(params))
+            self._row = None if rating is None else (rating,)
+        elif sql.startswith("INSERT INTO REVIEW ("):
+            user_id, target_type, target_id, rating = params[:4]
+            stored = Decimal(str(rating)).quantize(Decimal("0.1"), ROUND_HALF_UP)
+            self.reviews[(user_id, target_type, target_id)] = stored
+        elif sql.startswith("INSERT INTO REVIEW_AGGREGATE"):
+            target_type, target_id, rating = params
+            column = re.search(r"rating_sum, (b\d+)\)", sql).group(1)
+            agg = self.aggregates.setdefault((target_type, target_id), self._empty())
+            agg["review_count"] += 1
+            agg["rating_sum"] += rating
+            agg[column] += 1
+        elif sql.startswith("UPDATE REVIEW_AGGREGATE"):
+            delta, target_type, target_id = params
+            agg = self.aggregates.get((target_type, target_id))
+            self.rowcount = 0 if agg is None else 1
+            if agg is not None:
+                agg["rating_sum"] += delta
+                move = re.search(r"(b\d+) = IF\(\1 > 0, \1 - 1, 0\), (b\d+) = \2 \+ 1", sql)
+                if move:
+                    agg[move.group(1)] = max(0, agg[move.group(1)] - 1)
+                    agg[move.group(2)] += 1
+        else:
+            raise AssertionError(f"unexpected statement: {sql}")
+
+    @staticmethod
+    def _empty():
+        agg = {"review_count": 0, "rating_sum": Decimal(0)}
+        agg.update({f"b{i}": 0 for i in range(1, database.REVIEW_BUCKETS + 1)})
+        return agg
+
+    def rebuilt(self, target_type, target_id):
+        """_rebuild_review_aggregate / 遷移回填的結果：COUNT、SUM 與 CEIL 分桶都以 REVIEW 中儲存的值計算"""
+        agg = self._empty()
+        for (_, t, i), rating in self.reviews.items():
+            if (t, i) == (target_type, target_id):
+                agg["review_count"] += 1
+                agg["rating_sum"] += rating
+                agg[f"b{min(database.REVIEW_BUCKETS, max(1, int(rating.to_integral_value('ROUND_CEILING'))))}"] += 1
+        return agg
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = _FakeReviewDB()
+    monkeypatch.setattr(database, "connect_db", lambda timeout=None: db)
+    monkeypatch.setattr(database, "_invalidate_review_target", lambda target_type, target_id: None)
+    return db
+
+def test_incremental_aggregate_matches_rebuild(fake_db):
+    # 1.04 存成 1.0（b1）、2.05 存成 2.1（b3）、9.96 存成 10.0；同一使用者改分時舊值以儲存的值扣除
+    for user_id, rating in [(1, 1.04), (2, 2.05), (3, 9.96), (1, 1.05), (2, "2.04"), (4, 0), (3, 9.95)]:
+        database.add_review(user_id, "MOVIE", 42, rating, "t", "b")
+    assert fake_db.aggregates[("MOVIE", 42)] == fake_db.rebuilt("MOVIE", 42)
+
+def test_same_stored_rating_is_not_a_change(fake_db):
+    database.add_review(1, "MOVIE", 42, 7.0, "t", "b")
+    database.add_review(1, "MOVIE", 42, 7.04, "t", "b")
+    assert fake_db.aggregates[("MOVIE", 42)] == fake_db.rebuilt("MOVIE", 42)
+
+@pytest.mark.parametrize("rating", [-0.1, 10.1, "abc", "NaN", "Infinity"])
+def test_out_of_range_rating_is_rejected_before_the_transaction(fake_db, rating):
+    with pytest.raises(ValueError):
+        database.add_review(1, "MOVIE", 42, rating, "t", "b")
+    assert fake_db.reviews == {} and fake_db.aggregates == {}
@@ -0,0 +1,52 @@
+# test_search_payload.py - 搜尋/排行榜不等待背景寫入，尚未寫入的項目 id 為 None
+import movie_backend
+
+class _StalledIngest:
+    """背景寫入一直沒完成"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit_movies(self, items):
+        self.submitted.extend(items)
+
+    def submit_actors(self, items):
+        self.submitted.extend(items)
+
+def _stub(monkeypatch, blocks, movie_rows, actor_rows=None):
+    ingest = _StalledIngest()
+    monkeypatch.setattr(movie_backend, "_ingest", ingest)
+    monkeypatch.setattr(movie_backend, "fetch_tmdb_concurrent", lambda urls_params, fresh=False, lane=None: blocks)
+    monkeypatch.setattr(movie_backend, "get_movies_by_tmdb_ids", lambda ids: {t: movie_rows[t] for t in ids if t in movie_rows})
+    monkeypatch.setattr(movie_backend, "get_actors_by_tmdb_ids", lambda ids: {t: (actor_rows or {})[t] for t in ids if t in (actor_rows or {})})
+    movie_backend._cache.clear()
+    return ingest
+
+def test_search_returns_unpersisted_rows_without_waiting(monkeypatch):
+    stored = {"movie_id": 7, "tmdb_id": 100, "title": "Stored", "release_year": 2001,
+              "genre": None, "rating": 7.5, "poster_url": None}
+    ingest = _stub(monkeypatch, [
+        {"results": [{"id": 100, "title": "Stored"}, {"id": 200, "title": "New", "release_date": "2024-05-01"}]},
+        {"results": [{"id": 300, "name": "Person"}]},
+    ], {100: stored})
+
+    payload, complete = movie_backend.build_search_payload("x")
+
+    assert complete
+    assert [(m["movie_id"], m["tmdb_id"]) for m in payload["movie"]] == [(7, 100), (None, 200)]
+    assert payload["movie"][1]["release_year"] == 2024
+    assert [(p["actor_id"], p["tmdb_id"], p["name"]) for p in payload["person"]] == [(None, 300, "Person")]
+    assert {tid for tid, _ in ingest.submitted} >= {200, 300}
+    assert movie_backend.payload_pending(payload)
+
+def test_pending_payload_is_cached_briefly(monkeypatch):
+    _stub(monkeypatch, [{"results": [{"id": 200, "title": "New"}]}] * 4, {})
+    client = movie_backend.app.test_client()
+
+    response = client.get("/api/trending/all")
+
+    assert response.status_code == 200
+    assert response.get_json()["day"] == [{"movie_id": None, "tmdb_id": 200, "title": "New", "release_year": None,
+                                           "genre": None, "rating": None, "poster_url": None}]
+    assert response.headers["Cache-Control"] == movie_backend.CACHE_CONTROL_PENDING
+    assert movie_backend._cache.contains("trending_all")
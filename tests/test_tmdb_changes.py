@@ -0,0 +1,187 @@
+# test_tmdb_changes.py - 變更清單只標記並重新抓取 TMDB 回報的 id，每輪不超過預算；新鮮的詳細頁不連 TMDB
+import os
+import sys
+import time
+import itertools
+from datetime import datetime, timezone
+
+import pytest
+
+import movie_backend
+import tmdb_api
+import tmdb_changes
+from cache import ResponseCache
+from rate_limit import TokenBucketLimiter
+from tmdb_changes import ChangeFeedPoller
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from fake_tmdb import FakeTMDBServer, CANNED_ID_BASE, CANNED_PERSON_OFFSET  # noqa: E402
+
+class _RecordingServer(FakeTMDBServer):
+    """記錄實際處理的請求路徑"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.served = []
+
+    def payload(self, path, query):
+        with self._lock:
+            self.served.append(path)
+        return super().payload(path, query)
+
+    def details(self, kind):
+        return [p for p in self.served if p.startswith(f"/{kind}/") and not p.endswith("/changes")]
+
+class _FakeTables:
+    """MOVIE / ACTOR 中與變更同步相關的欄位：{kind: {entity_id: {tmdb_id, last_fetched_at, tmdb_changed_at}}}
+    tmdb_changed_at 以遞增序號代表標記時間
+    """
+
+    def __init__(self):
+        self.rows = {"movie": {}, "person": {}}
+        self.feeds = {"movie": set(), "person": set()}  # 傳給 mark_tmdb_changed 的 tmdb_id
+        self._clock = itertools.count(1)
+
+    def add(self, kind, tmdb_id, fetched=True):
+        entity_id = len(self.rows[kind]) + 1
+        self.rows[kind][entity_id] = {
+            "tmdb_id": tmdb_id,
+            "last_fetched_at": datetime.now() if fetched else None,
+            "tmdb_changed_at": None,
+        }
+        return entity_id
+
+    def by_tmdb_id(self, kind, tmdb_id):
+        return next(i for i, row in self.rows[kind].items() if row["tmdb_id"] == tmdb_id)
+
+    def changed(self, kind):
+        return {row["tmdb_id"] for row in self.rows[kind].values() if row["tmdb_changed_at"] is not None}
+
+    def store(self, kind, tmdb_id):
+        entity_id = self.by_tmdb_id(kind, tmdb_id)
+        self.rows[kind][entity_id].update(last_fetched_at=datetime.now(), tmdb_changed_at=None)
+        return entity_id
+
+    # 與 database 中同名函式相同的語意
+    def mark_tmdb_changed(self, kind, tmdb_ids):
+        tmdb_ids = set(tmdb_ids)
+        self.feeds[kind] |= tmdb_ids
+        marked = 0
+        for row in self.rows[kind].values():
+            if row["tmdb_id"] in tmdb_ids and row["last_fetched_at"] is not None and row["tmdb_changed_at"] is None:
+                row["tmdb_changed_at"] = next(self._clock)
+                marked += 1
+        return marked
+
+    def get_tmdb_changed(self, kind, limit):
+        pending = [(row["tmdb_changed_at"], i, row["tmdb_id"])
+                   for i, row in self.rows[kind].items() if row["tmdb_changed_at"] is not None]
+        return [(i, tmdb_id) for _, i, tmdb_id in sorted(pending)[:limit]]
+
+    def defer_tmdb_changed(self, kind, entity_id):
+        row = self.rows[kind][entity_id]
+        if row["tmdb_changed_at"] is not None:
+            row["tmdb_changed_at"] = next(self._clock)
+
+    def count_tmdb_changed(self, kind):
+        return len(self.changed(kind))
+
+@pytest.fixture
+def server(monkeypatch):
+    server = _RecordingServer(("127.0.0.1", 0), movies=200, people=200, changes=20).start()
+    monkeypatch.setattr(tmdb_api, "TMDB_BASE_URL", server.base_url)
+    monkeypatch.setattr(tmdb_api, "tmdb_limiter", TokenBucketLimiter(rate=1000, burst=100))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def tables(monkeypatch):
+    tables = _FakeTables()
+    for name in ("mark_tmdb_changed", "get_tmdb_changed", "defer_tmdb_changed", "count_tmdb_changed"):
+        monkeypatch.setattr(tmdb_changes, name, getattr(tables, name))
+    # 電影走 movie_backend 的抓取流程，只把寫入資料庫換成 tables
+    monkeypatch.setattr(movie_backend, "check_movie_detail", lambda movie_id: False)
+    monkeypatch.setattr(movie_backend, "store_movie",
+                        lambda tmdb_id, data, fetched=False: tables.store("movie", tmdb_id))
+    return tables
+
+def _poller(tables, budget):
+    return ChangeFeedPoller(
+        ResponseCache(),
+        lambda path, params: tmdb_api.fetch_tmdb_data(path, params=params),
+        {
+            "movie": lambda movie_id, tmdb_id: movie_backend.fetch_and_store_movie(movie_id, tmdb_id),
+            "person": lambda actor_id, tmdb_id: tables.store(
+                "person", tmdb_api.fetch_tmdb_data(f"/person/{tmdb_id}")["id"]),
+        },
+        budget=budget,
+    )
+
+def _feed(server, kind):
+    today = datetime.now(timezone.utc).date().isoformat()
+    return [item["id"] for item in server.changed(kind, today, 1)["results"]]
+
+def test_only_ids_in_the_change_feed_are_marked_and_refetched(server, tables):
+    movie_feed, person_feed = _feed(server, "movie"), _feed(server, "person")
+    changed_movies = movie_feed[:3]
+    unchanged_movies = [i for i in range(CANNED_ID_BASE, CANNED_ID_BASE + 200) if i not in movie_feed][:3]
+    for tmdb_id in changed_movies + unchanged_movies:
+        tables.add("movie", tmdb_id)
+    tables.add("movie", movie_feed[3], fetched=False)  # 從未抓取過：第一次開啟詳細頁時才抓，不需標記
+    tables.add("person", person_feed[0])
+    person_base = CANNED_ID_BASE + CANNED_PERSON_OFFSET
+    tables.add("person", next(i for i in range(person_base, person_base + 200) if i not in person_feed))
+
+    poller = _poller(tables, budget=10)
+    assert poller.run_once(force=True)
+
+    assert tables.feeds == {"movie": set(movie_feed), "person": set(person_feed)}
+    assert sorted(server.details("movie")) == sorted(f"/movie/{i}" for i in changed_movies)
+    assert server.details("person") == [f"/person/{person_feed[0]}"]
+    assert tables.changed("movie") == set() and tables.changed("person") == set()
+    stats = poller.stats()
+    assert stats["marked"] == 4 and stats["refreshed"] == 4 and stats["pending"] == {"movie": 0, "person": 0}
+
+def test_refresh_respects_budget_and_defers_the_rest(server, tables):
+    movie_feed = _feed(server, "movie")
+    for tmdb_id in movie_feed[:5]:
+        tables.add("movie", tmdb_id)
+
+    poller = _poller(tables, budget=2)
+    poller.run_once(force=True)
+    assert server.details("movie") == [f"/movie/{i}" for i in movie_feed[:2]]
+    assert tables.changed("movie") == set(movie_feed[2:5])
+    assert poller.stats()["pending"]["movie"] == 3
+
+    # 下一輪：同一天已看過的 id 不再標記，只處理上一輪留下的
+    poller.run_once(force=True)
+    assert server.details("movie") == [f"/movie/{i}" for i in movie_feed[:4]]
+    assert tables.changed("movie") == {movie_feed[4]}
+    poller.run_once(force=True)
+    assert tables.changed("movie") == set()
+    assert len(server.details("movie")) == 5
+
+def test_fresh_detail_route_makes_no_tmdb_call(server, tables, monkeypatch):
+    movie_feed = _feed(server, "movie")
+    fresh = tables.add("movie", next(i for i in range(CANNED_ID_BASE, CANNED_ID_BASE + 200) if i not in movie_feed))
+    changed = tables.add("movie", movie_feed[0])
+    _poller(tables, budget=0).run_once(force=True)  # 只標記，不重新抓取
+    assert tables.changed("movie") == {movie_feed[0]}
+
+    monkeypatch.setattr(movie_backend, "get_movie_fetch_state", lambda movie_id: dict(tables.rows["movie"][movie_id]))
+    monkeypatch.setattr(movie_backend, "get_movie_detail", lambda movie_id: {"movie_id": movie_id})
+    movie_backend._cache.clear()
+    client = movie_backend.app.test_client()
+    before = server.counts["requests"]
+
+    response = client.get(f"/movies/{fresh}")
+    assert response.status_code == 200 and "X-Data-Stale" not in response.headers
+    assert server.counts["requests"] == before
+
+    # 對照：TMDB 回報過變更的電影會重新抓取
+    client.get(f"/movies/{changed}")
+    deadline = time.monotonic() + 5
+    while tables.changed("movie") and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert server.details("movie") == [f"/movie/{movie_feed[0]}"]
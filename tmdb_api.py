@@ -1,32 +1,52 @@
 # tmdb_api.py - TMDB API 操作
 import os
+import time
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from rate_limit import tmdb_limiter, retry_after_seconds, LANE_INTERACTIVE
+from metrics import tmdb_request_duration, endpoint_family
 
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
 if not TMDB_API_KEY:
     raise EnvironmentError(
         "TMDB_API_KEY environment variable is not set. Please set it to your TMDB API key."
     )
-TMDB_BASE_URL = "https://api.themoviedb.org/3"
+TMDB_BASE_URL = os.getenv("TMDB_BASE_URL", "https://api.themoviedb.org/3")
+TMDB_MAX_RETRIES = 3
+TMDB_BACKOFF_FACTOR = 0.5
 
 _session = requests.Session()
+# 429 由 tmdb_limiter 統一處理（所有執行緒一起暫停），這裡只重試 5xx
 _retries = Retry(
-    total=3,
-    backoff_factor=0.5,
-    status_forcelist=(429, 500, 502, 503, 504),
+    total=TMDB_MAX_RETRIES,
+    backoff_factor=TMDB_BACKOFF_FACTOR,
+    status_forcelist=(500, 502, 503, 504),
     allowed_methods=("GET",),
+    respect_retry_after_header=False,
 )
 _adapter = HTTPAdapter(max_retries=_retries, pool_connections=10, pool_maxsize=20)
 _session.mount("https://", _adapter)
 _session.mount("http://", _adapter)
 
-def fetch_tmdb_data(url, params=None):
+def fetch_tmdb_data(url, params=None, lane=LANE_INTERACTIVE):
     request_params = {"api_key": TMDB_API_KEY, "language": "zh-TW"}
     if params:
         request_params.update(params)
-    response = _session.get(f"{TMDB_BASE_URL}{url}", params=request_params, timeout=(3, 10))
+    for attempt in range(TMDB_MAX_RETRIES + 1):
+        tmdb_limiter.acquire(lane)
+        start = time.perf_counter()
+        try:
+            response = _session.get(f"{TMDB_BASE_URL}{url}", params=request_params, timeout=(3, 10))
+        except requests.exceptions.RequestException:
+            tmdb_request_duration.observe(time.perf_counter() - start, endpoint_family(url), "error", "sync")
+            raise
+        tmdb_request_duration.observe(time.perf_counter() - start, endpoint_family(url), str(response.status_code), "sync")
+        if response.status_code != 429 or attempt == TMDB_MAX_RETRIES:
+            break
+        tmdb_limiter.pause(retry_after_seconds(
+            response.headers.get("Retry-After"), TMDB_BACKOFF_FACTOR * (2 ** attempt)
+        ))
     try:
         response.raise_for_status()
     except requests.exceptions.HTTPError as e:
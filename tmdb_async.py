@@ -0,0 +1,116 @@
+# tmdb_async.py - 非同步 TMDB 客戶端（少量長連線上多工，程序共用事件迴圈）
+import os
+import time
+import asyncio
+import threading
+import httpx
+from tmdb_api import TMDB_API_KEY, TMDB_BASE_URL, TMDB_MAX_RETRIES, TMDB_BACKOFF_FACTOR
+from rate_limit import tmdb_limiter, retry_after_seconds, LANE_INTERACTIVE
+from metrics import tmdb_request_duration, endpoint_family
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支援需要 h2
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+TMDB_HTTP2 = os.getenv("TMDB_HTTP2", "1") == "1" and _HTTP2_AVAILABLE
+TMDB_MAX_CONNECTIONS = int(os.getenv("TMDB_MAX_CONNECTIONS", 4))
+_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+class AsyncTMDBClient:
+    """以 httpx.AsyncClient 存取 TMDB
+    HTTP/2 時多個請求共用同一條連線；否則使用有限的 keep-alive 連線池
+    """
+
+    def __init__(self, base_url=TMDB_BASE_URL, http2=TMDB_HTTP2, max_connections=TMDB_MAX_CONNECTIONS):
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            http2=http2,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(10.0, connect=3.0),
+        )
+
+    async def fetch(self, url, params=None, lane=LANE_INTERACTIVE):
+        """GET TMDB 端點，經過 tmdb_limiter 限流
+        429 依 Retry-After 暫停所有通道，5xx 以指數退避重試（與 tmdb_api 的設定一致）
+        """
+        request_params = {"api_key": TMDB_API_KEY, "language": "zh-TW"}
+        if params:
+            request_params.update(params)
+        for attempt in range(TMDB_MAX_RETRIES + 1):
+            await tmdb_limiter.acquire_async(lane)
+            start = time.perf_counter()
+            try:
+                response = await self._client.get(url, params=request_params)
+            except httpx.HTTPError:
+                tmdb_request_duration.observe(time.perf_counter() - start, endpoint_family(url), "error", "async")
+                raise
+            tmdb_request_duration.observe(time.perf_counter() - start, endpoint_family(url), str(response.status_code), "async")
+            if response.status_code not in _RETRY_STATUS or attempt == TMDB_MAX_RETRIES:
+                break
+            backoff = TMDB_BACKOFF_FACTOR * (2 ** attempt)
+            if response.status_code == 429:
+                tmdb_limiter.pause(retry_after_seconds(response.headers.get("Retry-After"), backoff))
+            else:
+                await asyncio.sleep(backoff)
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            raise httpx.HTTPStatusError(
+                f"HTTP error for TMDB endpoint '{url}' with params {params or {}}: {e}",
+                request=e.request,
+                response=e.response,
+            ) from e
+        return response.json()
+
+    async def fetch_many(self, urls_params, lane=LANE_INTERACTIVE):
+        """同時送出多個請求，回傳結果清單；失敗的項目為例外物件
+        項目可為 (url, params) 或 (url, params, lane)，未指定時使用 lane
+        """
+        return await asyncio.gather(
+            *(self.fetch(item[0], item[1], item[2] if len(item) > 2 else lane) for item in urls_params),
+            return_exceptions=True,
+        )
+
+    async def aclose(self):
+        await self._client.aclose()
+
+# ==================== 同步橋接 ====================
+
+_loop = None
+_client = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+def _get_loop():
+    """取得程序共用的事件迴圈（背景執行緒），fork 後的子程序會重新建立"""
+    global _loop, _client, _loop_pid
+    if _loop is not None and _loop_pid == os.getpid():
+        return _loop
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="tmdb-async-loop", daemon=True)
+            thread.start()
+
+            async def _create_client():
+                return AsyncTMDBClient()
+
+            _client = asyncio.run_coroutine_threadsafe(_create_client(), loop).result()
+            _loop = loop
+            _loop_pid = os.getpid()
+    return _loop
+
+def run_sync(coro_fn, *args, timeout=None):
+    """在共用事件迴圈上執行 coro_fn(client, *args) 並等待結果"""
+    loop = _get_loop()
+    return asyncio.run_coroutine_threadsafe(coro_fn(_client, *args), loop).result(timeout)
+
+def fetch_tmdb_many(urls_params, lane=LANE_INTERACTIVE):
+    """同步介面：同時抓取多個 TMDB 端點，耗時約等於最慢的一個
+    回傳與 urls_params 對應的清單，失敗的項目為例外物件
+    """
+    if not urls_params:
+        return []
+    return run_sync(AsyncTMDBClient.fetch_many, list(urls_params), lane)
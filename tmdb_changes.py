@@ -0,0 +1,142 @@
+# tmdb_changes.py - 依 TMDB 變更清單（/movie/changes、/person/changes）更新資料庫中的電影與人物
+import os
+import time
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+from database import mark_tmdb_changed, defer_tmdb_changed, get_tmdb_changed, count_tmdb_changed
+
+TMDB_CHANGES_ENABLED = os.getenv("TMDB_CHANGES_ENABLED", "1") == "1"
+TMDB_CHANGES_INTERVAL = float(os.getenv("TMDB_CHANGES_INTERVAL", 600))  # 每輪間隔秒數
+TMDB_CHANGES_BUDGET = int(os.getenv("TMDB_CHANGES_BUDGET", 50))  # 每輪每種（電影、人物）最多重新抓取幾筆
+TMDB_CHANGES_MAX_DAYS = 14  # TMDB changes 一次查詢的區間上限
+
+FEEDS = ("movie", "person")
+
+class ChangeFeedPoller:
+    """定期讀取 TMDB 變更清單，只重新抓取資料庫中已有、且 TMDB 回報有變更的電影與人物
+    - fetch(path, params) -> TMDB JSON（背景 lane）
+    - refreshers: {"movie": fn(movie_id, tmdb_id), "person": fn(actor_id, tmdb_id)}
+    - 變更清單以 UTC 日期為單位：每輪讀取上次讀到的日期到今天，當天已處理過的 id 記在共用快取，
+      同一天重複出現不會再次標記（同一天內的第二次變更要等 DETAIL_MAX_AGE_HOURS 才會更新）
+    - 標記寫在資料庫（tmdb_changed_at），超過每輪預算的留待下一輪，重啟後也不會遺失
+    - 上次讀取的日期與本輪的租約記在共用快取，其他 worker 剛執行過就跳過
+    """
+
+    def __init__(self, cache, fetch, refreshers, interval=TMDB_CHANGES_INTERVAL, budget=TMDB_CHANGES_BUDGET):
+        self._cache = cache
+        self._fetch = fetch
+        self._refreshers = dict(refreshers)
+        self._interval = interval
+        self._budget = budget
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "cycles": 0, "skipped": 0, "changed": 0, "marked": 0, "refreshed": 0, "failed": 0,
+            "last_seconds": 0.0, "last_error": None,
+        }
+
+    def start(self):
+        """啟動背景執行緒；第一輪延後 0–interval 秒，避免所有 worker 同時啟動時一起讀取"""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="tmdb-changes", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        time.sleep(random.uniform(0, self._interval))
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Warning: TMDB changes cycle failed: {e}")
+                with self._stats_lock:
+                    self._stats["last_error"] = str(e)
+            time.sleep(self._interval)
+
+    def run_once(self, force=False):
+        """執行一輪：讀取變更清單並標記，再依預算重新抓取；force 為 True 時不檢查租約"""
+        now = time.time()
+        lease = self._cache.get("tmdb_changes:lease")
+        if not force and lease is not None and now - lease < self._interval / 2:
+            # 其他 worker 剛執行過
+            self._count("skipped")
+            return False
+        self._cache.set("tmdb_changes:lease", now, ttl=self._interval)
+
+        start = time.perf_counter()
+        for feed in FEEDS:
+            self._poll(feed)
+        for feed in FEEDS:
+            self._refresh(feed)
+        with self._stats_lock:
+            self._stats["cycles"] += 1
+            self._stats["last_seconds"] = time.perf_counter() - start
+            self._stats["last_error"] = None
+        return True
+
+    def _poll(self, feed):
+        """讀取上次讀到的日期到今天（UTC）的變更，標記資料庫中新出現的 id"""
+        today = datetime.now(timezone.utc).date()
+        cursor_key = f"tmdb_changes:{feed}:cursor"
+        cursor = self._cache.get(cursor_key)
+        day = datetime.strptime(cursor, "%Y-%m-%d").date() if cursor else today
+        day = max(day, today - timedelta(days=TMDB_CHANGES_MAX_DAYS - 1))
+
+        while day <= today:
+            seen_key = f"tmdb_changes:{feed}:{day.isoformat()}"
+            seen = set(self._cache.get(seen_key) or ())
+            new_ids = [i for i in self._changed_ids(feed, day) if i not in seen]
+            if new_ids:
+                marked = mark_tmdb_changed(feed, new_ids)
+                seen.update(new_ids)
+                self._cache.set(seen_key, sorted(seen), ttl=2 * 86400)
+                with self._stats_lock:
+                    self._stats["changed"] += len(new_ids)
+                    self._stats["marked"] += marked
+            # 今天之前的日期已讀完，之後從今天開始
+            self._cache.set(cursor_key, day.isoformat(), ttl=TMDB_CHANGES_MAX_DAYS * 86400)
+            day += timedelta(days=1)
+
+    def _changed_ids(self, feed, day):
+        """某一天（UTC）有變更的 tmdb_id，逐頁讀完"""
+        params = {"start_date": day.isoformat(), "end_date": day.isoformat(), "page": 1}
+        ids = []
+        while True:
+            data = self._fetch(f"/{feed}/changes", dict(params))
+            ids.extend(item["id"] for item in data.get("results", []) if isinstance(item.get("id"), int))
+            if params["page"] >= data.get("total_pages", 1):
+                return ids
+            params["page"] += 1
+
+    def _refresh(self, feed):
+        """依標記時間重新抓取最多 budget 筆，其餘留待下一輪"""
+        refresher = self._refreshers.get(feed)
+        if refresher is None:
+            return
+        for entity_id, tmdb_id in get_tmdb_changed(feed, self._budget):
+            try:
+                refresher(entity_id, tmdb_id)
+                self._count("refreshed")
+            except Exception as e:
+                print(f"Warning: TMDB changes refresh {feed} {tmdb_id} failed: {e}")
+                self._count("failed")
+                # 移到佇列最後，持續失敗的項目（例如已從 TMDB 刪除）不會占住每一輪的預算
+                defer_tmdb_changed(feed, entity_id)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """各項計數與尚待重新抓取的數量"""
+        with self._stats_lock:
+            result = dict(self._stats)
+        result["running"] = self._thread is not None and self._thread.is_alive()
+        try:
+            result["pending"] = {feed: count_tmdb_changed(feed) for feed in FEEDS}
+        except Exception as e:
+            result["pending"] = str(e)
+        return result